@@ -1,11 +1,9 @@
 # app.py
-from io import BytesIO
 import streamlit as st
 import pandas as pd
 import datetime
 import os
 import json
-import sqlite3
 import hashlib
 from dotenv import load_dotenv
 import plotly.express as px
@@ -15,15 +13,55 @@ import plotly.graph_objects as go
 import shutil # Importar shutil para apagar pastas (já importado no topo, não duplicar)
 
 
-from db import criar_tabela, inserir_produto, buscar_todos, resetar_banco, apagar_produtos_por_cnpj # Adicionado apagar_produtos_por_cnpj
-from armazenamento import verificar_arquivo_existente, salvar_arquivo_em_nuvem
-from leitor_xml import parse_nfe
-from leitor_pdf_imagem import (
-    extrair_texto_pdf,
-    extrair_texto_imagem,
-    extrair_produtos_pdf_livre,
-    extrair_dados_cabecalho
+from db import (
+    conectar,
+    criar_tabela,
+    inserir_produtos_lote,
+    buscar_pagina,
+    COLUNAS_ORDENAVEIS,
+    possui_produtos,
+    listar_empresas,
+    listar_produtos,
+    resumo_periodo,
+    total_por_empresa,
+    contagem_por_origem,
+    serie_diaria,
+    serie_mensal,
+    resetar_banco,
+    apagar_produtos_por_cnpj,
+    buscar_documento_por_hash,
+    buscar_documento_por_chave,
+    substituir_pdfs_da_chave,
+    registrar_documento
 )
+from armazenamento import (
+    verificar_arquivo_existente,
+    receber_upload,
+    guardar_upload,
+    caminho_guardado,
+    data_documento,
+    datar_documento,
+    coletar_objetos_orfaos,
+    listar_pastas,
+    pagina_arquivos,
+    assinatura_pasta,
+    compactar_pasta,
+    excluir_arquivo,
+    excluir_arquivos
+)
+from cache import consultar
+from relatorios import formatar_valor
+from exportacao import (
+    chave_exportacao,
+    obter_exportacao,
+    solicitar_exportacao,
+    exportar_excel_historico,
+    exportar_csv_historico,
+    exportar_pdf_historico
+)
+from ingestao import processar_em_paralelo, tipo_documento
+from leitor_xml import extrair_chave_nfe
+from leitor_pdf_imagem import chave_acesso_pdf
 
 # Streamlit setup
 st.set_page_config(page_title="Extrator de Documentos", layout="wide")
@@ -31,28 +69,8 @@ SESSION_FILE = "sessao.json"
 
 # Inicialização do banco de dados de usuários
 
-def limpar_df(df_raw):
-    df = df_raw.copy()
-
-    # Corrigir valores
-    for col in ["Valor Unitário", "Valor Total"]:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-
-
-    # Quantidade segura
-    df["Quantidade"] = pd.to_numeric(df["Quantidade"], errors="coerce").fillna(1)
-
-    # Corrigir datas
-    df["Data"] = pd.to_datetime(df["Data"], errors="coerce")
-
-    # Preencher empresas faltando
-    df["Empresa"] = df["Empresa"].fillna("Desconhecida")
-
-    return df
-
-
 def init_usuarios():
-    conn = sqlite3.connect("banco.db")
+    conn = conectar()
     c = conn.cursor()
     c.execute("""
         CREATE TABLE IF NOT EXISTS usuarios (
@@ -62,28 +80,22 @@ def init_usuarios():
         )
     """)
     conn.commit()
-    conn.close()
 
 def cadastrar_usuario(usuario, senha, cnpj):
     senha_hash = hashlib.sha256(senha.encode()).hexdigest()
-    conn = sqlite3.connect("banco.db")
-    c = conn.cursor()
+    conn = conectar()
     try:
-        c.execute("INSERT INTO usuarios (usuario, senha_hash, cnpj) VALUES (?, ?, ?)", (usuario, senha_hash, cnpj))
-        conn.commit()
+        with conn:
+            conn.execute("INSERT INTO usuarios (usuario, senha_hash, cnpj) VALUES (?, ?, ?)", (usuario, senha_hash, cnpj))
         return True
     except:
         return False
-    finally:
-        conn.close()
 
 def autenticar_usuario(usuario, senha):
     senha_hash = hashlib.sha256(senha.encode()).hexdigest()
-    conn = sqlite3.connect("banco.db")
-    c = conn.cursor()
+    c = conectar().cursor()
     c.execute("SELECT cnpj FROM usuarios WHERE usuario=? AND senha_hash=?", (usuario, senha_hash))
     resultado = c.fetchone()
-    conn.close()
     return resultado[0] if resultado else None
 
 def salvar_sessao(usuario, cnpj):
@@ -100,98 +112,49 @@ def limpar_sessao():
     if os.path.exists(SESSION_FILE):
         os.remove(SESSION_FILE)
 
-# Função gerar Excel
-def gerar_excel(df):
-    buffer = BytesIO()
-    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Histórico')
-    buffer.seek(0)
-    return buffer
+# Download em duas etapas: o conteúdo (bytes ou caminho de arquivo) só é lido no
+# rerun logo depois do pedido, não em todo rerun enquanto o botão está na tela
+def botao_download(chave, rotulo_pedido, rotulo, dados, nome_arquivo, mime):
+    if not st.session_state.pop(f"pedido_{chave}", False):
+        if st.button(rotulo_pedido, key=f"pedir_{chave}"):
+            st.session_state[f"pedido_{chave}"] = True
+            st.rerun()
+        return
+    if isinstance(dados, str):
+        try:
+            with open(dados, "rb") as f:
+                st.download_button(rotulo, data=f, file_name=nome_arquivo, mime=mime, key=f"baixar_{chave}")
+        except FileNotFoundError:
+            st.error(f"❌ {nome_arquivo} não foi encontrado.")
+    else:
+        st.download_button(rotulo, data=dados, file_name=nome_arquivo, mime=mime, key=f"baixar_{chave}")
+
+
+# Botão de exportação sob demanda (gera -> acompanha -> baixa)
+# versao: o que mais invalida o arquivo gerado além dos dados do CNPJ (só entra na chave)
+def painel_exportacao(tipo, rotulo, nome_arquivo, mime, funcao, cnpj, filtros, versao=None, **opcoes):
+    chave = chave_exportacao(tipo, cnpj, filtros, dict(opcoes, versao=versao) if versao is not None else opcoes)
+    trabalho = obter_exportacao(chave)
+
+    if trabalho is None:
+        if st.button(f"⚙️ Gerar {nome_arquivo}", key=f"gerar_{tipo}"):
+            trabalho = solicitar_exportacao(chave, funcao, cnpj, filtros, **opcoes)
+        else:
+            return
+
+    if not trabalho.done():
+        st.info(f"⏳ Gerando {nome_arquivo} em segundo plano...")
+        if st.button("🔄 Verificar", key=f"verificar_{tipo}"):
+            st.rerun()
+    elif trabalho.exception() is not None:
+        st.error(f"❌ Erro ao gerar {nome_arquivo}: {trabalho.exception()}")
+        if st.button("🔁 Tentar novamente", key=f"repetir_{tipo}"):
+            solicitar_exportacao(chave, funcao, cnpj, filtros, **opcoes)
+            st.rerun()
+    else:
+        # Exportações de tabela voltam como caminho do arquivo temporário; o PDF, como bytes
+        botao_download(tipo, rotulo, f"💾 Salvar {nome_arquivo}", trabalho.result(), nome_arquivo, mime)
 
-# Função segura para formatar valores numéricos
-def formatar_valor(val):
-    try:
-        return f"{float(val):.2f}"
-    except:
-        return val
-
-# Função para gerar relatório PDF
-def gerar_pdf_relatorio(df, usuario=None, cnpj=None, mostrar_usuario=False, mostrar_cnpj=False):
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib import colors
-
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elementos = []
-
-    styles = getSampleStyleSheet()
-    estilo_titulo = styles['Heading1']
-    estilo_subtitulo = styles['Heading3']
-    estilo_normal = styles['Normal']
-
-    # Logo
-    logo_path = os.path.join("logos", cnpj, "logo.png") if cnpj else None
-    if logo_path and os.path.exists(logo_path):
-        elementos.append(Image(logo_path, width=120, height=50))
-        elementos.append(Spacer(1, 12))
-
-    # Título e cabeçalho
-    elementos.append(Paragraph("Relatório de Produtos Extraídos", estilo_titulo))
-    elementos.append(Spacer(1, 12))
-    elementos.append(Paragraph(f"Data do relatório: {datetime.date.today().strftime('%d/%m/%Y')}", estilo_subtitulo))
-
-    if mostrar_usuario and usuario:
-        elementos.append(Paragraph(f"Usuário: {usuario}", estilo_normal))
-    if mostrar_cnpj and cnpj:
-        elementos.append(Paragraph(f"CNPJ: {cnpj}", estilo_normal))
-
-    elementos.append(Spacer(1, 12))
-
-    # Total filtrado
-    try:
-        df["Valor Total"] = pd.to_numeric(df["Valor Total"], errors="coerce")
-        df["Valor Unitário"] = pd.to_numeric(df["Valor Unitário"], errors="coerce")
-        total = df["Valor Total"].sum()
-        elementos.append(Paragraph(f"💰 Total filtrado: R$ {total:,.2f}", estilo_subtitulo))
-    except:
-        pass
-
-    elementos.append(Spacer(1, 12))
-
-    # Formatação numérica com 2 casas
-    df["Valor Total"] = df["Valor Total"].map(formatar_valor)
-    df["Valor Unitário"] = df["Valor Unitário"].map(formatar_valor)
-
-    # Define colunas e estilo para Produto
-    colunas_exibir = ["Produto", "Quantidade", "Valor Unitário", "Valor Total", "Origem"]
-    estilo_produto = ParagraphStyle(name="Produto", fontSize=10, leading=12)
-
-    dados_tabela_formatada = [colunas_exibir]
-    for linha in df[colunas_exibir].astype(str).values.tolist():
-        linha[0] = Paragraph(linha[0], estilo_produto)
-        dados_tabela_formatada.append(linha)
-
-    # Define larguras das colunas
-    col_widths = [200, 60, 70, 70, 60]
-    tabela = Table(dados_tabela_formatada, colWidths=col_widths, repeatRows=1)
-
-    # Estilo visual
-    tabela.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-    ]))
-
-    elementos.append(tabela)
-    doc.build(elementos)
-    buffer.seek(0)
-    return buffer
 
 # Inicialização de sessão
 init_usuarios()
@@ -249,9 +212,11 @@ if "usuario" in st.session_state: # Este bloco é executado QUANDO O USUÁRIO ES
                 apagar_produtos_por_cnpj(st.session_state.cnpj) # <-- Chamando a nova função
 
                 # 2. Apagar os arquivos físicos do usuário
+                excluir_arquivos(st.session_state.cnpj) # Apaga APENAS os arquivos do usuário logado
                 pasta_base = os.path.join("documentos_armazenados", st.session_state.cnpj)
                 if os.path.exists(pasta_base):
-                    shutil.rmtree(pasta_base) # Apaga APENAS a pasta do usuário logado
+                    shutil.rmtree(pasta_base) # Sobras fora do índice
+                    coletar_objetos_orfaos()
 
                 st.success("✅ Seus dados e arquivos foram apagados com sucesso.")
                 st.rerun() # Recarrega a página para refletir as mudanças
@@ -284,18 +249,29 @@ arquivos = []
 with st.sidebar:
     st.markdown("## ☁️ Armazenar Documentos")
     st.markdown("Envie aqui qualquer documento XML, PDF ou imagem.")
-    arquivos = st.file_uploader("📎 Selecione os arquivos", type=["xml", "pdf"], accept_multiple_files=True, key="multiupload")
+    arquivos = st.file_uploader("📎 Selecione os arquivos", type=["xml", "pdf", "jpg", "jpeg", "png", "tif", "tiff"], accept_multiple_files=True, key="multiupload")
     if arquivos:
         st.markdown("### 📄 Arquivos selecionados:")
+        # Hash por upload calculado uma vez só (não a cada rerun do Streamlit) e
+        # reaproveitado na gravação, que então só copia os bytes para o disco
+        hashes_upload = st.session_state.setdefault("hashes_upload", {})
         for arq in arquivos:
             nome = arq.name
-            if verificar_arquivo_existente(nome, st.session_state.cnpj):
+            if arq.file_id not in hashes_upload:
+                hashes_upload[arq.file_id] = hashlib.sha256(arq.getbuffer()).hexdigest()
+            hash_arq = hashes_upload[arq.file_id]
+            if caminho_guardado(st.session_state.cnpj, hash_arq) or verificar_arquivo_existente(nome, st.session_state.cnpj):
                 st.markdown(f"- {nome} ✅ *Já enviado*")
             else:
                 st.markdown(f"- {nome} 🆕 *Novo*")
 
     if arquivos:
-        st.session_state.arquivos_processados = False
+        # Processa de novo só quando a seleção muda, não a cada rerun (senão cada
+        # clique relia os uploads e devolvia à árvore um arquivo recém-excluído)
+        selecao = tuple(arq.file_id for arq in arquivos)
+        if st.session_state.get("selecao_upload") != selecao:
+            st.session_state.selecao_upload = selecao
+            st.session_state.arquivos_processados = False
 
 with st.sidebar.expander("⚙️ Configurações de Conta", expanded=False):
     st.markdown("### 📷 Logo personalizado para relatórios")
@@ -314,66 +290,149 @@ with st.sidebar.expander("⚙️ Configurações de Conta", expanded=False):
         st.image(caminho_logo, width=150, caption="Logo atual")
 
 
-# Bloco de processamento de arquivos com PDF ajustado
+# Bloco de processamento de arquivos (parsing/OCR em paralelo, gravação aqui)
 if arquivos and not st.session_state.get("arquivos_processados", False):
     with st.spinner("⏳ Processando arquivos..."):
         total = len(arquivos)
         progress_bar = st.progress(0, text="🔄 Iniciando...")
+        cnpj_usuario_logado = st.session_state.cnpj # Renomeado para clareza
 
-        for i, arq in enumerate(arquivos):
-            progresso = int((i + 1) / total * 100)
-            progress_bar.progress(progresso, text=f"📄 Processando {i+1}/{total}: {arq.name}")
+        documentos = []
+        chaves = {}
+        danfes_com_chave = []
+        duplicados = 0
+        vinculados = 0
+        for arq in arquivos:
+            # Hash do upload já calculado na barra lateral (uma vez por arquivo)
+            hash_arq = hashes_upload[arq.file_id]
+
+            # Guardar e processar são independentes: conteúdo que já está na árvore
+            # nem chega ao disco (com outro nome vira só mais um link para o mesmo
+            # objeto), e o que já foi processado volta para a árvore (se tinha sido
+            # excluído) sem passar de novo por parsing/OCR
+            caminho = caminho_guardado(cnpj_usuario_logado, hash_arq, arq.name)
+            if not caminho:
+                caminho = guardar_upload(
+                    None,
+                    hash_arq,
+                    nome_arquivo=arq.name,
+                    cnpj=cnpj_usuario_logado,
+                    data_str=datetime.date.today()
+                )
+            if not caminho:
+                temporario, _, _ = receber_upload(arq, hash_arq)
+                caminho = guardar_upload(
+                    temporario,
+                    hash_arq,
+                    nome_arquivo=arq.name,
+                    cnpj=cnpj_usuario_logado, # Usar o CNPJ do usuário logado para salvar o arquivo
+                    data_str=datetime.date.today()
+                )
 
-            nome_arquivo = arq.name
-            cnpj_usuario_logado = st.session_state.cnpj # Renomeado para clareza
+            # Documento já conhecido: uma consulta indexada no lugar de parsing/OCR
+            if hash_arq in chaves or buscar_documento_por_hash(cnpj_usuario_logado, hash_arq):
+                duplicados += 1
+                continue
+            tipo = tipo_documento(arq.name)
+            chave = ""
+            if tipo == "XML":
+                with open(caminho, "rb") as f:
+                    chave = extrair_chave_nfe(f)
+                if buscar_documento_por_chave(cnpj_usuario_logado, chave):
+                    registrar_documento(cnpj_usuario_logado, hash_arq, arq.name, "XML", "duplicado", 0, chave)
+                    duplicados += 1
+                    continue
+            elif tipo == "PDF":
+                # Chave impressa no DANFE (camada de texto da 1ª página, sem OCR)
+                chave = chave_acesso_pdf(caminho)
+            chaves[hash_arq] = chave
+
+            # Os workers recebem o caminho gravado e leem direto do disco
+            if tipo == "PDF" and chave:
+                danfes_com_chave.append((hash_arq, arq.name, caminho))
+            elif tipo:
+                documentos.append((hash_arq, arq.name, caminho))
+
+        # DANFE de nota que já entrou por XML: só vincula pela chave, sem extração de
+        # texto nem OCR. Se a nota vem neste mesmo envio (XML ou outro DANFE extraído),
+        # o DANFE espera por ela e só vincula depois que ela entrar no banco
+        chaves_envio = {chaves[h] for h, nome, _ in documentos if tipo_documento(nome) == "XML" and chaves[h]}
+        aguardando = {}  # chave -> DANFEs à espera da nota deste envio
+        for hash_arq, nome, caminho in danfes_com_chave:
+            chave = chaves[hash_arq]
+            nota = buscar_documento_por_chave(cnpj_usuario_logado, chave)
+            if nota:
+                registrar_documento(cnpj_usuario_logado, hash_arq, nome, "PDF", "vinculado", 0, chave)
+                datar_documento(cnpj_usuario_logado, hash_arq, data_documento(cnpj_usuario_logado, nota[4]))
+                vinculados += 1
+            elif chave in chaves_envio:
+                aguardando.setdefault(chave, []).append((hash_arq, nome, caminho))
+            else:
+                chaves_envio.add(chave)
+                documentos.append((hash_arq, nome, caminho))
+
+        if duplicados:
+            st.info(f"♻️ {duplicados} arquivo(s) já processado(s) anteriormente não foram reprocessados.")
+
+        if documentos:
+            progress_bar.progress(0, text=f"🔄 Processando {len(documentos)} documento(s)...")
+
+        concluidos = 0
+        total_documentos = len(documentos)
+        notas_ok = {}  # chave -> data de emissão, das notas que entraram no banco neste envio
+        # Uma rodada por vez: DANFEs cuja nota deste envio falhou vão para a seguinte
+        while documentos:
+            # Os resultados chegam na ordem em que cada worker termina
+            for resultado in processar_em_paralelo(documentos):
+                concluidos += 1
+                progresso = int(concluidos / total_documentos * 100)
+                progress_bar.progress(progresso, text=f"📄 Concluído {concluidos}/{total_documentos}: {resultado['nome']}")
+
+                hash_arq = resultado["id"]
+                if resultado["erro"]:
+                    registrar_documento(cnpj_usuario_logado, hash_arq, resultado["nome"], resultado["tipo"], "erro", 0, chaves[hash_arq])
+                else:
+                    # Índice de arquivos com a data de emissão da nota no lugar da do envio
+                    datar_documento(cnpj_usuario_logado, hash_arq, resultado["data"])
 
-            salvar_arquivo_em_nuvem(
-                arquivo=arq,
-                nome_arquivo=arq.name,
-                cnpj=cnpj_usuario_logado, # Usar o CNPJ do usuário logado para salvar o arquivo
-                data_str=datetime.date.today()
-            )
+                if resultado["tipo"] == "XML":
+                    if resultado["erro"]:
+                        st.error(f"❌ Erro ao processar XML {resultado['nome']}: {resultado['erro']}")
+                        continue
 
-            if arq.name.lower().endswith(".xml"):
-                try:
-                    arq.seek(0)
-                    produtos = parse_nfe(arq)
-                    produtos = parse_nfe(arq)
-                    for p in produtos:
+                    for p in resultado["produtos"]:
                         # Só completa campos se estiverem faltando
                         p.update({
                             "Empresa": p.get("Empresa", "Desconhecida"),
-                            "CNPJ": st.session_state.cnpj,
+                            "CNPJ": cnpj_usuario_logado,
                             "Data": p.get("Data", datetime.date.today().strftime("%Y-%m-%d")),
-                            "Origem": "XML"
+                            "Origem": "XML",
+                            "Documento": hash_arq
                         })
-                        inserir_produto(p)
-
-                except Exception as e:
-                    st.error(f"❌ Erro ao processar XML {arq.name}: {e}")
-
-
-            elif arq.name.lower().endswith(".pdf"):
-                st.info("Processando PDF... Isso pode levar um tempo.")
-                try:
-                    arq.seek(0) # Voltar o ponteiro do arquivo para o início
-                    texto = extrair_texto_pdf(arq)
-                    produtos = extrair_produtos_pdf_livre(texto)
-                    
-                    # DEBUG: Mostrar texto extraído do PDF
-                    # st.text_area("Conteúdo lido do PDF (para depuração):", texto, height=200, key=f"pdf_text_{arq.name}")
-                    
-                    empresa_pdf, cnpj_extraido_pdf, data_pdf = extrair_dados_cabecalho(texto)
-
-                    # DEBUG: Mostrar dados extraídos do cabeçalho
-                    # st.write(f"DEBUG APP.PY: Empresa extraída de PDF: '{empresa_pdf}'")
-                    # st.write(f"DEBUG APP.PY: CNPJ extraído de PDF: '{cnpj_extraido_pdf}'")
-                    # st.write(f"DEBUG APP.PY: Data extraída de PDF: '{data_pdf}'")
-                    
+                    # DANFE desta nota enviado antes: as linhas do XML substituem as extraídas do PDF
+                    substituidas = substituir_pdfs_da_chave(cnpj_usuario_logado, chaves[hash_arq])
+                    if substituidas:
+                        st.info(f"🔁 {resultado['nome']}: {substituidas} linha(s) extraída(s) do DANFE substituída(s) pelas do XML.")
+                    inseridos, _ = inserir_produtos_lote(resultado["produtos"])
+                    registrar_documento(cnpj_usuario_logado, hash_arq, resultado["nome"], "XML", "processado", inseridos, chaves[hash_arq])
+                    notas_ok[chaves[hash_arq]] = resultado["data"]
+
+                elif resultado["tipo"] in ("PDF", "IMAGEM"):
+                    if resultado["erro"]:
+                        st.error(f"Erro ao processar {resultado['nome']}:")
+                        st.code(resultado["erro"]) # Para ver o erro completo
+                        continue
+
+                    produtos = resultado["produtos"]
+                    paginas_erro = [p for p in resultado["paginas"] if p.get("erro")]
+                    empresa_pdf = resultado["empresa"]
+                    cnpj_extraido_pdf = resultado["cnpj"]
+                    data_pdf = resultado["data"]
                     data_str = data_pdf if data_pdf else datetime.datetime.now().strftime("%Y-%m-%d")
 
                     if not produtos:
-                        st.warning("⚠️ Não foi possível extrair produtos do PDF. Verifique o formato ou tente outra fonte.")
+                        registrar_documento(cnpj_usuario_logado, hash_arq, resultado["nome"], resultado["tipo"], "sem_produtos", 0)
+                        st.warning(f"⚠️ Não foi possível extrair produtos de {resultado['nome']}. Verifique o formato ou tente outra fonte.")
                     else:
                         for p in produtos:
                             p.update({
@@ -382,14 +441,51 @@ if arquivos and not st.session_state.get("arquivos_processados", False):
                                 # Se ele estiver vazio, aí sim, use o CNPJ do usuário logado.
                                 "CNPJ": cnpj_extraido_pdf if cnpj_extraido_pdf else cnpj_usuario_logado, 
                                 "Data": data_str,
-                                "Origem": "PDF"
+                                "Origem": resultado["tipo"],
+                                "Documento": hash_arq
                             })
-                            inserir_produto(p)
-                        st.success("✅ Produtos extraídos e salvos do PDF com sucesso!")
-                        # st.rerun() # Não é necessário recarregar a cada arquivo, apenas no final
-                except Exception as e:
-                    st.error(f"Erro ao processar PDF: {e}")
-                    st.exception(e) # Para ver o erro completo
+                        inseridos, _ = inserir_produtos_lote(produtos)
+                        # Com página que falhou no OCR o documento pode ser reenviado e relido
+                        status = "parcial" if paginas_erro else "processado"
+                        registrar_documento(cnpj_usuario_logado, hash_arq, resultado["nome"], resultado["tipo"], status, inseridos, chaves[hash_arq])
+                        notas_ok[chaves[hash_arq]] = resultado["data"]
+                        st.success(f"✅ Produtos extraídos e salvos de {resultado['nome']} com sucesso!")
+
+                    if paginas_erro:
+                        st.warning(
+                            f"⚠️ {resultado['nome']}: OCR falhou na(s) página(s) "
+                            f"{', '.join(str(p['pagina']) for p in paginas_erro)}; as demais foram aproveitadas."
+                        )
+                        st.code("\n".join(f"Página {p['pagina']}: {p['erro']}" for p in paginas_erro))
+
+                    paginas_ocr = [p for p in resultado["paginas"] if p["metodo"] == "ocr"]
+                    if paginas_ocr:
+                        segundos_ocr = sum(p["segundos"] for p in paginas_ocr)
+                        st.caption(
+                            f"🔎 {resultado['nome']}: {len(paginas_ocr)} de {len(resultado['paginas'])} página(s) via OCR "
+                            f"({', '.join(str(p['pagina']) for p in paginas_ocr)}) em {segundos_ocr:.1f}s"
+                        )
+
+            # Nota que entrou vincula os DANFEs que esperavam por ela; se falhou, o
+            # primeiro DANFE é extraído na próxima rodada e os demais esperam por ele
+            documentos = []
+            for chave, pendentes in list(aguardando.items()):
+                if chave in notas_ok:
+                    for hash_arq, nome, _ in pendentes:
+                        registrar_documento(cnpj_usuario_logado, hash_arq, nome, "PDF", "vinculado", 0, chave)
+                        datar_documento(cnpj_usuario_logado, hash_arq, notas_ok[chave])
+                    vinculados += len(pendentes)
+                    del aguardando[chave]
+                else:
+                    documentos.append(pendentes.pop(0))
+                    if not pendentes:
+                        del aguardando[chave]
+            total_documentos += len(documentos)
+
+        if vinculados:
+            st.info(f"🔗 {vinculados} DANFE(s) vinculado(s) a notas já importadas, sem nova extração.")
+
+        progress_bar.progress(100, text=f"✅ {total}/{total} arquivo(s) processado(s)")
         st.session_state.arquivos_processados = True
         st.success(f"✅ {len(arquivos)} arquivo(s) armazenado(s) e processado(s) com sucesso!")
 
@@ -413,19 +509,9 @@ with st.expander("🧹 Excluir por período", expanded=False):
         col1, col2 = st.columns(2)
         with col1:
             if st.button("✅ Sim, excluir agora", key="confirma_excluir_periodo"):
-                base_path = os.path.join("documentos_armazenados", st.session_state.cnpj)
-                excluidos = 0
-                if os.path.exists(base_path):
-                    for ano in os.listdir(base_path):
-                        pasta_ano = os.path.join(base_path, ano)
-                        for mes in os.listdir(pasta_ano):
-                            pasta_mes = os.path.join(pasta_ano, mes)
-                            for nome_arquivo_arq in os.listdir(pasta_mes): # Renomeado para evitar conflito
-                                caminho = os.path.join(pasta_mes, nome_arquivo_arq)
-                                data_arquivo = datetime.datetime.fromtimestamp(os.path.getmtime(caminho)).date()
-                                if data_ini <= data_arquivo <= data_fim:
-                                    os.remove(caminho)
-                                    excluidos += 1
+                if listar_pastas(st.session_state.cnpj):
+                    # Pela data de envio gravada no índice, sem stat em cada arquivo
+                    excluidos = excluir_arquivos(st.session_state.cnpj, data_ini=data_ini, data_fim=data_fim)
                     st.success(f"✅ {excluidos} arquivo(s) excluído(s) entre {data_ini} e {data_fim}")
                     st.session_state.pop("confirmar_exclusao_periodo")
                     st.rerun()
@@ -439,52 +525,89 @@ with st.expander("🧹 Excluir por período", expanded=False):
 with aba_envio:
     st.markdown("## 📁 Meus Arquivos Enviados")
     cnpj_do_usuario_logado = st.session_state.cnpj # Renomeado para clareza
-    pasta_base_usuario = os.path.join("documentos_armazenados", cnpj_do_usuario_logado)
-
-    if os.path.exists(pasta_base_usuario):
-        for ano in sorted(os.listdir(pasta_base_usuario)):
-            st.markdown(f"### 📅 Ano {ano}")
-            pasta_ano = os.path.join(pasta_base_usuario, ano)
-            for mes in sorted(os.listdir(pasta_ano)):
-                col_mes, col_botao_mes = st.columns([6, 1])
-                with col_mes:
-                    st.markdown(f"#### 🗓️ Mês {mes}")
-                chave_conf = f"confirmar_mes_{ano}_{mes}"
-                if st.button("🗑️ Excluir mês", key=f"excluir_mes_{ano}_{mes}"):
-                    st.session_state[chave_conf] = True
-
-                if st.session_state.get(chave_conf, False):
-                    st.warning(f"⚠️ Tem certeza que deseja excluir TODOS os arquivos do mês {mes}/{ano}?")
-                    col_ok, col_cancel = st.columns(2)
-                    with col_ok:
-                        if st.button("✅ Sim, excluir", key=f"sim_{ano}_{mes}"):
-                            shutil.rmtree(os.path.join(pasta_ano, mes))
-                            st.success(f"Mês {mes}/{ano} excluído com sucesso.")
-                            st.session_state.pop(chave_conf)
-                            st.rerun()
-                    with col_cancel:
-                        if st.button("❌ Cancelar", key=f"cancela_{ano}_{mes}"):
-                            st.session_state.pop(chave_conf)
-
-
-                pasta_mes = os.path.join(pasta_ano, mes)
-                arquivos_no_mes = os.listdir(pasta_mes) # Renomeado para evitar conflito
-                for arquivo_item in arquivos_no_mes: # Renomeado para evitar conflito
-                    caminho_arquivo = os.path.join(pasta_mes, arquivo_item)
-                    col1, col2 = st.columns([6, 1])
-                    with col1:
-                        with open(caminho_arquivo, "rb") as f:
-                            st.download_button(
-                                label=f"📄 {arquivo_item}",
-                                data=f.read(),
-                                file_name=arquivo_item,
-                                mime="application/octet-stream"
-                            )
-                    with col2:
-                        if st.button("🗑️", key=f"del_{ano}_{mes}_{arquivo_item}"):
-                            os.remove(caminho_arquivo)
-                            st.success(f"Arquivo {arquivo_item} excluído com sucesso.")
-                            st.rerun()
+    pastas_usuario = listar_pastas(cnpj_do_usuario_logado)
+
+    if pastas_usuario:
+        # Um mês por vez, paginado; bytes só do arquivo pedido ou do ZIP gerado
+        resumo_pastas = {(ano, mes): (qtd, tamanho) for ano, mes, qtd, tamanho in pastas_usuario}
+        pasta = st.selectbox(
+            "🗓️ Mês",
+            list(reversed(list(resumo_pastas))),
+            format_func=lambda p: f"{p[1]}/{p[0]} — {resumo_pastas[p][0]} arquivo(s), {resumo_pastas[p][1] / 1024 / 1024:.1f} MB",
+            key="arquivos_pasta"
+        )
+        ano, mes = pasta
+
+        col_zip_mes, col_zip_ano, col_botao_mes = st.columns(3)
+        with col_zip_mes:
+            painel_exportacao(
+                f"zip_{ano}_{mes}", f"📦 Baixar {mes}/{ano} (.zip)", f"arquivos_{ano}_{mes}.zip", "application/zip",
+                compactar_pasta, cnpj_do_usuario_logado, {"ano": ano, "mes": mes},
+                versao=assinatura_pasta(cnpj_do_usuario_logado, ano, mes)
+            )
+        with col_zip_ano:
+            painel_exportacao(
+                f"zip_{ano}", f"📦 Baixar {ano} (.zip)", f"arquivos_{ano}.zip", "application/zip",
+                compactar_pasta, cnpj_do_usuario_logado, {"ano": ano, "mes": None},
+                versao=assinatura_pasta(cnpj_do_usuario_logado, ano)
+            )
+        with col_botao_mes:
+            chave_conf = f"confirmar_mes_{ano}_{mes}"
+            if st.button("🗑️ Excluir mês", key=f"excluir_mes_{ano}_{mes}"):
+                st.session_state[chave_conf] = True
+
+        if st.session_state.get(chave_conf, False):
+            st.warning(f"⚠️ Tem certeza que deseja excluir TODOS os arquivos do mês {mes}/{ano}?")
+            col_ok, col_cancel = st.columns(2)
+            with col_ok:
+                if st.button("✅ Sim, excluir", key=f"sim_{ano}_{mes}"):
+                    excluir_arquivos(cnpj_do_usuario_logado, ano=ano, mes=mes)
+                    st.success(f"Mês {mes}/{ano} excluído com sucesso.")
+                    st.session_state.pop(chave_conf)
+                    st.rerun()
+            with col_cancel:
+                if st.button("❌ Cancelar", key=f"cancela_{ano}_{mes}"):
+                    st.session_state.pop(chave_conf)
+
+        # Cursores (keyset por nome) do início de cada página visitada; zeram ao trocar de mês
+        tamanho_pagina = st.selectbox("Arquivos por página", [25, 50, 100], index=1, key="arquivos_tamanho")
+        if st.session_state.get("arquivos_assinatura") != (pasta, tamanho_pagina):
+            st.session_state.arquivos_assinatura = (pasta, tamanho_pagina)
+            st.session_state.arquivos_cursores = [None]
+        cursores = st.session_state.arquivos_cursores
+        linhas_pagina, proximo_cursor = pagina_arquivos(
+            cnpj_do_usuario_logado, ano, mes, apos=cursores[-1], limite=tamanho_pagina
+        )
+        if not linhas_pagina and len(cursores) > 1:
+            # A página ficou vazia (arquivos excluídos): volta uma
+            cursores.pop()
+            st.rerun()
+
+        for caminho_arquivo, arquivo_item, _, _, tamanho, _ in linhas_pagina:
+            col1, col2, col3 = st.columns([5, 1, 1])
+            with col1:
+                st.markdown(f"📄 {arquivo_item} <small>({tamanho / 1024:.0f} KB)</small>", unsafe_allow_html=True)
+            with col2:
+                # O arquivo só é lido quando pedido; aí vira o botão de download
+                botao_download(f"{ano}_{mes}_{arquivo_item}", "⬇️", "💾", caminho_arquivo, arquivo_item, "application/octet-stream")
+            with col3:
+                if st.button("🗑️", key=f"del_{ano}_{mes}_{arquivo_item}"):
+                    excluir_arquivo(cnpj_do_usuario_logado, caminho_arquivo)
+                    st.success(f"Arquivo {arquivo_item} excluído com sucesso.")
+                    st.rerun()
+
+        total_paginas = max(1, -(-resumo_pastas[pasta][0] // tamanho_pagina))
+        colp1, colp2, colp3 = st.columns([1, 2, 1])
+        with colp1:
+            if st.button("⬅️ Anterior", key="arquivos_anterior", disabled=len(cursores) == 1):
+                cursores.pop()
+                st.rerun()
+        with colp2:
+            st.caption(f"Página {len(cursores)} de {total_paginas}")
+        with colp3:
+            if st.button("Próxima ➡️", key="arquivos_proxima", disabled=proximo_cursor is None):
+                cursores.append(proximo_cursor)
+                st.rerun()
     else:
         st.info("Nenhum arquivo enviado ainda.")
 
@@ -492,216 +615,243 @@ with aba_envio:
 
 with aba_historico:
     with st.expander("📂 Histórico de produtos extraídos", expanded=True):
-        registros = buscar_todos(st.session_state.cnpj)
-        
-        if registros:
-            df_hist = pd.DataFrame(registros, columns=[
-                "Empresa", "CNPJ", "Produto", "Quantidade", "Valor Unitário", "Valor Total", "Origem", "Data"
-            ])
-            df_hist["Data"] = pd.to_datetime(df_hist["Data"], errors="coerce")
-            df_hist["Empresa"] = df_hist["Empresa"].astype(str).str.strip()
-            df_hist["Produto"] = df_hist["Produto"].astype(str).str.strip()
-
-          
-           
-            
-            
-            df_hist = limpar_df(df_hist)
-
-
-
+        if possui_produtos(st.session_state.cnpj):
             colf1, colf2 = st.columns(2)
             with colf1:
                 data_ini = st.date_input("📆 De:", value=datetime.date.today() - datetime.timedelta(days=30), key="filtro_de")
             with colf2:
                 data_fim = st.date_input("📆 Até:", value=datetime.date.today(), key="filtro_ate")
 
-            df_hist["Data"] = pd.to_datetime(df_hist["Data"], errors="coerce").dt.tz_localize(None)
-
-            df_filtrado = df_hist[
-                df_hist["Data"].notna() &
-                (df_hist["Data"] >= pd.to_datetime(data_ini)) &
-                (df_hist["Data"] <= pd.to_datetime(data_fim))
-            ]
-
-            if not df_filtrado.empty:
-                # Conversão para cálculo (mantém como float)
-              # Garantir tipo numérico real ANTES de tudo
-                df_filtrado["Valor Total"] = pd.to_numeric(df_filtrado["Valor Total"], errors="coerce").fillna(0)
-                df_filtrado["Valor Unitário"] = pd.to_numeric(df_filtrado["Valor Unitário"], errors="coerce").fillna(0)
-
-                # Só depois você calcula
-                total_filtrado = df_filtrado["Valor Total"].sum()
-
+            # Opções dos filtros já restritas ao período, direto do banco
+            opcoes_empresas = consultar(listar_empresas, st.session_state.cnpj, data_ini=data_ini, data_fim=data_fim)
+            opcoes_produtos = consultar(listar_produtos, st.session_state.cnpj, data_ini=data_ini, data_fim=data_fim)
 
+            if opcoes_empresas or opcoes_produtos:
                 # Filtros por empresa e produto
                 filtros_empresas = st.multiselect(
                     "🏢 Filtrar por empresas",
-                    options=sorted(df_filtrado["Empresa"].dropna().unique()),
+                    options=opcoes_empresas,
                     default=[]
                 )
 
                 filtros_produtos = st.multiselect(
                     "📦 Filtrar por produtos",
-                    options=sorted(df_filtrado["Produto"].dropna().unique()),
+                    options=opcoes_produtos,
                     default=[]
                 )
 
-                if filtros_empresas:
-                    df_filtrado = df_filtrado[df_filtrado["Empresa"].isin(filtros_empresas)]
-
-                if filtros_produtos:
-                    df_filtrado = df_filtrado[df_filtrado["Produto"].isin(filtros_produtos)]
-
                 if st.button("🔄 Limpar filtros"):
                     st.experimental_rerun()
 
-                # Recalcula total após filtro
-                total_filtrado = df_filtrado["Valor Total"].sum()
-
-                # Métricas
-                col1, col2, col3 = st.columns(3)
-                col1.metric("📦 Total de Produtos", f"{len(df_filtrado):,}")
-                col2.metric("💰 Valor Total", f"R$ {total_filtrado:,.2f}")
-                try:
-                    top_empresa = (
-                        df_filtrado[df_filtrado["Empresa"] != "Desconhecida"]
-                        .groupby("Empresa")["Valor Total"]
-                        .sum()
-                        .idxmax()
-                        if not df_filtrado[df_filtrado["Empresa"] != "Desconhecida"].empty
-                        else "Desconhecida"
-)
-
-                    col3.metric("🏆 Fornecedor Destaque", top_empresa)
-                except:
-                    col3.metric("🏆 Fornecedor Destaque", "N/A")
-
-                # 🔒 Checkboxes PDF
-                mostrar_usuario = st.checkbox("Incluir nome de usuário no PDF", value=False, key="chk_usuario_pdf")
-                mostrar_cnpj = st.checkbox("Incluir CNPJ no PDF", value=False, key="chk_cnpj_pdf")
-
-
-                # Gera arquivos exportáveis
-                excel_buffer = gerar_excel(df_filtrado)
+                filtros = {
+                    "data_ini": data_ini,
+                    "data_fim": data_fim,
+                    "empresas": filtros_empresas,
+                    "produtos": filtros_produtos,
+                }
+                # Totais e gráficos saem agregados do banco (poucas linhas por consulta)
+                # (cache compartilhado, invalidado quando os dados do CNPJ mudam)
+                resumo = consultar(resumo_periodo, st.session_state.cnpj, **filtros)
+
+                if resumo["linhas"] == 0:
+                    st.info("📭 Nenhum produto encontrado com esses filtros.")
+                else:
+                    # Métricas
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("📦 Total de Produtos", f"{resumo['linhas']:,}")
+                    col2.metric("💰 Valor Total", f"R$ {resumo['total']:,.2f}")
+                    col3.metric("🏆 Fornecedor Destaque", resumo["top_empresa"])
+
+                    # 🔒 Checkboxes PDF
+                    mostrar_usuario = st.checkbox("Incluir nome de usuário no PDF", value=False, key="chk_usuario_pdf")
+                    mostrar_cnpj = st.checkbox("Incluir CNPJ no PDF", value=False, key="chk_cnpj_pdf")
+
+                    # Arquivos exportáveis: gerados só quando pedidos, em segundo plano,
+                    # e reaproveitados enquanto filtros/opções/dados não mudarem
+                    col_excel, col_csv, col_pdf = st.columns(3)
+                    with col_excel:
+                        painel_exportacao(
+                            "xlsx",
+                            "📥 Baixar tabela como Excel",
+                            "historico_produtos.xlsx",
+                            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            exportar_excel_historico,
+                            st.session_state.cnpj,
+                            filtros
+                        )
+                    with col_csv:
+                        painel_exportacao(
+                            "csv",
+                            "🧾 Baixar tabela como CSV",
+                            "historico_produtos.csv",
+                            "text/csv",
+                            exportar_csv_historico,
+                            st.session_state.cnpj,
+                            filtros
+                        )
+                    with col_pdf:
+                        painel_exportacao(
+                            "pdf",
+                            "📄 Baixar relatório em PDF",
+                            "relatorio_produtos.pdf",
+                            "application/pdf",
+                            exportar_pdf_historico,
+                            st.session_state.cnpj,
+                            filtros,
+                            usuario=st.session_state.usuario,
+                            mostrar_usuario=mostrar_usuario,
+                            mostrar_cnpj=mostrar_cnpj
+                        )
 
-                st.download_button(
-                    "📥 Baixar tabela como Excel",
-                    data=excel_buffer,
-                    file_name="historico_produtos.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+                    st.markdown("### 📋 Produtos encontrados")
+                    colo1, colo2, colo3 = st.columns([3, 2, 2])
+                    with colo1:
+                        ordenar_por = st.selectbox("Ordenar por", list(COLUNAS_ORDENAVEIS), key="tabela_ordem")
+                    with colo2:
+                        decrescente = st.toggle("Decrescente", value=False, key="tabela_desc")
+                    with colo3:
+                        tamanho_pagina = st.selectbox("Linhas por página", [50, 100, 250, 500], index=1, key="tabela_tamanho")
+
+                    # Cursores (keyset) do início de cada página visitada; zera quando filtro/ordem mudam
+                    assinatura = (data_ini, data_fim, tuple(filtros_empresas), tuple(filtros_produtos),
+                                  ordenar_por, decrescente, tamanho_pagina)
+                    if st.session_state.get("tabela_assinatura") != assinatura:
+                        st.session_state.tabela_assinatura = assinatura
+                        st.session_state.tabela_cursores = [None]
+
+                    cursores = st.session_state.tabela_cursores
+                    linhas_pagina, proximo_cursor = consultar(
+                        buscar_pagina,
+                        st.session_state.cnpj,
+                        **filtros,
+                        ordenar_por=ordenar_por,
+                        decrescente=decrescente,
+                        apos=cursores[-1],
+                        limite=tamanho_pagina
+                    )
 
-                pdf_buffer = gerar_pdf_relatorio(
-                    df_filtrado,
-                    usuario=st.session_state.usuario,
-                    cnpj=st.session_state.cnpj,
-                    mostrar_usuario=mostrar_usuario,
-                    mostrar_cnpj=mostrar_cnpj
-                )
+                    # Agora sim: formatar para exibição (só a página atual)
+                    df_exibicao = pd.DataFrame(linhas_pagina, columns=[
+                        "Empresa", "CNPJ", "Produto", "Quantidade", "Valor Unitário", "Valor Total", "Origem", "Data"
+                    ])
+                    df_exibicao["Valor Total"] = df_exibicao["Valor Total"].map(formatar_valor)
+                    df_exibicao["Valor Unitário"] = df_exibicao["Valor Unitário"].map(formatar_valor)
+                    st.dataframe(df_exibicao, use_container_width=True, height=300)
 
-                st.download_button(
-                    "📄 Baixar relatório em PDF",
-                    data=pdf_buffer,
-                    file_name="relatorio_produtos.pdf",
-                    mime="application/pdf"
-                )
+                    total_paginas = max(1, -(-resumo["linhas"] // tamanho_pagina))
+                    colp1, colp2, colp3 = st.columns([1, 2, 1])
+                    with colp1:
+                        if st.button("⬅️ Anterior", key="tabela_anterior", disabled=len(cursores) == 1):
+                            cursores.pop()
+                            st.rerun()
+                    with colp2:
+                        st.caption(f"Página {len(cursores)} de {total_paginas}")
+                    with colp3:
+                        if st.button("Próxima ➡️", key="tabela_proxima", disabled=proximo_cursor is None):
+                            cursores.append(proximo_cursor)
+                            st.rerun()
 
-                # Agora sim: formatar para exibição (SEM quebrar nada)
-                df_exibicao = df_filtrado.copy()
-                df_exibicao["Valor Total"] = df_exibicao["Valor Total"].map(formatar_valor)
-                df_exibicao["Valor Unitário"] = df_exibicao["Valor Unitário"].map(formatar_valor)
+                    # 📊 Gasto por empresa (gráfico de barras)
+                    with st.container():
+                        col1, col2 = st.columns(2)
 
+                        with col1:
+                            df_soma = pd.DataFrame(
+                                consultar(total_por_empresa, st.session_state.cnpj, **filtros),
+                                columns=["Empresa", "Valor Total"]
+                            )
+                            fig1 = px.bar(
+                                df_soma,
+                                x="Valor Total",
+                                y="Empresa",
+                                orientation="h",
+                                title="💼 Gasto por empresa",
+                                height=300 + len(df_soma) * 10,
+                                template="plotly_white"
+                            )
+                            st.plotly_chart(fig1, use_container_width=True, key="grafico_gasto_empresa")
 
 
+                        with col2:
+                            df_origem = pd.DataFrame(
+                                consultar(contagem_por_origem, st.session_state.cnpj, **filtros),
+                                columns=["Origem", "Total"]
+                            )
 
-                st.markdown("### 📋 Produtos encontrados")
-                if 'df_filtrado' in locals() and not df_filtrado.empty:
-                    st.dataframe(df_exibicao, use_container_width=True, height=300)
-                else:
-                    st.info("📭 Nenhum dado para exibir na tabela.")
-
-                # 📊 Gasto por empresa (gráfico de barras)
-                with st.container():
-                    col1, col2 = st.columns(2)
-
-                    with col1:
-                        df_filtrado["Valor Total"] = pd.to_numeric(df_filtrado["Valor Total"], errors="coerce")
-                        df_soma = df_filtrado.groupby("Empresa")["Valor Total"].sum().reset_index()
-                        df_soma = df_soma.sort_values("Valor Total", ascending=True)
-                        fig1 = px.bar(
-                            df_soma,
-                            x="Valor Total",
-                            y="Empresa",
-                            orientation="h",
-                            title="💼 Gasto por empresa",
-                            height=300 + len(df_soma) * 10,
-                            template="plotly_white"
+                            if len(df_origem) > 1:
+                                fig2 = px.pie(
+                                    df_origem,
+                                    values="Total",
+                                    names="Origem",
+                                    hole=0.4,
+                                    title="📦 Origem dos produtos",
+                                    template="plotly_white"
+                                )
+                                st.plotly_chart(fig2, use_container_width=True, key="grafico_origem_produtos")
+
+                            else:
+                                st.info(f"Todos os produtos vieram da origem: {df_origem.iloc[0]['Origem']}")
+
+                    # 📈 Evolução dos gastos
+                    df_por_dia = pd.DataFrame(
+                        consultar(serie_diaria, st.session_state.cnpj, **filtros),
+                        columns=["Data", "Valor Total"]
+                    )
+                    df_por_dia["Data"] = pd.to_datetime(df_por_dia["Data"])
+
+                    fig_linha = go.Figure()
+                    fig_linha.add_trace(go.Scatter(
+                        x=df_por_dia["Data"],
+                        y=df_por_dia["Valor Total"],
+                        mode="lines+markers",
+                        line=dict(color="royalblue", width=2),
+                        marker=dict(size=6),
+                        hovertemplate='R$ %{y:.2f}<br>%{x|%d %b %Y}<extra></extra>',
+                        name=""
+                    ))
+                    fig_linha.update_layout(
+                        title="📈 Evolução dos gastos",
+                        xaxis_title="Data",
+                        yaxis_title="Valor Total (R$)",
+                        template="plotly_white",
+                        height=400,
+                        showlegend=False
+                    )
+                    st.plotly_chart(fig_linha, use_container_width=True, key="grafico_evolucao_gastos")
+
+                    # 📅 Gasto por mês e empresa, direto do resumo mensal (meses inteiros
+                    # que tocam o período; o resumo não tem produto, então só sem esse filtro)
+                    if not filtros_produtos:
+                        df_mes = pd.DataFrame(
+                            consultar(serie_mensal, st.session_state.cnpj, data_ini=data_ini, data_fim=data_fim, empresas=filtros_empresas),
+                            columns=["Mês", "Empresa", "Itens", "Valor Total"]
                         )
-                        st.plotly_chart(fig1, use_container_width=True, key="grafico_gasto_empresa")
-
-
-                    with col2:
-                        df_origem = df_filtrado["Origem"].value_counts().reset_index()
-                        df_origem.columns = ["Origem", "Total"]
-
-                        if len(df_origem) > 1:
-                            fig2 = px.pie(
-                                df_origem,
-                                values="Total",
-                                names="Origem",
-                                hole=0.4,
-                                title="📦 Origem dos produtos",
-                                template="plotly_white"
+                        if not df_mes.empty:
+                            fig_mes = px.bar(
+                                df_mes,
+                                x="Mês",
+                                y="Valor Total",
+                                color="Empresa",
+                                title="📅 Gasto por mês (meses completos)",
+                                template="plotly_white",
+                                height=400
                             )
-                            st.plotly_chart(fig2, use_container_width=True, key="grafico_origem_produtos")
-
-                        else:
-                            st.info(f"Todos os produtos vieram da origem: {df_origem.iloc[0]['Origem']}")
-
-                # 📈 Evolução dos gastos
-                df_filtrado["Valor Total"] = pd.to_numeric(df_filtrado["Valor Total"], errors="coerce")
-                df_filtrado["Data"] = pd.to_datetime(df_filtrado["Data"]).dt.date  # <-- converte para apenas a data (sem hora)
-                df_filtrado["Data"] = pd.to_datetime(df_filtrado["Data"]).dt.date  # <-- aplica só a data
-                df_por_dia = df_filtrado.groupby("Data")["Valor Total"].sum().reset_index()
-
-
-                fig_linha = go.Figure()
-                fig_linha.add_trace(go.Scatter(
-                    x=df_por_dia["Data"],
-                    y=df_por_dia["Valor Total"],
-                    mode="lines+markers",
-                    line=dict(color="royalblue", width=2),
-                    marker=dict(size=6),
-                    hovertemplate='R$ %{y:.2f}<br>%{x|%d %b %Y}<extra></extra>',
-                    name=""
-                ))
-                fig_linha.update_layout(
-                    title="📈 Evolução dos gastos",
-                    xaxis_title="Data",
-                    yaxis_title="Valor Total (R$)",
-                    template="plotly_white",
-                    height=400,
-                    showlegend=False
-                )
-                st.plotly_chart(fig_linha, use_container_width=True, key="grafico_evolucao_gastos")
-
-
-                # 🗓️ Mapa de calor
-                st.markdown("### 🗓️ Mapa de calor por dia")
-                serie = df_filtrado.groupby("Data")["Valor Total"].sum()
-                if not serie.empty:
-                    serie.index = pd.to_datetime(serie.index)
-                    serie = pd.to_numeric(serie, errors="coerce").fillna(0)
-                    fig_cal, _ = calplot.calplot(
-                        serie,
-                        cmap="Blues",
-                        suptitle="🗓️ Mapa de calor de gastos por dia",
-                        colorbar=True
-                    )
-                    st.pyplot(fig_cal)
-                else:
-                    st.warning("⚠️ Não há dados suficientes para gerar o mapa de calor.")
+                            st.plotly_chart(fig_mes, use_container_width=True, key="grafico_gasto_mes")
+
+
+                    # 🗓️ Mapa de calor
+                    st.markdown("### 🗓️ Mapa de calor por dia")
+                    serie = df_por_dia.set_index("Data")["Valor Total"]
+                    if not serie.empty:
+                        fig_cal, _ = calplot.calplot(
+                            serie,
+                            cmap="Blues",
+                            suptitle="🗓️ Mapa de calor de gastos por dia",
+                            colorbar=True
+                        )
+                        st.pyplot(fig_cal)
+                    else:
+                        st.warning("⚠️ Não há dados suficientes para gerar o mapa de calor.")
             else:
                 st.info("📭 Nenhum produto encontrado nesse período.")
         else:
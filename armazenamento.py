@@ -1,9 +1,131 @@
 # arquivo: armazenamento.py
 import os
-from datetime import datetime
+import hashlib
+import shutil
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
 import pandas as pd  # importante manter isso aqui
 
-def salvar_arquivo_em_nuvem(arquivo, nome_arquivo, cnpj, data_str):
+from db import conectar, normalizar_data
+
+PASTA_DOCUMENTOS = "documentos_armazenados"
+PASTA_RECEBENDO = os.path.join(PASTA_DOCUMENTOS, "_recebendo")
+PASTA_OBJETOS = os.path.join(PASTA_DOCUMENTOS, "_objetos")
+TAMANHO_BLOCO = 1024 * 1024
+ARQUIVOS_POR_PAGINA = 50
+# Já comprimidos: vão para o ZIP sem deflate (só gastaria CPU)
+EXTENSOES_SEM_COMPRESSAO = (".pdf", ".jpg", ".jpeg", ".png", ".zip")
+
+
+# -------- Recebimento do upload (uma passada só) --------
+def receber_upload(arquivo, hash_arquivo=None, tamanho_bloco=TAMANHO_BLOCO):
+    # Lê o upload em blocos: cada bloco vai para o SHA-256 e para um temporário
+    # na mesma partição do destino (o rename depois é atômico). Com hash_arquivo
+    # (já calculado por quem chama) os blocos só são gravados.
+    # -> (caminho_temporario, hash, tamanho)
+    os.makedirs(PASTA_RECEBENDO, exist_ok=True)
+    hasher = None if hash_arquivo else hashlib.sha256()
+    tamanho = 0
+    descritor, temporario = tempfile.mkstemp(dir=PASTA_RECEBENDO, suffix=".parcial")
+    try:
+        arquivo.seek(0)
+        with os.fdopen(descritor, "wb") as destino:
+            while True:
+                bloco = arquivo.read(tamanho_bloco)
+                if not bloco:
+                    break
+                if hasher:
+                    hasher.update(bloco)
+                destino.write(bloco)
+                tamanho += len(bloco)
+    except BaseException:
+        descartar_upload(temporario)
+        raise
+    return temporario, hash_arquivo or hasher.hexdigest(), tamanho
+
+
+def descartar_upload(caminho_temporario):
+    try:
+        os.remove(caminho_temporario)
+    except FileNotFoundError:
+        pass
+
+
+# -------- Objetos por conteúdo + visão por CNPJ/ano/mês --------
+# Cada conteúdo é gravado uma vez só, em _objetos/ab/cd/<sha256>. A árvore
+# <cnpj>/<ano>/<mes>/<nome> que o app navega continua existindo, com hard links
+# para o objeto (ou cópia, se o sistema de arquivos não permitir link).
+# Um objeto sem nenhum link na árvore (st_nlink == 1) é lixo: coletar_objetos_orfaos.
+def caminho_objeto(hash_arquivo):
+    return os.path.join(PASTA_OBJETOS, hash_arquivo[:2], hash_arquivo[2:4], hash_arquivo)
+
+
+def _hash_arquivo(caminho, tamanho_bloco=TAMANHO_BLOCO):
+    hasher = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            hasher.update(bloco)
+    return hasher.hexdigest()
+
+
+def _mesmo_conteudo(caminho, objeto, hash_arquivo):
+    try:
+        if os.path.samefile(caminho, objeto):
+            return True
+    except OSError:
+        return False
+    return _hash_arquivo(caminho) == hash_arquivo
+
+
+def _nome_alternativo(nome_arquivo, n):
+    # "nota.pdf" -> "nota (2).pdf"
+    base, ext = os.path.splitext(nome_arquivo)
+    return f"{base} ({n}){ext}"
+
+
+def _vincular(objeto, destino):
+    # Cria o nome na visão sem sobrescrever nada: FileExistsError se já existe
+    try:
+        os.link(objeto, destino)
+        return
+    except (FileExistsError, FileNotFoundError):
+        raise
+    except OSError:
+        pass
+    # Sem hard link (FAT, outro volume, limite de links): cópia num temporário e
+    # rename; aqui a checagem de nome existente não é atômica como o link
+    if os.path.exists(destino):
+        raise FileExistsError(destino)
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(destino), suffix=".parcial")
+    try:
+        with os.fdopen(descritor, "wb") as saida, open(objeto, "rb") as entrada:
+            shutil.copyfileobj(entrada, saida, TAMANHO_BLOCO)
+        os.replace(temporario, destino)
+    finally:
+        descartar_upload(temporario)
+
+
+def _publicar(origem, pasta, nome_arquivo, hash_arquivo):
+    # Mesmo nome com outro conteúdo não sobrescreve: vira "nome (2).ext"
+    n = 1
+    nome = nome_arquivo
+    while True:
+        caminho_arquivo = os.path.join(pasta, nome)
+        try:
+            _vincular(origem, caminho_arquivo)
+            return caminho_arquivo
+        except FileExistsError:
+            if _mesmo_conteudo(caminho_arquivo, origem, hash_arquivo):
+                return caminho_arquivo
+        n += 1
+        nome = _nome_alternativo(nome_arquivo, n)
+
+
+def guardar_upload(caminho_temporario, hash_arquivo, nome_arquivo, cnpj, data_str):
+    # Publica documentos_armazenados/<cnpj>/<ano>/<mes>/<nome> apontando para o
+    # objeto do conteúdo; o temporário vira o objeto se ele ainda não existe.
+    # Sem temporário (None) só publica um objeto que já existe; se não existe, None.
     try:
         data = pd.to_datetime(data_str)
     except:
@@ -11,19 +133,318 @@ def salvar_arquivo_em_nuvem(arquivo, nome_arquivo, cnpj, data_str):
 
     ano = str(data.year)
     mes = str(data.month).zfill(2)
-    caminho = os.path.join("documentos_armazenados", cnpj, ano, mes)
+    caminho = os.path.join(PASTA_DOCUMENTOS, cnpj, ano, mes)
     os.makedirs(caminho, exist_ok=True)
 
-    caminho_arquivo = os.path.join(caminho, nome_arquivo)
-    with open(caminho_arquivo, "wb") as f:
-        f.write(arquivo.read())
+    objeto = caminho_objeto(hash_arquivo)
+    os.makedirs(os.path.dirname(objeto), exist_ok=True)
+    caminho_arquivo = None
+    if os.path.exists(objeto):
+        try:
+            caminho_arquivo = _publicar(objeto, caminho, nome_arquivo, hash_arquivo)
+        except FileNotFoundError:
+            pass  # a coleta de órfãos levou o objeto agora há pouco: vale o nosso
 
+    if caminho_arquivo is not None:
+        if caminho_temporario:
+            descartar_upload(caminho_temporario)
+    elif caminho_temporario is None:
+        return None
+    else:
+        # Primeiro o link da visão, depois o rename para o objeto: o conteúdo nunca
+        # fica com um link só, que a coleta de órfãos apagaria
+        caminho_arquivo = _publicar(caminho_temporario, caminho, nome_arquivo, hash_arquivo)
+        os.replace(caminho_temporario, objeto)
+
+    # Conteúdo já indexado (outro nome, ou reenvio) mantém a data da nota; senão
+    # fica a do envio até o processamento trazer a de emissão (datar_documento)
+    data_nota = data_documento(cnpj, hash_arquivo) or data.strftime("%Y-%m-%d")
+    _indexar(cnpj, caminho_arquivo, ano, mes, os.path.getsize(caminho_arquivo), hash_arquivo, data_nota)
     return caminho_arquivo
 
+
+def _coletar_objetos(hashes):
+    # Só os objetos de arquivos que acabaram de sair da árvore, sem varrer _objetos
+    for hash_arquivo in set(hashes):
+        if not hash_arquivo:
+            continue
+        objeto = caminho_objeto(hash_arquivo)
+        try:
+            if os.stat(objeto).st_nlink == 1:
+                os.remove(objeto)
+        except FileNotFoundError:
+            pass
+
+
+def coletar_objetos_orfaos():
+    # Apaga objetos que nenhum arquivo da árvore referencia mais. -> (apagados, bytes liberados)
+    apagados = liberados = 0
+    if not os.path.isdir(PASTA_OBJETOS):
+        return apagados, liberados
+    for raiz, _, arquivos in os.walk(PASTA_OBJETOS):
+        for nome in arquivos:
+            caminho = os.path.join(raiz, nome)
+            try:
+                info = os.stat(caminho)
+                if info.st_nlink > 1:
+                    continue
+                os.remove(caminho)
+            except FileNotFoundError:
+                continue
+            apagados += 1
+            liberados += info.st_size
+    return apagados, liberados
+
+
+def salvar_arquivo_em_nuvem(arquivo, nome_arquivo, cnpj, data_str):
+    temporario, hash_arquivo, _ = receber_upload(arquivo)
+    return guardar_upload(temporario, hash_arquivo, nome_arquivo, cnpj, data_str)
+
+# -------- Índice dos arquivos (tabela arquivos do banco) --------
+# Toda gravação e exclusão passa por aqui; a árvore no disco só é varrida por
+# reconciliar_indice, para arquivos mexidos por fora do app.
+def _indexar(cnpj, caminho, ano, mes, tamanho, hash_arquivo, data_documento):
+    conn = conectar()
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO arquivos (CNPJ, Caminho, Nome, Ano, Mes, Tamanho, Hash, Data_Documento, Data_Envio)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now', 'localtime'))
+        """, (cnpj, caminho, os.path.basename(caminho), ano, mes, tamanho, hash_arquivo, data_documento))
+
+
+def data_documento(cnpj, hash_arquivo):
+    c = conectar().cursor()
+    c.execute("SELECT Data_Documento FROM arquivos WHERE CNPJ = ? AND Hash = ? AND Data_Documento IS NOT NULL LIMIT 1",
+              (cnpj, hash_arquivo))
+    linha = c.fetchone()
+    return linha[0] if linha else None
+
+
+def datar_documento(cnpj, hash_arquivo, data):
+    # Data de emissão da nota (dhEmi do XML, data do DANFE) em todos os nomes deste
+    # conteúdo; sem data legível continua a do envio
+    data = normalizar_data(data)
+    if not data:
+        return
+    conn = conectar()
+    with conn:
+        conn.execute("UPDATE arquivos SET Data_Documento = ? WHERE CNPJ = ? AND Hash = ?",
+                     (data[:10], cnpj, hash_arquivo))
+
+
+def _filtros_arquivos(cnpj, ano=None, mes=None, data_ini=None, data_fim=None):
+    condicoes = ["CNPJ = ?"]
+    params = [cnpj]
+    if ano:
+        condicoes.append("Ano = ?")
+        params.append(ano)
+    if mes:
+        condicoes.append("Mes = ?")
+        params.append(mes)
+    # Período em dias fechados: [data_ini 00:00:00, data_fim + 1 dia)
+    if data_ini:
+        condicoes.append("Data_Envio >= ?")
+        params.append(data_ini.strftime("%Y-%m-%d"))
+    if data_fim:
+        condicoes.append("Data_Envio < ?")
+        params.append((data_fim + timedelta(days=1)).strftime("%Y-%m-%d"))
+    return " WHERE " + " AND ".join(condicoes), params
+
+
 def verificar_arquivo_existente(nome_arquivo, cnpj):
-    import os
-    base_path = os.path.join("documentos_armazenados", cnpj)
-    for root, _, files in os.walk(base_path):
-        if nome_arquivo in files:
-            return True
-    return False
+    c = conectar().cursor()
+    c.execute("SELECT 1 FROM arquivos WHERE CNPJ = ? AND Nome = ? LIMIT 1", (cnpj, nome_arquivo))
+    return c.fetchone() is not None
+
+
+def caminho_guardado(cnpj, hash_arquivo, nome_arquivo=None):
+    # Onde este conteúdo já está na árvore do CNPJ (ou None se não está mais);
+    # com nome_arquivo, só se estiver guardado com esse nome
+    c = conectar().cursor()
+    if nome_arquivo is None:
+        c.execute("SELECT Caminho FROM arquivos WHERE CNPJ = ? AND Hash = ? LIMIT 1", (cnpj, hash_arquivo))
+    else:
+        c.execute("SELECT Caminho FROM arquivos WHERE CNPJ = ? AND Hash = ? AND Nome = ? LIMIT 1",
+                  (cnpj, hash_arquivo, nome_arquivo))
+    linha = c.fetchone()
+    return linha[0] if linha else None
+
+
+def listar_pastas(cnpj):
+    # -> [(ano, mes, quantidade de arquivos, bytes)], do mais antigo ao mais novo
+    c = conectar().cursor()
+    c.execute("""
+        SELECT Ano, Mes, COUNT(*), TOTAL(Tamanho) FROM arquivos
+        WHERE CNPJ = ? GROUP BY Ano, Mes ORDER BY Ano, Mes
+    """, (cnpj,))
+    return c.fetchall()
+
+
+def listar_arquivos(cnpj, ano=None, mes=None, data_ini=None, data_fim=None):
+    # -> [(caminho, nome, ano, mes, tamanho, data_envio)] em ordem de pasta e nome
+    where, params = _filtros_arquivos(cnpj, ano, mes, data_ini, data_fim)
+    c = conectar().cursor()
+    c.execute(f"SELECT Caminho, Nome, Ano, Mes, Tamanho, Data_Envio FROM arquivos{where} ORDER BY Ano, Mes, Nome", params)
+    return c.fetchall()
+
+
+def pagina_arquivos(cnpj, ano, mes, apos=None, limite=ARQUIVOS_POR_PAGINA):
+    # Uma página de uma pasta por keyset no nome (índice CNPJ, Ano, Mes, Nome):
+    # custo da página, não da posição. -> (linhas, nome para a próxima página ou None)
+    condicoes = "CNPJ = ? AND Ano = ? AND Mes = ?"
+    params = [cnpj, ano, mes]
+    if apos is not None:
+        condicoes += " AND Nome > ?"
+        params.append(apos)
+    c = conectar().cursor()
+    c.execute(f"""
+        SELECT Caminho, Nome, Ano, Mes, Tamanho, Data_Envio FROM arquivos
+        WHERE {condicoes} ORDER BY Nome LIMIT ?
+    """, params + [limite + 1])
+    linhas = c.fetchall()
+    if len(linhas) > limite:
+        return linhas[:limite], linhas[limite - 1][1]
+    return linhas, None
+
+
+def assinatura_pasta(cnpj, ano, mes=None):
+    # Muda a cada arquivo gravado ou apagado na pasta (chave do ZIP em cache)
+    where, params = _filtros_arquivos(cnpj, ano, mes)
+    c = conectar().cursor()
+    c.execute(f"SELECT COUNT(*), TOTAL(Tamanho), MAX(Data_Envio) FROM arquivos{where}", params)
+    return c.fetchone()
+
+
+def _excluir(cnpj, linhas):
+    # linhas: [(caminho, hash)]. Apaga da árvore e do índice e coleta os objetos
+    for caminho, _ in linhas:
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+        try:
+            os.removedirs(os.path.dirname(caminho))  # mês/ano que ficaram vazios
+        except OSError:
+            pass
+    conn = conectar()
+    with conn:
+        conn.executemany("DELETE FROM arquivos WHERE CNPJ = ? AND Caminho = ?", [(cnpj, caminho) for caminho, _ in linhas])
+    _coletar_objetos(h for _, h in linhas)
+    return len(linhas)
+
+
+def excluir_arquivo(cnpj, caminho):
+    c = conectar().cursor()
+    c.execute("SELECT Caminho, Hash FROM arquivos WHERE CNPJ = ? AND Caminho = ?", (cnpj, caminho))
+    return _excluir(cnpj, c.fetchall())
+
+
+def excluir_arquivos(cnpj, ano=None, mes=None, data_ini=None, data_fim=None):
+    # Sem filtro: todos os arquivos do CNPJ. Período pela data de envio. -> quantidade
+    where, params = _filtros_arquivos(cnpj, ano, mes, data_ini, data_fim)
+    c = conectar().cursor()
+    c.execute(f"SELECT Caminho, Hash FROM arquivos{where}", params)
+    return _excluir(cnpj, c.fetchall())
+
+
+def reconciliar_indice(cnpj=None):
+    # Refaz o índice a partir do disco: entra o que está na árvore e não no índice
+    # (ou mudou de tamanho), sai o que está no índice e não existe mais.
+    # -> (indexados, removidos)
+    conn = conectar()
+    filtro, params = (" WHERE CNPJ = ?", (cnpj,)) if cnpj else ("", ())
+    indexados = {
+        (c, caminho): (tamanho, hash_arquivo)
+        for c, caminho, tamanho, hash_arquivo in conn.execute(f"SELECT CNPJ, Caminho, Tamanho, Hash FROM arquivos{filtro}", params)
+    }
+
+    if cnpj:
+        cnpjs = [cnpj]
+    elif os.path.isdir(PASTA_DOCUMENTOS):
+        cnpjs = [d for d in os.listdir(PASTA_DOCUMENTOS) if not d.startswith("_")]
+    else:
+        cnpjs = []
+
+    no_disco = set()
+    novos = []
+    for c in cnpjs:
+        base = os.path.join(PASTA_DOCUMENTOS, c)
+        for raiz, _, nomes in os.walk(base):
+            partes = os.path.relpath(raiz, base).split(os.sep)
+            if len(partes) != 2:
+                continue  # só <ano>/<mes>
+            ano, mes = partes
+            for nome in nomes:
+                if nome.endswith(".parcial"):
+                    continue
+                caminho = os.path.join(raiz, nome)
+                info = os.stat(caminho)
+                no_disco.add((c, caminho))
+                if indexados.get((c, caminho), (None,))[0] == info.st_size:
+                    continue
+                novos.append((
+                    c, caminho, nome, ano, mes, info.st_size, _hash_arquivo(caminho), f"{ano}-{mes}-01",
+                    datetime.fromtimestamp(info.st_mtime).strftime("%Y-%m-%d %H:%M:%S"),
+                ))
+
+    removidos = [chave for chave in indexados if chave not in no_disco]
+    with conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO arquivos (CNPJ, Caminho, Nome, Ano, Mes, Tamanho, Hash, Data_Documento, Data_Envio)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, novos)
+        conn.executemany("DELETE FROM arquivos WHERE CNPJ = ? AND Caminho = ?", removidos)
+    _coletar_objetos(indexados[chave][1] for chave in removidos)
+    return len(novos), len(removidos)
+
+
+# -------- ZIP de um mês ou ano --------
+def exportar_zip(destino, cnpj, ano, mes=None):
+    # Um arquivo por vez, lido em blocos direto para o ZIP em disco: a memória
+    # não depende do tamanho nem da quantidade de arquivos. -> quantidade
+    c = conectar().cursor()
+    where, params = _filtros_arquivos(cnpj, ano, mes)
+    c.execute(f"SELECT Caminho, Nome, Ano, Mes FROM arquivos{where} ORDER BY Ano, Mes, Nome", params)
+    quantidade = 0
+    with zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) as zf:
+        for caminho, nome, ano_arquivo, mes_arquivo in c:
+            compressao = zipfile.ZIP_STORED if nome.lower().endswith(EXTENSOES_SEM_COMPRESSAO) else zipfile.ZIP_DEFLATED
+            try:
+                zf.write(caminho, arcname=f"{ano_arquivo}/{mes_arquivo}/{nome}", compress_type=compressao)
+            except FileNotFoundError:
+                continue  # apagado por fora do app; reconciliar_indice acerta o índice
+            quantidade += 1
+    return quantidade
+
+
+def compactar_pasta(cnpj, filtros):
+    # Trabalho de exportação (exportacao.solicitar_exportacao): ZIP num temporário, devolve o caminho
+    with tempfile.NamedTemporaryFile(delete=False, prefix="arquivos_", suffix=".zip") as tmp:
+        caminho = tmp.name
+    try:
+        exportar_zip(caminho, cnpj, filtros["ano"], filtros.get("mes"))
+    except Exception:
+        os.remove(caminho)
+        raise
+    return caminho
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Armazenamento de documentos")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("coletar-orfaos", help="apaga objetos que nenhum arquivo da árvore referencia")
+    p_indice = sub.add_parser("reconciliar-indice", help="refaz o índice de arquivos do banco a partir do disco")
+    p_indice.add_argument("--cnpj", help="só este CNPJ (padrão: todos)")
+    args = parser.parse_args()
+
+    if args.comando == "reconciliar-indice":
+        from db import criar_tabela
+
+        criar_tabela()
+        indexados, removidos = reconciliar_indice(args.cnpj)
+        print(f"✅ Índice de arquivos: {indexados} arquivo(s) indexado(s), {removidos} entrada(s) sem arquivo removida(s)")
+    elif args.comando == "coletar-orfaos":
+        apagados, liberados = coletar_objetos_orfaos()
+        print(f"🧹 {apagados} objeto(s) órfão(s) apagado(s), {liberados / 1024 / 1024:.1f} MB liberados")
@@ -0,0 +1,97 @@
+# benchmarks/bench_danfe.py
+# Tabela de produtos de DANFEs com camada de texto: leitura pelas coordenadas
+# das palavras (leitor_danfe) x texto corrido + heurística por linhas
+# (extrair_produtos_pdf_livre). Mede páginas por segundo e acerto por item
+# (descrição, quantidade, unitário e total iguais ao gabarito, na ordem).
+#
+# Uso:
+#   python benchmarks/bench_danfe.py [--pasta corpus/] [--quantidade 50] [--semente 1]
+# Com --pasta, lê os PDFs e o gabarito.json gravados por corpus_danfe.py;
+# sem ela, gera o corpus sintético em memória.
+import argparse
+import json
+import os
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fitz
+
+from leitor_danfe import extrair_produtos_danfe_pagina
+from leitor_pdf_imagem import extrair_produtos_pdf_livre
+from corpus_danfe import gerar_corpus
+
+
+def carregar_pasta(pasta):
+    with open(os.path.join(pasta, "gabarito.json"), encoding="utf-8") as f:
+        gabarito = json.load(f)
+    corpus = []
+    for nome in sorted(gabarito):
+        with open(os.path.join(pasta, nome), "rb") as f:
+            corpus.append((nome, f.read(), gabarito[nome]))
+    return corpus
+
+
+def por_coordenadas(doc):
+    # Como em extrair_paginas_pdf: a mesma extração de texto dá o texto corrido e as palavras
+    produtos = []
+    for pagina in doc:
+        textpage = pagina.get_textpage()
+        pagina.get_text(textpage=textpage)
+        produtos.extend(extrair_produtos_danfe_pagina(pagina, textpage) or [])
+    return produtos
+
+
+def por_linhas(doc):
+    return extrair_produtos_pdf_livre("".join(pagina.get_text() for pagina in doc))
+
+
+def mesmo_item(obtido, esperado):
+    return (
+        obtido["Produto"].strip() == esperado["Produto"]
+        and abs(obtido["Quantidade"] - esperado["Quantidade"]) < 1e-6
+        and abs(obtido["Valor Unitário"] - esperado["Valor Unitário"]) < 0.005
+        and abs(obtido["Valor Total"] - esperado["Valor Total"]) < 0.005
+    )
+
+
+def medir(extrator, corpus):
+    paginas = acertos = itens = extraidos = 0
+    segundos = 0.0
+    for _, dados, esperado in corpus:
+        doc = fitz.open(stream=dados, filetype="pdf")
+        inicio = time.perf_counter()
+        obtidos = extrator(doc)
+        segundos += time.perf_counter() - inicio
+        paginas += doc.page_count
+        doc.close()
+
+        itens += len(esperado)
+        extraidos += len(obtidos)
+        acertos += sum(mesmo_item(o, e) for o, e in zip(obtidos, esperado))
+    return paginas, segundos, itens, extraidos, acertos
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pasta")
+    parser.add_argument("--quantidade", type=int, default=50)
+    parser.add_argument("--semente", type=int, default=1)
+    args = parser.parse_args()
+
+    corpus = carregar_pasta(args.pasta) if args.pasta else gerar_corpus(args.quantidade, args.semente)
+    print(f"{len(corpus)} DANFE(s)")
+
+    for nome, extrator in (("heurística por linhas", por_linhas), ("coordenadas", por_coordenadas)):
+        paginas, segundos, itens, extraidos, acertos = medir(extrator, corpus)
+        print(f"\n[{nome}]")
+        print(f"páginas/s:         {paginas / segundos:.0f}  ({paginas} páginas em {segundos:.2f}s)")
+        print(f"itens extraídos:   {extraidos}/{itens}")
+        print(f"itens corretos:    {acertos}/{itens}  ({acertos / itens:.1%})")
+
+
+if __name__ == "__main__":
+    main()
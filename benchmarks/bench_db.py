@@ -0,0 +1,69 @@
+# benchmarks/bench_db.py
+# Inserção linha a linha (inserir_produto) x em lote (inserir_produtos_lote).
+#
+# Uso:
+#   python benchmarks/bench_db.py [linhas]
+# Roda num diretório temporário; o banco.db do projeto não é tocado.
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import db
+
+
+def gerar_produtos(n, cnpj, origem):
+    return [
+        {
+            "Empresa": f"FORNECEDOR {i % 37}",
+            "CNPJ": cnpj,
+            "Produto": f"PRODUTO {i}",
+            "Quantidade": float(i % 9 + 1),
+            "Valor Unitário": 1.37 * (i % 50 + 1),
+            "Valor Total": 1.37 * (i % 50 + 1) * (i % 9 + 1),
+            "Origem": origem,
+            "Data": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}T10:00:00-03:00",
+        }
+        for i in range(n)
+    ]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    with tempfile.TemporaryDirectory() as pasta:
+        os.chdir(pasta)
+        db.criar_tabela()
+
+        linha_a_linha = gerar_produtos(n, "11111111000111", "XML")
+        em_lote = gerar_produtos(n, "22222222000122", "XML")
+
+        # Os prints por linha do inserir_produto não entram na medição de I/O do terminal
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            for p in linha_a_linha:
+                db.inserir_produto(p)
+            t_linha = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            inseridos, ignorados = db.inserir_produtos_lote(em_lote)
+            t_lote = time.perf_counter() - inicio
+
+            # Reenvio do mesmo lote: tudo deve cair no OR IGNORE
+            reinseridos, reignorados = db.inserir_produtos_lote(em_lote)
+
+        os.chdir(RAIZ)
+
+    print(f"{n} linhas")
+    print(f"inserir_produto       {n / t_linha:12,.0f} linhas/s   ({t_linha:.3f} s)")
+    print(f"inserir_produtos_lote {n / t_lote:12,.0f} linhas/s   ({t_lote:.3f} s)   {t_linha / t_lote:.0f}x")
+    print(f"lote: {inseridos} inseridas / {ignorados} ignoradas; reenvio: {reinseridos} / {reignorados}")
+
+
+if __name__ == "__main__":
+    main()
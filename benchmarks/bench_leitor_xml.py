@@ -0,0 +1,140 @@
+# benchmarks/bench_leitor_xml.py
+# Compara o leitor original (ET.parse da árvore inteira, primeira infNFe) com
+# parse_nfe e com o extrator acelerado (parse_nfe_rapido).
+#
+# Uso:
+#   python benchmarks/bench_leitor_xml.py                 # NF-e sintéticas
+#   python benchmarks/bench_leitor_xml.py pasta_com_xmls  # XMLs reais
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import leitor_xml
+from leitor_xml import parse_nfe, parse_nfe_rapido, LET
+
+NS = "http://www.portalfiscal.inf.br/nfe"
+
+
+def parse_nfe_original(xml_file):
+    # O leitor como era antes do streaming, mantido aqui só como referência de tempo
+    xml_file.seek(0)
+    root = ET.parse(xml_file).getroot()
+    ns = {"ns": NS}
+
+    infNFe = root.find(".//ns:infNFe", ns)
+    if infNFe is None:
+        return []
+
+    emit = infNFe.find("ns:emit", ns)
+    emitente = emit.find("ns:xNome", ns).text.strip() if emit is not None else "Desconhecida"
+    cnpj = emit.find("ns:CNPJ", ns).text.strip() if emit is not None else ""
+    data_emissao = infNFe.findtext("ns:ide/ns:dhEmi", default="", namespaces=ns)
+
+    produtos = []
+    for det in infNFe.findall("ns:det", ns):
+        nome = det.findtext("ns:prod/ns:xProd", default="", namespaces=ns)
+        qtd_str = det.findtext("ns:prod/ns:qCom", default="0", namespaces=ns)
+        valor_unit_str = det.findtext("ns:prod/ns:vUnCom", default="0", namespaces=ns)
+        valor_total_str = det.findtext("ns:prod/ns:vProd", default="0", namespaces=ns)
+
+        try:
+            qtd = float(qtd_str.replace(",", "."))
+            valor_unit = float(valor_unit_str.replace(",", "."))
+            valor_total = float(valor_total_str.replace(",", "."))
+        except Exception:
+            continue
+
+        produtos.append({
+            "Produto": nome,
+            "Quantidade": qtd,
+            "Valor Unitário": valor_unit,
+            "Valor Total": valor_total,
+            "CNPJ": cnpj,
+            "Empresa": emitente,
+            "Data": data_emissao,
+            "Origem": "XML"
+        })
+
+    return produtos
+
+
+def gerar_nfe(itens=30, numero=1):
+    dets = "".join(
+        f'<det nItem="{k}"><prod><cProd>{k}</cProd><xProd>PRODUTO {numero}-{k}</xProd>'
+        f'<NCM>22021000</NCM><CFOP>5102</CFOP><uCom>UN</uCom><qCom>{k}.0000</qCom>'
+        f'<vUnCom>{k * 1.37:.10f}</vUnCom><vProd>{k * k * 1.37:.2f}</vProd></prod>'
+        f'<imposto><ICMS><ICMS00><orig>0</orig><CST>00</CST></ICMS00></ICMS></imposto></det>'
+        for k in range(1, itens + 1)
+    )
+    nfe = (
+        f'<NFe xmlns="{NS}"><infNFe Id="NFe3524051234567800019055001{numero:09d}1000000019" versao="4.00">'
+        f'<ide><cUF>35</cUF><nNF>{numero}</nNF><dhEmi>2024-05-10T10:15:00-03:00</dhEmi></ide>'
+        f'<emit><CNPJ>12345678000190</CNPJ><xNome> FORNECEDOR EXEMPLO LTDA </xNome></emit>'
+        f'<dest><CNPJ>98765432000110</CNPJ><xNome>CLIENTE</xNome></dest>{dets}'
+        f'<total><ICMSTot><vNF>0.00</vNF></ICMSTot></total></infNFe></NFe>'
+    )
+    return f'<nfeProc xmlns="{NS}" versao="4.00">{nfe}<protNFe/></nfeProc>'.encode()
+
+
+def carregar_documentos(pasta):
+    docs = []
+    for raiz, _, arquivos in os.walk(pasta):
+        for nome in arquivos:
+            if nome.lower().endswith(".xml"):
+                with open(os.path.join(raiz, nome), "rb") as f:
+                    docs.append(f.read())
+    return docs
+
+
+def medir(funcao, docs, repeticoes, **kwargs):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        for d in docs:
+            funcao(BytesIO(d), **kwargs)
+    return (time.perf_counter() - inicio) / (repeticoes * len(docs))
+
+
+def main():
+    if len(sys.argv) > 1:
+        docs = carregar_documentos(sys.argv[1])
+        repeticoes = 3
+    else:
+        docs = [gerar_nfe(itens, n) for n, itens in enumerate((5, 30, 120, 300), start=1)]
+        # Comentário antes do elemento raiz (irmão da raiz na leitura incremental)
+        docs.append(b"<?xml version='1.0' encoding='UTF-8'?>\n<!-- exportado pelo ERP -->\n" + gerar_nfe(30, 5))
+        repeticoes = 300
+
+    if not docs:
+        print("Nenhum XML encontrado.")
+        return
+
+    variantes = [("parse_nfe", parse_nfe, {})]
+    variantes.append(("tag-dispatch (ElementTree)", parse_nfe_rapido, {"usar_lxml": False}))
+    if LET is not None:
+        variantes.append(("XPath compilado (lxml)", parse_nfe_rapido, {"usar_lxml": True}))
+
+    # As linhas precisam ser idênticas às do parse_nfe antes de medir qualquer coisa,
+    # também na leitura incremental que os arquivos grandes usam (limite zerado)
+    limite = leitor_xml.LIMITE_ARVORE_COMPLETA
+    for d in docs:
+        esperado = parse_nfe(BytesIO(d))
+        for nome, funcao, kwargs in variantes:
+            for leitor_xml.LIMITE_ARVORE_COMPLETA in (limite, 0):
+                obtido = funcao(BytesIO(d), **kwargs)
+                assert repr(obtido) == repr(esperado), f"Divergência em {nome}"
+    leitor_xml.LIMITE_ARVORE_COMPLETA = limite
+
+    base = medir(parse_nfe_original, docs, repeticoes)
+    print(f"{len(docs)} documento(s), {repeticoes} repetição(ões)")
+    print(f"{'ET.parse (original)':<30} {base * 1e6:10.1f} µs/doc   1.00x")
+    for nome, funcao, kwargs in variantes:
+        t = medir(funcao, docs, repeticoes, **kwargs)
+        print(f"{nome:<30} {t * 1e6:10.1f} µs/doc   {base / t:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
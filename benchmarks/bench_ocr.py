@@ -0,0 +1,109 @@
+# benchmarks/bench_ocr.py
+# OCR de um PDF escaneado por motor (tesserocr em processo x pytesseract com um
+# processo tesseract por imagem), com as páginas em sequência (1 worker) e em
+# paralelo. Também mede só a rasterização em memória, que roda no thread principal.
+#
+# Uso:
+#   python benchmarks/bench_ocr.py [arquivo.pdf] [--paginas N] [--dpi 300] [--workers N]
+#                                  [--backend tesserocr --backend pytesseract]
+# Sem arquivo, gera um "DANFE escaneado" sintético (páginas só com imagem).
+# Requer o tesseract com o idioma por; motores não instalados são pulados.
+# O cache de OCR fica desligado durante a medição.
+import argparse
+import os
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import fitz
+
+import leitor_pdf_imagem
+from leitor_pdf_imagem import ocr_paginas, ocr_imagem, rasterizar_pagina, numero_workers_ocr
+from cache_ocr import cache_ocr
+from ocr import BACKENDS, usar_backend
+
+
+def gerar_pdf_escaneado(paginas):
+    # Escreve um DANFE de texto, rasteriza e monta outro PDF só com as imagens
+    texto = fitz.open()
+    for p in range(paginas):
+        pagina = texto.new_page()
+        linhas = ["DANFE - DOCUMENTO AUXILIAR DA NOTA FISCAL ELETRÔNICA",
+                  "FORNECEDOR EXEMPLO LTDA  CNPJ 12.345.678/0001-90  EMISSÃO 15/03/2024",
+                  "DESCRIÇÃO DO PRODUTO        UN   QTD   V.UNIT   V.TOTAL"]
+        linhas += [f"PRODUTO {p * 40 + i} CAIXA 12X1L    UN   {i + 1},00   {i + 2},50   {(i + 1) * (i + 2.5):.2f}"
+                   for i in range(40)]
+        pagina.insert_text((40, 50), "\n".join(linhas), fontsize=9)
+
+    escaneado = fitz.open()
+    for pagina in texto:
+        pix = pagina.get_pixmap(dpi=200)
+        nova = escaneado.new_page(width=pagina.rect.width, height=pagina.rect.height)
+        nova.insert_image(nova.rect, pixmap=pix)
+    return escaneado.tobytes()
+
+
+def medir(funcao, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcao(*args, **kwargs)
+    return time.perf_counter() - inicio, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("arquivo", nargs="?")
+    parser.add_argument("--paginas", type=int, default=8)
+    parser.add_argument("--dpi", type=int, default=leitor_pdf_imagem.OCR_DPI)
+    parser.add_argument("--workers", type=int, default=numero_workers_ocr())
+    parser.add_argument("--backend", action="append", choices=BACKENDS)
+    args = parser.parse_args()
+
+    if args.arquivo:
+        with open(args.arquivo, "rb") as f:
+            dados = f.read()
+    else:
+        dados = gerar_pdf_escaneado(args.paginas)
+
+    cache_ocr.limite_bytes = 0
+
+    doc = fitz.open(stream=dados, filetype="pdf")
+    print(f"{doc.page_count} página(s), {args.dpi} dpi, {args.workers} worker(s)")
+
+    t_raster, _ = medir(lambda: [rasterizar_pagina(p, dpi=args.dpi) for p in doc])
+    print(f"rasterização (todas as páginas): {t_raster:.2f}s")
+
+    # Recorte pequeno: aqui o custo é quase todo inicialização (processo + idioma)
+    recorte = rasterizar_pagina(doc[0], dpi=args.dpi).crop((0, 0, 800, 200))
+
+    textos = {}
+    for backend in args.backend or BACKENDS:
+        try:
+            usar_backend(backend)
+        except ImportError as e:
+            print(f"\n[{backend}] pulado: {e}")
+            continue
+        leitor_pdf_imagem.versao_tesseract.cache_clear()
+
+        ocr_imagem(recorte)  # aquece (carrega o idioma na thread, se for o caso)
+        t_recorte, _ = medir(lambda: [ocr_imagem(recorte) for _ in range(10)])
+        t_serial, textos_serial = medir(ocr_paginas, doc, dpi=args.dpi, max_workers=1)
+        t_paralelo, textos_paralelo = medir(ocr_paginas, doc, dpi=args.dpi, max_workers=args.workers)
+        assert textos_serial == textos_paralelo, "OCR em paralelo mudou o texto/ordem das páginas"
+        textos[backend] = textos_serial
+
+        print(f"\n[{backend}]")
+        print(f"recorte pequeno (por chamada):   {t_recorte / 10 * 1000:.0f}ms")
+        print(f"OCR sequencial:                  {t_serial:.2f}s")
+        print(f"OCR paralelo:                    {t_paralelo:.2f}s  ({t_serial / t_paralelo:.1f}x)")
+    doc.close()
+
+    if len(textos) == 2:
+        a, b = textos.values()
+        iguais = sum(x.strip() == y.strip() for x, y in zip(a, b))
+        print(f"\npáginas com texto idêntico entre os motores: {iguais}/{len(a)}")
+
+
+if __name__ == "__main__":
+    main()
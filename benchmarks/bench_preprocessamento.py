@@ -0,0 +1,87 @@
+# benchmarks/bench_preprocessamento.py
+# Foto de celular (12 MP) direto no OCR x depois do pré-processamento
+# (resolução normalizada, cinza, binarização, inclinação e margens).
+#
+# Uso:
+#   python benchmarks/bench_preprocessamento.py [foto.jpg ...]
+# Sem arquivo, gera uma foto sintética 3000x4000: DANFE inclinado 2,5° sobre
+# fundo escuro, com ruído. Sem o tesseract instalado, mede só o pré-processamento.
+# O cache de OCR fica desligado durante a medição.
+import os
+import sys
+import time
+from io import BytesIO
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import fitz
+import numpy as np
+from PIL import Image
+
+from leitor_pdf_imagem import preprocessar_imagem, ocr_imagem
+from cache_ocr import cache_ocr
+
+
+def gerar_foto_sintetica():
+    doc = fitz.open()
+    pagina = doc.new_page()
+    linhas = ["DANFE - DOCUMENTO AUXILIAR DA NOTA FISCAL ELETRÔNICA",
+              "FORNECEDOR EXEMPLO LTDA  CNPJ 12.345.678/0001-90  EMISSÃO 15/03/2024",
+              "DESCRIÇÃO DO PRODUTO        UN   QTD   V.UNIT   V.TOTAL"]
+    linhas += [f"PRODUTO {i} CAIXA 12X1L    UN   {i + 1},00   {i + 2},50" for i in range(50)]
+    pagina.insert_text((40, 50), "\n".join(linhas), fontsize=9)
+    pix = pagina.get_pixmap(dpi=330)
+
+    papel = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    papel = papel.rotate(2.5, resample=Image.BICUBIC, expand=True, fillcolor=(255, 255, 255))
+    papel = papel.resize((2700, round(2700 * papel.height / papel.width)))
+
+    foto = Image.new("RGB", (3000, 4000), (90, 80, 70))
+    foto.paste(papel, (150, 60))
+    ruido = np.random.default_rng(0).integers(-25, 25, (4000, 3000, 1))
+    foto = Image.fromarray(np.clip(np.asarray(foto, dtype=np.int16) + ruido, 0, 255).astype(np.uint8))
+
+    buffer = BytesIO()
+    foto.save(buffer, "JPEG", quality=90, dpi=(72, 72))
+    return buffer.getvalue()
+
+
+def medir(funcao, *args):
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    return time.perf_counter() - inicio, resultado
+
+
+def main():
+    if len(sys.argv) > 1:
+        fotos = []
+        for caminho in sys.argv[1:]:
+            with open(caminho, "rb") as f:
+                fotos.append((os.path.basename(caminho), f.read()))
+    else:
+        fotos = [("sintética 12 MP", gerar_foto_sintetica())]
+
+    cache_ocr.limite_bytes = 0
+
+    for nome, dados in fotos:
+        original = Image.open(BytesIO(dados))
+        original.load()
+        t_prep, tratada = medir(preprocessar_imagem, original)
+        print(f"\n{nome}: {original.size[0]}x{original.size[1]} -> {tratada.size[0]}x{tratada.size[1]}")
+        print(f"pré-processamento:        {t_prep:.2f}s")
+
+        try:
+            t_bruta, texto_bruto = medir(ocr_imagem, original)
+            t_tratada, texto_tratado = medir(ocr_imagem, tratada)
+        except Exception as e:
+            print(f"OCR não medido ({type(e).__name__}: {e})")
+            continue
+
+        print(f"OCR da foto original:     {t_bruta:.2f}s  ({len(texto_bruto.split())} palavras)")
+        print(f"OCR pré-processada:       {t_tratada:.2f}s  ({len(texto_tratado.split())} palavras)")
+        print(f"total com pré-processo:   {t_prep + t_tratada:.2f}s  ({t_bruta / (t_prep + t_tratada):.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
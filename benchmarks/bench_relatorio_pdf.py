@@ -0,0 +1,98 @@
+# benchmarks/bench_relatorio_pdf.py
+# Tempo do relatório PDF x número de linhas: gerar_pdf_relatorio (tabelas em
+# blocos) contra o layout antigo (uma Table só, Paragraph em todo produto).
+#
+# Uso:
+#   python benchmarks/bench_relatorio_pdf.py [linhas ...] [--antigo-ate N]
+# O layout antigo só roda até N linhas (padrão 5000); acima disso leva minutos.
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import pandas as pd
+
+from relatorios import gerar_pdf_relatorio, formatar_valor, COLUNAS_PDF, LARGURAS_PDF
+
+
+def gerar_df(n):
+    return pd.DataFrame({
+        "Empresa": [f"FORNECEDOR {i % 37}" for i in range(n)],
+        "CNPJ": "11111111000111",
+        "Produto": [
+            f"PRODUTO {i}" if i % 4 else f"PRODUTO {i} COM DESCRIÇÃO LONGA QUE QUEBRA LINHA NA COLUNA"
+            for i in range(n)
+        ],
+        "Quantidade": [float(i % 9 + 1) for i in range(n)],
+        "Valor Unitário": [1.37 * (i % 50 + 1) for i in range(n)],
+        "Valor Total": [1.37 * (i % 50 + 1) * (i % 9 + 1) for i in range(n)],
+        "Origem": ["XML" if i % 3 else "PDF" for i in range(n)],
+        "Data": pd.to_datetime([f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}" for i in range(n)]),
+    })
+
+
+def pdf_tabela_unica(df):
+    # Layout anterior: uma Table com todas as linhas
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib import colors
+
+    df = df.copy()
+    df["Valor Total"] = df["Valor Total"].map(formatar_valor)
+    df["Valor Unitário"] = df["Valor Unitário"].map(formatar_valor)
+    estilo_produto = ParagraphStyle(name="Produto", fontSize=10, leading=12)
+
+    dados = [COLUNAS_PDF]
+    for linha in df[COLUNAS_PDF].astype(str).values.tolist():
+        linha[0] = Paragraph(linha[0], estilo_produto)
+        dados.append(linha)
+
+    tabela = Table(dados, colWidths=LARGURAS_PDF, repeatRows=1)
+    tabela.setStyle(TableStyle([('GRID', (0, 0), (-1, -1), 0.5, colors.grey)]))
+    buffer = BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4).build([tabela])
+    return buffer
+
+
+def medir(funcao, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcao(*args, **kwargs)
+    return time.perf_counter() - inicio, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("linhas", nargs="*", type=int, default=[1000, 5000, 20000])
+    parser.add_argument("--antigo-ate", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{'linhas':>8} {'blocos (s)':>11} {'antigo (s)':>11} {'PDF (KB)':>9}")
+    for n in args.linhas:
+        df = gerar_df(n)
+        original = df.copy()
+
+        resumo_empresas = df.groupby("Empresa")["Valor Total"].sum().items()
+        resumo_mensal = [
+            (mes, len(grupo), grupo["Valor Total"].sum())
+            for mes, grupo in df.groupby(df["Data"].dt.strftime("%Y-%m"))
+        ]
+        t_novo, pdf = medir(
+            gerar_pdf_relatorio, df, cnpj="11111111000111",
+            resumo_empresas=list(resumo_empresas), resumo_mensal=resumo_mensal
+        )
+        assert df.equals(original), "gerar_pdf_relatorio alterou o DataFrame"
+
+        t_antigo = "-"
+        if n <= args.antigo_ate:
+            t_antigo = f"{medir(pdf_tabela_unica, df)[0]:.2f}"
+
+        print(f"{n:>8} {t_novo:>11.2f} {t_antigo:>11} {len(pdf.getvalue()) // 1024:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# benchmarks/corpus_danfe.py
+# Corpus sintético de DANFEs em PDF (com camada de texto) e o gabarito dos
+# produtos de cada um, para medir os extratores de PDF.
+#
+# Variações por arquivo: tamanho da fonte, folga das colunas, títulos em uma
+# ou duas linhas ("VALOR UNIT" / "VALOR\nUNIT"), descrições que quebram linha,
+# milhar com ponto, colunas extras (ICMS/IPI) e notas de várias páginas com o
+# cabeçalho da tabela repetido.
+#
+# Uso:
+#   python benchmarks/corpus_danfe.py pasta_destino [--quantidade 50] [--semente 1]
+# Grava danfe_NNN.pdf e gabarito.json na pasta.
+import argparse
+import json
+import os
+import random
+
+import fitz
+
+DESCRICOES = [
+    "ARROZ TIPO 1 PACOTE 5KG", "FEIJAO CARIOCA 1KG", "OLEO DE SOJA 900ML",
+    "ACUCAR REFINADO 1KG", "CAFE TORRADO E MOIDO 500G", "LEITE UHT INTEGRAL 1L CAIXA COM 12 UNIDADES",
+    "DETERGENTE LIQUIDO NEUTRO 500ML", "PAPEL HIGIENICO FOLHA DUPLA 12 ROLOS",
+    "SABAO EM PO 1KG", "MACARRAO ESPAGUETE 500G", "FARINHA DE TRIGO TIPO 1 1KG",
+    "REFRIGERANTE COLA 2L FARDO COM 6", "AGUA MINERAL SEM GAS 500ML", "BISCOITO CREAM CRACKER 400G",
+    "MOLHO DE TOMATE TRADICIONAL SACHE 340G", "SAL REFINADO IODADO 1KG",
+]
+UNIDADES = ["UN", "KG", "CX", "LT", "PC", "FD"]
+
+
+def _br(valor, casas):
+    # 1234.5 -> "1.234,50"
+    texto = f"{valor:,.{casas}f}"
+    return texto.replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def gerar_itens(rng, quantidade):
+    itens = []
+    for i in range(quantidade):
+        descricao = rng.choice(DESCRICOES)
+        if rng.random() < 0.3:
+            descricao += f" LOTE {rng.randint(100, 999)}"
+        qtd = rng.choice([1, 2, 3, 5, 10, 12, 24, 100, 1500]) * 1.0
+        unit = round(rng.uniform(0.5, 900), 2)
+        itens.append({
+            "codigo": f"{rng.randint(1000, 99999)}",
+            "Produto": descricao,
+            "Quantidade": qtd,
+            "Valor Unitário": unit,
+            "Valor Total": round(qtd * unit, 2),
+            "unidade": rng.choice(UNIDADES),
+        })
+    return itens
+
+
+def _colunas_layout(rng):
+    # (campo, título); a descrição fica com a largura que sobrar
+    sep = "\n" if rng.random() < 0.5 else " "
+    colunas = [
+        ("codigo", "CÓDIGO" + sep + "PRODUTO"),
+        ("descricao", "DESCRIÇÃO DO PRODUTO / SERVIÇO"),
+        ("ncm", "NCM/SH"),
+        ("cst", "O/CST"),
+        ("cfop", "CFOP"),
+        ("unidade", "UN"),
+        ("quantidade", "QUANT"),
+        ("valor_unit", "VALOR" + sep + "UNIT"),
+        ("valor_total", "VALOR" + sep + "TOTAL"),
+    ]
+    if rng.random() < 0.6:
+        colunas += [("bc", "B.CÁLC" + sep + "ICMS"), ("icms", "VALOR" + sep + "ICMS"), ("ipi", "VALOR" + sep + "IPI")]
+    return colunas
+
+
+def _valores(item, casas_unit):
+    return {
+        "codigo": item["codigo"],
+        "ncm": "21069090",
+        "cst": "0102",
+        "cfop": "5102",
+        "unidade": item["unidade"],
+        "quantidade": _br(item["Quantidade"], 4),
+        "valor_unit": _br(item["Valor Unitário"], casas_unit),
+        "valor_total": _br(item["Valor Total"], 2),
+        "bc": "0,00",
+        "icms": "0,00",
+        "ipi": "0,00",
+    }
+
+
+def gerar_danfe(rng, itens):
+    fonte = rng.choice([5.5, 6.0, 6.5, 7.0])
+    casas_unit = rng.choice([2, 4])
+    folga = rng.choice([6, 10, 16])
+    colunas = _colunas_layout(rng)
+    valores = [_valores(item, casas_unit) for item in itens]
+
+    # Largura de cada célula: o maior entre título e valores, mais uma folga
+    larguras = []
+    for campo, titulo in colunas:
+        if campo == "descricao":
+            larguras.append(None)
+            continue
+        textos = titulo.split("\n") + [v[campo] for v in valores]
+        larguras.append(max(fitz.get_text_length(t, fontsize=fonte) for t in textos) + folga)
+    titulo_desc = fitz.get_text_length(colunas[1][1], fontsize=fonte) + folga
+    larguras[1] = max(120, titulo_desc, 595 - 40 - sum(l for l in larguras if l))
+
+    doc = fitz.open()
+    restantes = list(zip(itens, valores))
+    numero = 0
+    while restantes or numero == 0:
+        numero += 1
+        pagina = doc.new_page(width=max(595, 40 + sum(larguras)))
+        y = 30
+        if numero == 1:
+            pagina.insert_text((20, y), "DANFE", fontsize=12)
+            pagina.insert_text((20, y + 16), "FORNECEDOR EXEMPLO DISTRIBUIDORA LTDA", fontsize=9)
+            pagina.insert_text((20, y + 28), "CNPJ 12.345.678/0001-90   DATA DA EMISSÃO 15/03/2024", fontsize=8)
+            y += 60
+        pagina.insert_text((20, y), "DADOS DOS PRODUTOS / SERVIÇOS", fontsize=fonte + 0.5)
+        y += fonte * 2
+
+        # Cabeçalho: cada título é um objeto de texto próprio, centralizado na célula
+        altura_cab = fonte * 3
+        x = 20
+        for (campo, titulo), largura in zip(colunas, larguras):
+            linhas = titulo.split("\n")
+            for i, linha in enumerate(linhas):
+                w = fitz.get_text_length(linha, fontsize=fonte)
+                yl = y + altura_cab / 2 + (i - (len(linhas) - 1) / 2) * fonte * 1.15 + fonte * 0.35
+                pagina.insert_text((x + (largura - w) / 2, yl), linha, fontsize=fonte)
+            pagina.draw_rect(fitz.Rect(x, y, x + largura, y + altura_cab), width=0.3)
+            x += largura
+        y += altura_cab + fonte * 1.3
+
+        # Linhas de produto
+        limite = 842 - 60
+        while restantes and y < limite:
+            item, valores_item = restantes.pop(0)
+            largura_desc = larguras[1] - 4
+            palavras = item["Produto"].split()
+            linhas_desc, atual = [], ""
+            for palavra in palavras:
+                teste = f"{atual} {palavra}".strip()
+                if fitz.get_text_length(teste, fontsize=fonte) > largura_desc and atual:
+                    linhas_desc.append(atual)
+                    atual = palavra
+                else:
+                    atual = teste
+            linhas_desc.append(atual)
+
+            x = 20
+            for (campo, _), largura in zip(colunas, larguras):
+                if campo == "descricao":
+                    for i, linha in enumerate(linhas_desc):
+                        pagina.insert_text((x + 2, y + i * fonte * 1.2), linha, fontsize=fonte)
+                else:
+                    texto = valores_item[campo]
+                    w = fitz.get_text_length(texto, fontsize=fonte)
+                    # números alinhados à direita, códigos à esquerda
+                    xt = x + largura - w - 2 if campo in ("quantidade", "valor_unit", "valor_total", "bc", "icms", "ipi") else x + 2
+                    pagina.insert_text((xt, y), texto, fontsize=fonte)
+                x += largura
+            y += fonte * 1.2 * len(linhas_desc) + fonte * 0.4
+
+        if not restantes:
+            pagina.insert_text((20, y + 20), "DADOS ADICIONAIS", fontsize=fonte + 0.5)
+            pagina.insert_text((20, y + 30), "INFORMAÇÕES COMPLEMENTARES: DOCUMENTO EMITIDO POR ME OU EPP", fontsize=fonte)
+
+    return doc.tobytes()
+
+
+def gerar_corpus(quantidade, semente=1):
+    # -> [(nome, bytes do pdf, produtos esperados)]
+    rng = random.Random(semente)
+    corpus = []
+    for i in range(quantidade):
+        itens = gerar_itens(rng, rng.choice([3, 8, 15, 40, 90]))
+        esperado = [{k: item[k] for k in ("Produto", "Quantidade", "Valor Unitário", "Valor Total")} for item in itens]
+        corpus.append((f"danfe_{i:03d}.pdf", gerar_danfe(rng, itens), esperado))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pasta")
+    parser.add_argument("--quantidade", type=int, default=50)
+    parser.add_argument("--semente", type=int, default=1)
+    args = parser.parse_args()
+
+    os.makedirs(args.pasta, exist_ok=True)
+    gabarito = {}
+    for nome, dados, esperado in gerar_corpus(args.quantidade, args.semente):
+        with open(os.path.join(args.pasta, nome), "wb") as f:
+            f.write(dados)
+        gabarito[nome] = esperado
+    with open(os.path.join(args.pasta, "gabarito.json"), "w", encoding="utf-8") as f:
+        json.dump(gabarito, f, ensure_ascii=False, indent=1)
+    print(f"✅ {args.quantidade} DANFE(s) e gabarito.json gravados em {args.pasta}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# arquivo: cache.py
+# Cache de resultados do histórico, compartilhado por todas as sessões do processo.
+# A chave inclui a versão dos dados do CNPJ (tabela versoes, incrementada por
+# trigger a cada INSERT/DELETE), então um resultado só deixa de valer quando os
+# dados daquele CNPJ mudam de fato. Expulsão LRU por quantidade e por memória.
+import os
+import sys
+import threading
+import datetime
+from collections import OrderedDict
+
+import pandas as pd
+
+from db import versao_dados
+
+
+def _tamanho(valor):
+    # Estimativa de memória do resultado (o bastante para o limite do cache)
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(_tamanho(k) + _tamanho(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(_tamanho(v) for v in valor)
+    return sys.getsizeof(valor)
+
+
+def congelar(valor):
+    # Parâmetros viram algo hashable e estável (listas -> tuplas, datas -> ISO)
+    if isinstance(valor, dict):
+        return tuple(sorted((k, congelar(v)) for k, v in valor.items()))
+    if isinstance(valor, (list, tuple, set)):
+        return tuple(congelar(v) for v in valor)
+    if isinstance(valor, (datetime.date, datetime.datetime)):
+        return valor.isoformat()
+    return valor
+
+
+class CacheResultados:
+    def __init__(self, limite_bytes=256 * 1024 * 1024, max_itens=1024):
+        self.limite_bytes = limite_bytes
+        self.max_itens = max_itens
+        self._itens = OrderedDict()   # chave -> (valor, tamanho)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave, calcular):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return item[0]
+            self.falhas += 1
+
+        # Calcula fora do lock; duas sessões podem calcular o mesmo resultado ao mesmo tempo
+        valor = calcular()
+        tamanho = _tamanho(valor)
+        if tamanho > self.limite_bytes:
+            return valor
+
+        with self._lock:
+            antigo = self._itens.pop(chave, None)
+            if antigo is not None:
+                self._bytes -= antigo[1]
+            self._itens[chave] = (valor, tamanho)
+            self._bytes += tamanho
+            while self._itens and (self._bytes > self.limite_bytes or len(self._itens) > self.max_itens):
+                _, (_, t) = self._itens.popitem(last=False)
+                self._bytes -= t
+        return valor
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "itens": len(self._itens),
+                "bytes": self._bytes,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+            }
+
+
+cache_resultados = CacheResultados(
+    limite_bytes=int(os.getenv("EXTRATOR_CACHE_MB", "256")) * 1024 * 1024,
+    max_itens=int(os.getenv("EXTRATOR_CACHE_ITENS", "1024")),
+)
+
+
+def consultar(funcao, cnpj, **params):
+    # Ex.: consultar(resumo_periodo, cnpj, data_ini=..., data_fim=...)
+    # O valor devolvido é compartilhado entre sessões: quem chama não deve alterá-lo.
+    chave = (funcao.__module__, funcao.__qualname__, cnpj, versao_dados(cnpj), congelar(params))
+    return cache_resultados.obter(chave, lambda: funcao(cnpj, **params))
@@ -0,0 +1,185 @@
+# arquivo: cache_ocr.py
+# Cache em disco do texto do OCR. A chave é o hash da imagem já rasterizada
+# (pixels, modo e tamanho) + DPI + idioma + versão do tesseract, então reprocessar
+# o mesmo PDF/imagem depois de mudar a heurística de extração não paga o OCR de
+# novo. Cada resultado é um arquivo; o mtime marca o último uso e, passando do
+# limite de tamanho, os menos usados recentemente são apagados. Acertos e falhas
+# ficam num SQLite na mesma pasta, somados por todos os processos que fazem OCR.
+#
+# Uso pela linha de comando:
+#   python cache_ocr.py estatisticas
+#   python cache_ocr.py limpar
+import os
+import hashlib
+import sqlite3
+import tempfile
+import threading
+
+PASTA_CACHE_OCR = os.getenv("EXTRATOR_CACHE_OCR", "cache_ocr")
+ARQUIVO_CONTADORES = "contadores.db"
+
+
+class CacheOCR:
+    def __init__(self, pasta=PASTA_CACHE_OCR, limite_bytes=512 * 1024 * 1024):
+        self.pasta = pasta
+        self.limite_bytes = limite_bytes
+        self._bytes = None   # calculado na primeira gravação
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+    @property
+    def ativo(self):
+        return self.limite_bytes > 0
+
+    def chave(self, imagem, dpi, lang, versao):
+        h = hashlib.sha256()
+        h.update(f"{imagem.mode}|{imagem.size}|{dpi}|{lang}|{versao}|".encode())
+        h.update(imagem.tobytes())
+        return h.hexdigest()
+
+    def _caminho(self, chave):
+        return os.path.join(self.pasta, chave[:2], chave + ".txt")
+
+    def obter(self, chave):
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                texto = f.read()
+            os.utime(caminho)  # marca como usado agora (LRU pelo mtime)
+        except OSError:
+            self._contar("falhas")
+            return None
+
+        self._contar("acertos")
+        return texto
+
+    # -------- Contadores (compartilhados entre os processos) --------
+    def _contadores(self):
+        # Uma conexão por processo; os workers de OCR são processos "spawn" e cada
+        # um perderia os próprios números ao terminar se ficassem só na memória
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(self.pasta, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.pasta, ARQUIVO_CONTADORES), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS contadores (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        acertos INTEGER NOT NULL,
+                        falhas INTEGER NOT NULL
+                    )
+                """)
+                conn.execute("INSERT OR IGNORE INTO contadores (id, acertos, falhas) VALUES (1, 0, 0)")
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def _contar(self, campo):
+        # O UPDATE é atômico no SQLite, então processos concorrentes não perdem incremento
+        try:
+            with self._lock:
+                conn = self._contadores()
+                with conn:
+                    conn.execute(f"UPDATE contadores SET {campo} = {campo} + 1 WHERE id = 1")
+        except sqlite3.Error as e:
+            print(f"[AVISO] Contador do cache de OCR não atualizado: {e}")
+
+    def _ler_contadores(self):
+        try:
+            with self._lock:
+                return self._contadores().execute("SELECT acertos, falhas FROM contadores WHERE id = 1").fetchone()
+        except sqlite3.Error:
+            return 0, 0
+
+    def gravar(self, chave, texto):
+        caminho = self._caminho(chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+
+        # Grava num temporário e troca de uma vez: outro processo nunca lê arquivo pela metade
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(texto)
+        os.replace(tmp, caminho)
+
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self._tamanho_total()
+            else:
+                self._bytes += os.path.getsize(caminho)
+            if self._bytes > self.limite_bytes:
+                self._podar()
+
+    def _arquivos(self):
+        for raiz, _, nomes in os.walk(self.pasta):
+            for nome in nomes:
+                if nome.endswith(".txt"):
+                    caminho = os.path.join(raiz, nome)
+                    try:
+                        yield caminho, os.stat(caminho)
+                    except OSError:
+                        pass  # apagado por outro processo no meio da varredura
+
+    def _tamanho_total(self):
+        return sum(st.st_size for _, st in self._arquivos())
+
+    def _podar(self):
+        # Apaga os menos usados até ficar em 90% do limite (evita podar a cada gravação)
+        arquivos = sorted(self._arquivos(), key=lambda item: item[1].st_mtime)
+        total = sum(st.st_size for _, st in arquivos)
+        alvo = self.limite_bytes * 0.9
+        for caminho, st in arquivos:
+            if total <= alvo:
+                break
+            try:
+                os.remove(caminho)
+                total -= st.st_size
+            except OSError:
+                pass
+        self._bytes = total
+
+    def limpar(self):
+        with self._lock:
+            for caminho, _ in list(self._arquivos()):
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+            self._bytes = 0
+        try:
+            with self._lock:
+                conn = self._contadores()
+                with conn:
+                    conn.execute("UPDATE contadores SET acertos = 0, falhas = 0 WHERE id = 1")
+        except sqlite3.Error:
+            pass
+
+    def estatisticas(self):
+        arquivos = list(self._arquivos())
+        acertos, falhas = self._ler_contadores()
+        return {
+            "arquivos": len(arquivos),
+            "bytes": sum(st.st_size for _, st in arquivos),
+            "acertos": acertos,
+            "falhas": falhas,
+        }
+
+
+# EXTRATOR_CACHE_OCR_MB=0 desliga o cache
+cache_ocr = CacheOCR(limite_bytes=int(os.getenv("EXTRATOR_CACHE_OCR_MB", "512")) * 1024 * 1024)
+
+
+if __name__ == "__main__":
+    import sys
+
+    comando = sys.argv[1] if len(sys.argv) > 1 else "estatisticas"
+    if comando == "limpar":
+        cache_ocr.limpar()
+        print(f"🧹 Cache de OCR em '{cache_ocr.pasta}' apagado.")
+    else:
+        est = cache_ocr.estatisticas()
+        print(f"📦 {est['arquivos']} resultado(s) em '{cache_ocr.pasta}', {est['bytes'] / 1024 / 1024:.1f} MB "
+              f"(limite {cache_ocr.limite_bytes / 1024 / 1024:.0f} MB)")
+        consultas = est["acertos"] + est["falhas"]
+        taxa = f"{est['acertos'] / consultas:.0%}" if consultas else "—"
+        print(f"🎯 {est['acertos']} acerto(s), {est['falhas']} falha(s) (taxa de acerto {taxa})")
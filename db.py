@@ -1,100 +1,759 @@
+import os
 import sqlite3
+import threading
+import datetime
+
+# -------- Conexão --------
+# Conexões abertas ficam num pool do processo, por caminho do banco, com WAL para
+# leitores não travarem enquanto outra sessão grava. O Streamlit roda cada rerun
+# numa thread nova (runner.fastReruns), então a conexão não pode morrer com a
+# thread: cada thread pega uma emprestada e ela volta ao pool quando a thread
+# termina, já configurada (os PRAGMAs só rodam na abertura).
+CAMINHO_BANCO = os.getenv("EXTRATOR_DB", "banco.db")
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",     # seguro com WAL; só o checkpoint faz fsync
+    "cache_size": -32000,        # em KiB quando negativo (~32 MB)
+    "mmap_size": 268435456,      # 256 MB
+    "busy_timeout": 5000,        # ms esperando lock antes de "database is locked"
+    "temp_store": "MEMORY",
+}
+
+_local = threading.local()
+_lock_pool = threading.Lock()
+_pool = {}            # caminho -> [conexões livres]
+_pool_pid = os.getpid()
+
+
+def configurar_banco(caminho=None, **pragmas):
+    # Ex.: configurar_banco("outro.db", cache_size=-64000). Vale para conexões novas.
+    global CAMINHO_BANCO
+    if caminho:
+        CAMINHO_BANCO = caminho
+    PRAGMAS.update(pragmas)
+    fechar_conexao()
+
+
+def _abrir_conexao(caminho):
+    # check_same_thread=False: a conexão troca de thread ao voltar do pool, mas
+    # nunca é usada por duas threads ao mesmo tempo
+    conn = sqlite3.connect(caminho, timeout=PRAGMAS.get("busy_timeout", 5000) / 1000, check_same_thread=False)
+    for nome, valor in PRAGMAS.items():
+        conn.execute(f"PRAGMA {nome}={valor}")
+    return conn
+
+
+def _livres(caminho):
+    # Processo novo (fork/spawn) não pode usar as conexões do pai. Chamar com _lock_pool.
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        _pool, _pool_pid = {}, os.getpid()
+    return _pool.setdefault(caminho, [])
+
+
+def _devolver(caminho, conn, pid):
+    if conn is None or pid != os.getpid():
+        return
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error:
+        return
+    with _lock_pool:
+        _livres(caminho).append(conn)
+
+
+class _Emprestimo:
+    # Fica no threading.local da thread; quando a thread termina o Python descarta
+    # o local e o empréstimo devolve a conexão ao pool
+    __slots__ = ("caminho", "conn", "pid")
+
+    def __init__(self, caminho, conn):
+        self.caminho, self.conn, self.pid = caminho, conn, os.getpid()
+
+    def __del__(self):
+        _devolver(self.caminho, self.conn, self.pid)
+
 
 def conectar():
-    return sqlite3.connect("banco.db")
+    caminho = os.path.abspath(CAMINHO_BANCO)
+    emprestimos = getattr(_local, "emprestimos", None)
+    if emprestimos is None or _local.pid != os.getpid():
+        emprestimos = _local.emprestimos = {}
+        _local.pid = os.getpid()
+
+    emprestimo = emprestimos.get(caminho)
+    if emprestimo is None:
+        with _lock_pool:
+            livres = _livres(caminho)
+            conn = livres.pop() if livres else None
+        emprestimo = emprestimos[caminho] = _Emprestimo(caminho, conn or _abrir_conexao(caminho))
+    return emprestimo.conn
+
+
+def fechar_conexao():
+    # Fecha as conexões desta thread e as livres no pool (outras threads
+    # continuam com as suas até terminarem)
+    for emprestimo in getattr(_local, "emprestimos", {}).values():
+        emprestimo.conn.close()
+        emprestimo.conn = None
+    _local.emprestimos = {}
+    _local.pid = os.getpid()
+    with _lock_pool:
+        for livres in _pool.values():
+            for conn in livres:
+                conn.close()
+        _pool.clear()
+
+
+# -------- Normalização (Data ISO "AAAA-MM-DD HH:MM:SS", valores REAL) --------
+def normalizar_data(valor):
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, datetime.datetime):
+        return valor.replace(tzinfo=None).strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(valor, datetime.date):
+        return valor.strftime("%Y-%m-%d 00:00:00")
+
+    texto = str(valor).strip()
+    # dhEmi da NF-e: 2024-05-10T10:15:00-03:00 -> mantém o horário local, descarta o fuso
+    try:
+        dt = datetime.datetime.fromisoformat(texto.replace("Z", "+00:00"))
+        return dt.replace(tzinfo=None).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        pass
+    for formato in ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y"):
+        try:
+            return datetime.datetime.strptime(texto, formato).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            pass
+    return None
+
+
+def normalizar_valor(valor):
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    try:
+        return float(str(valor).replace("R$", "").strip().replace(",", "."))
+    except ValueError:
+        return None
+
+
+def _limite_data(data_ini=None, data_fim=None):
+    # Intervalo fechado em dias: [data_ini 00:00:00, data_fim + 1 dia)
+    ini = data_ini.strftime("%Y-%m-%d") if data_ini else None
+    fim = (data_fim + datetime.timedelta(days=1)).strftime("%Y-%m-%d") if data_fim else None
+    return ini, fim
+
+
+def _filtros_sql(cnpj=None, data_ini=None, data_fim=None, empresas=None, produtos=None):
+    condicoes = []
+    params = []
+    if cnpj:
+        condicoes.append("CNPJ = ?")
+        params.append(cnpj)
+    ini, fim = _limite_data(data_ini, data_fim)
+    if ini:
+        condicoes.append("Data >= ?")
+        params.append(ini)
+    if fim:
+        condicoes.append("Data < ?")
+        params.append(fim)
+    if empresas:
+        condicoes.append(f"TRIM(Empresa) IN ({','.join('?' * len(empresas))})")
+        params.extend(empresas)
+    if produtos:
+        condicoes.append(f"TRIM(Produto) IN ({','.join('?' * len(produtos))})")
+        params.extend(produtos)
+    where = (" WHERE " + " AND ".join(condicoes)) if condicoes else ""
+    return where, params
+
+
+# Empresa como aparece no painel (nomes vazios viram "Desconhecida")
+SQL_EMPRESA = "COALESCE(TRIM(Empresa), 'Desconhecida')"
+
+
+# -------- Esquema --------
+VERSAO_ESQUEMA = 7
+
+SQL_PRODUTOS = """
+    CREATE TABLE IF NOT EXISTS {tabela} (
+        Empresa TEXT,
+        CNPJ TEXT,
+        Produto TEXT,
+        Quantidade REAL,
+        Valor_Unitário REAL,
+        Valor_Total REAL,
+        Origem TEXT,
+        Data TEXT,
+        Documento TEXT,
+        PRIMARY KEY (Empresa, Produto, Data, CNPJ)
+    )
+"""
+
+
+# Resumos por CNPJ x dia x empresa e CNPJ x mês x empresa, mantidos por trigger
+# na mesma transação de qualquer INSERT/DELETE em produtos. A tabela versoes
+# conta as alterações por CNPJ (chave de invalidação do cache de resultados).
+SQL_RESUMOS = """
+    CREATE TABLE IF NOT EXISTS resumo_diario (
+        CNPJ TEXT,
+        Dia TEXT,
+        Empresa TEXT,
+        Linhas INTEGER,
+        Total REAL,
+        PRIMARY KEY (CNPJ, Dia, Empresa)
+    );
+    CREATE TABLE IF NOT EXISTS resumo_mensal (
+        CNPJ TEXT,
+        Mes TEXT,
+        Empresa TEXT,
+        Linhas INTEGER,
+        Total REAL,
+        PRIMARY KEY (CNPJ, Mes, Empresa)
+    );
+    CREATE TABLE IF NOT EXISTS versoes (
+        CNPJ TEXT PRIMARY KEY,
+        Versao INTEGER
+    );
+    CREATE TRIGGER IF NOT EXISTS trg_produtos_versao_insert
+    AFTER INSERT ON produtos
+    BEGIN
+        INSERT INTO versoes (CNPJ, Versao) VALUES (NEW.CNPJ, 1)
+        ON CONFLICT (CNPJ) DO UPDATE SET Versao = Versao + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_produtos_versao_delete
+    AFTER DELETE ON produtos
+    BEGIN
+        INSERT INTO versoes (CNPJ, Versao) VALUES (OLD.CNPJ, 1)
+        ON CONFLICT (CNPJ) DO UPDATE SET Versao = Versao + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_produtos_resumo_insert
+    AFTER INSERT ON produtos WHEN NEW.Data IS NOT NULL
+    BEGIN
+        INSERT INTO resumo_diario (CNPJ, Dia, Empresa, Linhas, Total)
+        VALUES (NEW.CNPJ, substr(NEW.Data, 1, 10), COALESCE(TRIM(NEW.Empresa), 'Desconhecida'), 1, IFNULL(NEW.Valor_Total, 0))
+        ON CONFLICT (CNPJ, Dia, Empresa) DO UPDATE SET Linhas = Linhas + 1, Total = Total + excluded.Total;
+
+        INSERT INTO resumo_mensal (CNPJ, Mes, Empresa, Linhas, Total)
+        VALUES (NEW.CNPJ, substr(NEW.Data, 1, 7), COALESCE(TRIM(NEW.Empresa), 'Desconhecida'), 1, IFNULL(NEW.Valor_Total, 0))
+        ON CONFLICT (CNPJ, Mes, Empresa) DO UPDATE SET Linhas = Linhas + 1, Total = Total + excluded.Total;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_produtos_resumo_delete
+    AFTER DELETE ON produtos WHEN OLD.Data IS NOT NULL
+    BEGIN
+        UPDATE resumo_diario SET Linhas = Linhas - 1, Total = Total - IFNULL(OLD.Valor_Total, 0)
+        WHERE CNPJ = OLD.CNPJ AND Dia = substr(OLD.Data, 1, 10) AND Empresa = COALESCE(TRIM(OLD.Empresa), 'Desconhecida');
+        DELETE FROM resumo_diario
+        WHERE CNPJ = OLD.CNPJ AND Dia = substr(OLD.Data, 1, 10) AND Empresa = COALESCE(TRIM(OLD.Empresa), 'Desconhecida') AND Linhas <= 0;
+
+        UPDATE resumo_mensal SET Linhas = Linhas - 1, Total = Total - IFNULL(OLD.Valor_Total, 0)
+        WHERE CNPJ = OLD.CNPJ AND Mes = substr(OLD.Data, 1, 7) AND Empresa = COALESCE(TRIM(OLD.Empresa), 'Desconhecida');
+        DELETE FROM resumo_mensal
+        WHERE CNPJ = OLD.CNPJ AND Mes = substr(OLD.Data, 1, 7) AND Empresa = COALESCE(TRIM(OLD.Empresa), 'Desconhecida') AND Linhas <= 0;
+    END;
+"""
+
+
+def reconstruir_resumos(cnpj=None):
+    # Recalcula os resumos do zero a partir de produtos (todos os CNPJs ou só um)
+    conn = conectar()
+    filtro = " WHERE CNPJ = ?" if cnpj else ""
+    params = (cnpj,) if cnpj else ()
+    with conn:
+        conn.execute(f"DELETE FROM resumo_diario{filtro}", params)
+        conn.execute(f"DELETE FROM resumo_mensal{filtro}", params)
+        conn.execute(f"""
+            INSERT INTO resumo_diario (CNPJ, Dia, Empresa, Linhas, Total)
+            SELECT CNPJ, substr(Data, 1, 10), {SQL_EMPRESA}, COUNT(*), TOTAL(Valor_Total)
+            FROM produtos WHERE Data IS NOT NULL{filtro.replace(" WHERE", " AND")}
+            GROUP BY 1, 2, 3
+        """, params)
+        conn.execute(f"""
+            INSERT INTO resumo_mensal (CNPJ, Mes, Empresa, Linhas, Total)
+            SELECT CNPJ, substr(Data, 1, 7), {SQL_EMPRESA}, COUNT(*), TOTAL(Valor_Total)
+            FROM produtos WHERE Data IS NOT NULL{filtro.replace(" WHERE", " AND")}
+            GROUP BY 1, 2, 3
+        """, params)
+
+
+def _migrar_produtos(conn):
+    # v0 -> v1: valores TEXT -> REAL e Data livre -> ISO normalizada
+    conn.create_function("normalizar_data", 1, normalizar_data, deterministic=True)
+    conn.create_function("normalizar_valor", 1, normalizar_valor, deterministic=True)
+    conn.execute("BEGIN")
+    try:
+        conn.execute(SQL_PRODUTOS.format(tabela="produtos_migracao"))
+        conn.execute("""
+            INSERT OR IGNORE INTO produtos_migracao (Empresa, CNPJ, Produto, Quantidade, Valor_Unitário, Valor_Total, Origem, Data)
+            SELECT Empresa, CNPJ, Produto, normalizar_valor(Quantidade),
+                   normalizar_valor(Valor_Unitário), normalizar_valor(Valor_Total),
+                   Origem, normalizar_data(Data)
+            FROM produtos
+        """)
+        conn.execute("DROP TABLE produtos")
+        conn.execute("ALTER TABLE produtos_migracao RENAME TO produtos")
+        conn.execute(f"PRAGMA user_version = {VERSAO_ESQUEMA}")
+        conn.commit()
+        print("✅ Tabela produtos migrada para o esquema tipado.")
+    except Exception:
+        conn.rollback()
+        raise
+
 
 def criar_tabela():
-    conn = sqlite3.connect("banco.db")
+    conn = conectar()
+    versao = conn.execute("PRAGMA user_version").fetchone()[0]
+    existe = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='produtos'").fetchone()
+    if existe and versao < 1:
+        _migrar_produtos(conn)
+
     c = conn.cursor()
+    c.execute(SQL_PRODUTOS.format(tabela="produtos"))
+    # v3 -> v4: documento (hash) de origem de cada linha, para trocar as linhas de um DANFE pelas do XML
+    if existe and versao < 4 and not any(coluna[1] == "Documento" for coluna in c.execute("PRAGMA table_info(produtos)")):
+        c.execute("ALTER TABLE produtos ADD COLUMN Documento TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_produtos_cnpj_data ON produtos (CNPJ, Data)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_produtos_documento ON produtos (Documento)")
+    # Sem data (vazia ou ilegível) a Data fica NULL, e NULLs são todos distintos na
+    # chave primária: este índice faz o INSERT OR IGNORE descartar a linha repetida
+    # sem data, como a chave faz com as datadas. v6 -> v7: tira as repetidas que já entraram.
+    if existe and versao < 7:
+        c.execute("""
+            DELETE FROM produtos WHERE Data IS NULL AND rowid NOT IN (
+                SELECT MIN(rowid) FROM produtos WHERE Data IS NULL GROUP BY Empresa, Produto, CNPJ
+            )
+        """)
+        conn.commit()
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_produtos_sem_data ON produtos (Empresa, Produto, CNPJ) WHERE Data IS NULL")
+    # v5 -> v6: a v5 tinha tirado o resumo mensal; os triggers de resumo são refeitos
+    # com ele e as tabelas preenchidas de novo logo abaixo
+    if existe and versao == 5:
+        c.executescript("""
+            DROP TRIGGER IF EXISTS trg_produtos_resumo_insert;
+            DROP TRIGGER IF EXISTS trg_produtos_resumo_delete;
+        """)
+    c.executescript(SQL_RESUMOS)
+    # Registro de documentos já ingeridos (evita reprocessar reenvios)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS documentos (
+            CNPJ TEXT,
+            Hash TEXT,
+            Chave TEXT,
+            Nome TEXT,
+            Tipo TEXT,
+            Status TEXT,
+            Linhas INTEGER,
+            Data_Envio TEXT,
+            PRIMARY KEY (CNPJ, Hash)
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_documentos_chave ON documentos (CNPJ, Chave)")
+    # Índice dos arquivos em documentos_armazenados (mantido por armazenamento.py):
+    # existência, listagem e exclusão por período sem varrer o disco
     c.execute("""
-        CREATE TABLE IF NOT EXISTS produtos (
-            Empresa TEXT,
+        CREATE TABLE IF NOT EXISTS arquivos (
             CNPJ TEXT,
-            Produto TEXT,
-            Quantidade REAL,
-            Valor_Unitário TEXT,
-            Valor_Total TEXT,
-            Origem TEXT,
-            Data TEXT,
-            PRIMARY KEY (Empresa, Produto, Data, CNPJ)
+            Caminho TEXT,
+            Nome TEXT,
+            Ano TEXT,
+            Mes TEXT,
+            Tamanho INTEGER,
+            Hash TEXT,
+            Data_Documento TEXT,
+            Data_Envio TEXT,
+            PRIMARY KEY (CNPJ, Caminho)
         )
     """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_arquivos_pasta ON arquivos (CNPJ, Ano, Mes, Nome)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_arquivos_nome ON arquivos (CNPJ, Nome)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_arquivos_envio ON arquivos (CNPJ, Data_Envio)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_arquivos_hash ON arquivos (CNPJ, Hash)")
     conn.commit()
-    conn.close()
+
+    # v1 -> v2: resumos nasceram vazios; preenche com o histórico que já existe
+    if existe and (versao < 2 or versao == 5):
+        reconstruir_resumos()
+    # v2 -> v3: índice de arquivos nasceu vazio; preenche com o que já está no disco
+    if versao < 3:
+        from armazenamento import reconciliar_indice
+        reconciliar_indice()
+    # Só grava a versão quando migrou: criar_tabela roda a cada rerun e um PRAGMA
+    # de escrita tomaria o lock de escrita e poria um frame no WAL toda vez
+    if versao < VERSAO_ESQUEMA:
+        c.execute(f"PRAGMA user_version = {VERSAO_ESQUEMA}")
+        conn.commit()
+
+
+def _linha_produto(dados):
+    return (
+        dados["Empresa"],
+        dados["CNPJ"],
+        dados["Produto"],
+        normalizar_valor(dados["Quantidade"]),
+        normalizar_valor(dados["Valor Unitário"]),
+        normalizar_valor(dados["Valor Total"]),
+        dados["Origem"],
+        normalizar_data(dados["Data"]),
+        dados.get("Documento")
+    )
 
 def inserir_produto(dados):
     conn = conectar()
-    cursor = conn.cursor()
     try:
-        cursor.execute("""
-            INSERT OR IGNORE INTO produtos (Empresa, CNPJ, Produto, Quantidade, Valor_Unitário, Valor_Total, Origem, Data)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            dados["Empresa"],
-            dados["CNPJ"],
-            dados["Produto"],
-            dados["Quantidade"],
-            dados["Valor Unitário"],
-            dados["Valor Total"],
-            dados["Origem"],
-            dados["Data"]
-        ))
-        conn.commit()
+        with conn:
+            conn.execute("""
+                INSERT OR IGNORE INTO produtos (Empresa, CNPJ, Produto, Quantidade, Valor_Unitário, Valor_Total, Origem, Data, Documento)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, _linha_produto(dados))
         print(f"✅ Inserido no banco: {dados}")
     except Exception as e:
         print(f"Erro ao inserir: {e}")
+
+
+def inserir_produtos_lote(produtos):
+    # Um documento (ou um lote inteiro de upload) numa única transação: um commit,
+    # não um por linha. Retorna (inseridos, ignorados pelo INSERT OR IGNORE).
+    linhas = [_linha_produto(dados) for dados in produtos]
+    if not linhas:
+        return 0, 0
+
+    conn = conectar()
+    with conn:
+        # rowcount conta só as linhas de produtos; total_changes somaria também
+        # o que os triggers gravam em resumo_diario/resumo_mensal/versões
+        cursor = conn.executemany("""
+            INSERT OR IGNORE INTO produtos (Empresa, CNPJ, Produto, Quantidade, Valor_Unitário, Valor_Total, Origem, Data, Documento)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, linhas)
+    inseridos = cursor.rowcount
+    print(f"✅ Lote inserido no banco: {inseridos} nova(s), {len(linhas) - inseridos} ignorada(s)")
+    return inseridos, len(linhas) - inseridos
+
+
+COLUNAS_PRODUTOS = "Empresa, CNPJ, Produto, Quantidade, Valor_Unitário, Valor_Total, Origem, Data"
+
+
+def buscar_todos(cnpj=None, data_ini=None, data_fim=None, empresas=None, produtos=None):
+    # Filtros vão para o SQL (índice em CNPJ, Data); só volta o que será exibido
+    where, params = _filtros_sql(cnpj, data_ini, data_fim, empresas, produtos)
+    c = conectar().cursor()
+    c.execute(f"SELECT {COLUNAS_PRODUTOS} FROM produtos{where} ORDER BY Data", params)
+    return c.fetchall()
+
+
+# -------- Leitura paginada (keyset) e em streaming --------
+# Colunas que podem ordenar a tabela (nome exibido -> coluna no banco)
+COLUNAS_ORDENAVEIS = {
+    "Data": "Data",
+    "Empresa": "Empresa",
+    "Produto": "Produto",
+    "Quantidade": "Quantidade",
+    "Valor Unitário": "Valor_Unitário",
+    "Valor Total": "Valor_Total",
+}
+
+
+def _expressao_ordem(coluna, com_periodo):
+    # Com período informado, Data nunca é nula e o índice (CNPJ, Data, rowid) atende a ordenação;
+    # nos demais casos o IFNULL evita que nulos quebrem a comparação do cursor
+    if coluna == "Data" and com_periodo:
+        return "Data"
+    if coluna in ("Quantidade", "Valor_Unitário", "Valor_Total"):
+        return f"IFNULL({coluna}, 0)"
+    return f"IFNULL({coluna}, '')"
+
+
+def buscar_pagina(cnpj, data_ini=None, data_fim=None, empresas=None, produtos=None,
+                  ordenar_por="Data", decrescente=False, apos=None, limite=100):
+    # apos = cursor devolvido pela página anterior: (valor da coluna, rowid) da última linha.
+    # Custo proporcional ao tamanho da página, não à posição dela no histórico.
+    coluna = COLUNAS_ORDENAVEIS.get(ordenar_por, "Data")
+    expr = _expressao_ordem(coluna, bool(data_ini or data_fim))
+    direcao = "DESC" if decrescente else "ASC"
+
+    where, params = _filtros_sql(cnpj, data_ini, data_fim, empresas, produtos)
+    if apos is not None:
+        comparacao = "<" if decrescente else ">"
+        where += (" AND " if where else " WHERE ") + f"({expr}, rowid) {comparacao} (?, ?)"
+        params = params + list(apos)
+
+    c = conectar().cursor()
+    c.execute(f"""
+        SELECT {COLUNAS_PRODUTOS}, {expr}, rowid
+        FROM produtos{where}
+        ORDER BY {expr} {direcao}, rowid {direcao}
+        LIMIT ?
+    """, params + [limite])
+    linhas = c.fetchall()
+
+    # Só há próxima página se esta veio cheia
+    proximo = tuple(linhas[-1][-2:]) if len(linhas) == limite else None
+    return [linha[:-2] for linha in linhas], proximo
+
+
+def iterar_produtos(cnpj=None, data_ini=None, data_fim=None, empresas=None, produtos=None, tamanho_lote=5000):
+    # Mesmo resultado de buscar_todos, mas em lotes via fetchmany (memória constante)
+    where, params = _filtros_sql(cnpj, data_ini, data_fim, empresas, produtos)
+    c = conectar().cursor()
+    c.execute(f"SELECT {COLUNAS_PRODUTOS} FROM produtos{where} ORDER BY Data", params)
+    try:
+        while True:
+            lote = c.fetchmany(tamanho_lote)
+            if not lote:
+                break
+            yield from lote
     finally:
-        conn.close()
+        c.close()
 
 
+def possui_produtos(cnpj):
+    c = conectar().cursor()
+    c.execute("SELECT 1 FROM produtos WHERE CNPJ=? LIMIT 1", (cnpj,))
+    return c.fetchone() is not None
 
-def buscar_todos(cnpj=None):
-    conn = sqlite3.connect("banco.db")
-    c = conn.cursor()
-    
-    if cnpj:
-        c.execute("SELECT * FROM produtos WHERE CNPJ=?", (cnpj,))
+
+def listar_empresas(cnpj, data_ini=None, data_fim=None):
+    where, params = _filtros_sql(cnpj, data_ini, data_fim)
+    c = conectar().cursor()
+    c.execute(f"SELECT DISTINCT TRIM(Empresa) FROM produtos{where} ORDER BY 1", params)
+    return [linha[0] for linha in c.fetchall() if linha[0] is not None]
+
+
+def listar_produtos(cnpj, data_ini=None, data_fim=None, empresas=None):
+    where, params = _filtros_sql(cnpj, data_ini, data_fim, empresas)
+    c = conectar().cursor()
+    c.execute(f"SELECT DISTINCT TRIM(Produto) FROM produtos{where} ORDER BY 1", params)
+    return [linha[0] for linha in c.fetchall() if linha[0] is not None]
+
+
+# -------- Agregações para o painel (calculadas no SQLite) --------
+
+
+def _filtros_resumo(cnpj, data_ini=None, data_fim=None, empresas=None, coluna="Dia"):
+    condicoes = ["CNPJ = ?"]
+    params = [cnpj]
+    if coluna == "Mes":
+        if data_ini:
+            condicoes.append("Mes >= ?")
+            params.append(data_ini.strftime("%Y-%m"))
+        if data_fim:
+            condicoes.append("Mes <= ?")
+            params.append(data_fim.strftime("%Y-%m"))
+    else:
+        ini, fim = _limite_data(data_ini, data_fim)
+        if ini:
+            condicoes.append("Dia >= ?")
+            params.append(ini)
+        if fim:
+            condicoes.append("Dia < ?")
+            params.append(fim)
+    if empresas:
+        condicoes.append(f"Empresa IN ({','.join('?' * len(empresas))})")
+        params.extend(empresas)
+    return " WHERE " + " AND ".join(condicoes), params
+
+
+def _usa_resumo(data_ini, data_fim, produtos):
+    # Os resumos não têm produto nem linhas sem data; só servem com período e sem filtro de produto
+    return bool(data_ini or data_fim) and not produtos
+
+
+def resumo_periodo(cnpj, data_ini=None, data_fim=None, empresas=None, produtos=None):
+    c = conectar().cursor()
+    if not _usa_resumo(data_ini, data_fim, produtos):
+        where, params = _filtros_sql(cnpj, data_ini, data_fim, empresas, produtos)
+        c.execute(f"""
+            SELECT {SQL_EMPRESA} AS Emp, COUNT(*), TOTAL(Valor_Total)
+            FROM produtos{where}
+            GROUP BY Emp
+        """, params)
+    else:
+        # Período sem filtro de produto: o resumo diário já tem tudo pré-somado
+        where, params = _filtros_resumo(cnpj, data_ini, data_fim, empresas)
+        c.execute(f"SELECT Empresa, SUM(Linhas), TOTAL(Total) FROM resumo_diario{where} GROUP BY Empresa", params)
+    por_empresa = c.fetchall()
+
+    linhas = sum(n for _, n, _ in por_empresa)
+    total = sum(t for _, _, t in por_empresa)
+    # Fornecedor com maior gasto, ignorando os sem nome
+    candidatos = sorted((emp, t) for emp, _, t in por_empresa if emp != "Desconhecida")
+    top = max(candidatos, key=lambda item: item[1])[0] if candidatos else "Desconhecida"
+    return {"linhas": linhas, "total": total, "top_empresa": top}
+
+
+def total_por_empresa(cnpj, data_ini=None, data_fim=None, empresas=None, produtos=None):
+    c = conectar().cursor()
+    if not _usa_resumo(data_ini, data_fim, produtos):
+        where, params = _filtros_sql(cnpj, data_ini, data_fim, empresas, produtos)
+        c.execute(f"""
+            SELECT {SQL_EMPRESA} AS Emp, TOTAL(Valor_Total) AS Soma
+            FROM produtos{where}
+            GROUP BY Emp
+            ORDER BY Soma
+        """, params)
+    else:
+        where, params = _filtros_resumo(cnpj, data_ini, data_fim, empresas)
+        c.execute(f"SELECT Empresa, TOTAL(Total) AS Soma FROM resumo_diario{where} GROUP BY Empresa ORDER BY Soma", params)
+    return c.fetchall()
+
+
+def contagem_por_origem(cnpj, data_ini=None, data_fim=None, empresas=None, produtos=None):
+    where, params = _filtros_sql(cnpj, data_ini, data_fim, empresas, produtos)
+    c = conectar().cursor()
+    c.execute(f"SELECT Origem, COUNT(*) AS Total FROM produtos{where} GROUP BY Origem ORDER BY Total DESC", params)
+    return c.fetchall()
+
+
+def serie_diaria(cnpj, data_ini=None, data_fim=None, empresas=None, produtos=None):
+    c = conectar().cursor()
+    if not _usa_resumo(data_ini, data_fim, produtos):
+        where, params = _filtros_sql(cnpj, data_ini, data_fim, empresas, produtos)
+        c.execute(f"""
+            SELECT substr(Data, 1, 10) AS Dia, TOTAL(Valor_Total)
+            FROM produtos{where}
+            GROUP BY Dia
+            HAVING Dia IS NOT NULL
+            ORDER BY Dia
+        """, params)
+    else:
+        where, params = _filtros_resumo(cnpj, data_ini, data_fim, empresas)
+        c.execute(f"SELECT Dia, TOTAL(Total) FROM resumo_diario{where} GROUP BY Dia ORDER BY Dia", params)
+    return c.fetchall()
+
+
+def total_por_mes(cnpj, data_ini=None, data_fim=None, empresas=None, produtos=None):
+    # Soma por mês (AAAA-MM) exatamente dentro do período; linhas sem data ficam de fora
+    c = conectar().cursor()
+    if not _usa_resumo(data_ini, data_fim, produtos):
+        where, params = _filtros_sql(cnpj, data_ini, data_fim, empresas, produtos)
+        c.execute(f"""
+            SELECT substr(Data, 1, 7) AS Mes, COUNT(*), TOTAL(Valor_Total)
+            FROM produtos{where}
+            GROUP BY Mes
+            HAVING Mes IS NOT NULL
+            ORDER BY Mes
+        """, params)
     else:
-        c.execute("SELECT * FROM produtos")
-    
-    dados = c.fetchall()
-    conn.close()
-    return dados
+        where, params = _filtros_resumo(cnpj, data_ini, data_fim, empresas)
+        c.execute(f"SELECT substr(Dia, 1, 7) AS Mes, SUM(Linhas), TOTAL(Total) FROM resumo_diario{where} GROUP BY Mes ORDER BY Mes", params)
+    return c.fetchall()
+
+
+def serie_mensal(cnpj, data_ini=None, data_fim=None, empresas=None):
+    # Meses inteiros que tocam o período, direto do resumo mensal
+    where, params = _filtros_resumo(cnpj, data_ini, data_fim, empresas, coluna="Mes")
+    c = conectar().cursor()
+    c.execute(f"SELECT Mes, Empresa, SUM(Linhas), TOTAL(Total) FROM resumo_mensal{where} GROUP BY Mes, Empresa ORDER BY Mes, Empresa", params)
+    return c.fetchall()
+
+
+# -------- Registro de documentos --------
+def buscar_documento_por_hash(cnpj, hash_arquivo):
+    c = conectar().cursor()
+    # Documentos que deram erro, que tiveram página perdida no OCR ou dos quais
+    # nenhum produto foi extraído podem ser reenviados (ex.: depois de uma correção
+    # no parser ou de instalar o tesseract)
+    c.execute("SELECT Nome, Tipo, Status, Linhas, Chave FROM documentos WHERE CNPJ=? AND Hash=? AND Status NOT IN ('erro', 'parcial', 'sem_produtos')", (cnpj, hash_arquivo))
+    return c.fetchone()
+
+
+def buscar_documento_por_chave(cnpj, chave):
+    # Só o XML processado conta como a nota já importada: um DANFE que chegou
+    # antes não pode barrar o XML da mesma chave
+    if not chave:
+        return None
+    c = conectar().cursor()
+    c.execute("""
+        SELECT Nome, Tipo, Status, Linhas, Hash FROM documentos
+        WHERE CNPJ=? AND Chave=? AND Tipo='XML' AND Status='processado' LIMIT 1
+    """, (cnpj, chave))
+    return c.fetchone()
+
+
+def substituir_pdfs_da_chave(cnpj, chave):
+    # XML chegando depois do DANFE da mesma nota: saem as linhas extraídas do PDF
+    # (o XML é a fonte oficial) e o PDF passa a constar como vinculado. -> linhas removidas
+    if not chave:
+        return 0
+    conn = conectar()
+    with conn:
+        filtro = "WHERE CNPJ=? AND Chave=? AND Tipo='PDF' AND Status='processado'"
+        cursor = conn.execute(f"DELETE FROM produtos WHERE Documento IN (SELECT Hash FROM documentos {filtro})", (cnpj, chave))
+        conn.execute(f"UPDATE documentos SET Status='vinculado', Linhas=0 {filtro}", (cnpj, chave))
+    return cursor.rowcount
+
+
+def registrar_documento(cnpj, hash_arquivo, nome, tipo, status, linhas=0, chave=None):
+    conn = conectar()
+    try:
+        with conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO documentos (CNPJ, Hash, Chave, Nome, Tipo, Status, Linhas, Data_Envio)
+                VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now', 'localtime'))
+            """, (cnpj, hash_arquivo, chave or None, nome, tipo, status, linhas))
+    except Exception as e:
+        print(f"Erro ao registrar documento {nome}: {e}")
+
+
+def versao_dados(cnpj):
+    c = conectar().cursor()
+    c.execute("SELECT Versao FROM versoes WHERE CNPJ=?", (cnpj,))
+    linha = c.fetchone()
+    return linha[0] if linha else 0
 
 
 def resetar_banco():
     conn = conectar()
-    cursor = conn.cursor()
     try:
-        cursor.execute("DROP TABLE IF EXISTS produtos")
+        with conn:
+            # versoes não é apagada: as versões só crescem, então nada em cache volta a valer
+            conn.execute("UPDATE versoes SET Versao = Versao + 1")
+            conn.execute("DROP TABLE IF EXISTS produtos")
+            conn.execute("DROP TABLE IF EXISTS documentos")
+            conn.execute("DROP TABLE IF EXISTS resumo_diario")
+            conn.execute("DROP TABLE IF EXISTS resumo_mensal")
+            conn.execute("DROP TABLE IF EXISTS arquivos")
         criar_tabela() # Recria a tabela após apagar
-        conn.commit()
         print("✅ Banco de dados resetado com sucesso.")
     except Exception as e:
         print(f"Erro ao resetar o banco de dados: {e}")
-    finally:
-        conn.close()
 
 
 
 def apagar_produtos_por_cnpj(cnpj):
     conn = conectar()
-    cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM produtos WHERE CNPJ = ?", (cnpj,))
-        conn.commit()
+        with conn:
+            conn.execute("DELETE FROM produtos WHERE CNPJ = ?", (cnpj,))
+            conn.execute("DELETE FROM documentos WHERE CNPJ = ?", (cnpj,))
+            # Os triggers já zeram os resumos; isto só descarta resíduo de ponto flutuante
+            conn.execute("DELETE FROM resumo_diario WHERE CNPJ = ?", (cnpj,))
+            conn.execute("DELETE FROM resumo_mensal WHERE CNPJ = ?", (cnpj,))
         print(f"✅ Produtos do CNPJ {cnpj} apagados com sucesso.")
     except Exception as e:
         print(f"Erro ao apagar produtos do CNPJ {cnpj}: {e}")
-    finally:
-        conn.close()
-        
+
 def excluir_produtos_por_data(cnpj, data_ini, data_fim):
+    where, params = _filtros_sql(cnpj, data_ini, data_fim)
     conn = conectar()
-    c = conn.cursor()
-    c.execute("""
-        DELETE FROM produtos
-        WHERE CNPJ = ? AND date(Data) BETWEEN ? AND ?
-    """, (cnpj, data_ini.isoformat(), data_fim.isoformat()))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(f"DELETE FROM produtos{where}", params)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manutenção do banco de produtos")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_resumos = sub.add_parser("reconstruir-resumos", help="recalcula resumo_diario/resumo_mensal a partir de produtos")
+    p_resumos.add_argument("--cnpj", help="só este CNPJ (padrão: todos)")
+    args = parser.parse_args()
+
+    if args.comando == "reconstruir-resumos":
+        criar_tabela()
+        reconstruir_resumos(args.cnpj)
+        print("✅ Resumos reconstruídos.")
@@ -0,0 +1,247 @@
+# arquivo: exportacao.py
+# Exportações sob demanda: só são geradas quando o usuário pede, rodam numa
+# thread em segundo plano e ficam guardadas pela chave (tipo, CNPJ, versão dos
+# dados, filtros, opções) para que um novo download do mesmo recorte seja imediato.
+#
+# Tabela (XLSX/CSV/Parquet) sai do SQLite em lotes direto para um arquivo
+# temporário, com memória constante. Também dá para usar pela linha de comando:
+#   python exportacao.py --cnpj 12345678000190 --formato csv --saida historico.csv --de 2024-01-01
+import os
+import csv
+import hashlib
+import datetime
+import tempfile
+import threading
+from itertools import islice
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from db import versao_dados, iterar_produtos, resumo_periodo, total_por_empresa, total_por_mes
+from cache import congelar
+from relatorios import gerar_pdf_relatorio, preparar_linhas_pdf
+
+MAX_EXPORTACOES = int(os.getenv("EXTRATOR_MAX_EXPORTACOES", "32"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("EXTRATOR_EXPORT_WORKERS", "2")),
+    thread_name_prefix="exportacao"
+)
+_trabalhos = OrderedDict()   # chave -> Future
+_lock = threading.Lock()
+
+
+def chave_exportacao(tipo, cnpj, filtros, opcoes=None):
+    # A versão dos dados entra na chave: qualquer gravação no CNPJ gera chave nova
+    bruto = repr((tipo, cnpj, versao_dados(cnpj), congelar(filtros), congelar(opcoes or {})))
+    return hashlib.sha256(bruto.encode()).hexdigest()
+
+
+def obter_exportacao(chave):
+    with _lock:
+        futuro = _trabalhos.get(chave)
+        if futuro is not None:
+            _trabalhos.move_to_end(chave)
+        return futuro
+
+
+def solicitar_exportacao(chave, funcao, *args, espera=2.0, **kwargs):
+    # Reaproveita o trabalho se já existe (pronto ou em andamento); se falhou, tenta de novo.
+    # Espera alguns segundos para exportações pequenas aparecerem já prontas.
+    with _lock:
+        futuro = _trabalhos.get(chave)
+        if futuro is None or (futuro.done() and futuro.exception() is not None):
+            futuro = _executor.submit(funcao, *args, **kwargs)
+            _trabalhos[chave] = futuro
+        _trabalhos.move_to_end(chave)
+
+        # Descarta os mais antigos já concluídos (e o arquivo temporário deles)
+        excedentes = len(_trabalhos) - MAX_EXPORTACOES
+        for antiga in list(_trabalhos):
+            if excedentes <= 0:
+                break
+            if antiga != chave and _trabalhos[antiga].done():
+                _descartar(_trabalhos.pop(antiga))
+                excedentes -= 1
+
+    try:
+        futuro.result(timeout=espera)
+    except TimeoutError:
+        pass
+    except Exception:
+        pass  # o erro fica no Future; quem chama mostra
+    return futuro
+
+
+def _descartar(futuro):
+    if futuro.exception() is None and isinstance(futuro.result(), str):
+        try:
+            os.remove(futuro.result())
+        except OSError:
+            pass
+
+
+# -------- Exportação em streaming (memória constante) --------
+COLUNAS_EXPORTACAO = ["Empresa", "CNPJ", "Produto", "Quantidade", "Valor Unitário", "Valor Total", "Origem", "Data"]
+TAMANHO_LOTE = 50000
+LIMITE_LINHAS_XLSX = 1048576  # linhas por planilha no Excel (inclui o cabeçalho)
+
+
+def _lotes(cnpj, filtros, tamanho_lote):
+    linhas = iterar_produtos(cnpj, **(filtros or {}), tamanho_lote=tamanho_lote)
+    while True:
+        lote = list(islice(linhas, tamanho_lote))
+        if not lote:
+            return
+        yield lote
+
+
+def exportar_csv(destino, cnpj=None, filtros=None, tamanho_lote=TAMANHO_LOTE, separador=";"):
+    # utf-8-sig para o Excel abrir os acentos direito
+    total = 0
+    with open(destino, "w", newline="", encoding="utf-8-sig") as f:
+        escritor = csv.writer(f, delimiter=separador)
+        escritor.writerow(COLUNAS_EXPORTACAO)
+        for lote in _lotes(cnpj, filtros, tamanho_lote):
+            escritor.writerows(lote)
+            total += len(lote)
+    return total
+
+
+def exportar_xlsx(destino, cnpj=None, filtros=None, tamanho_lote=TAMANHO_LOTE):
+    import xlsxwriter
+
+    # constant_memory: cada linha vai para o disco assim que a próxima começa
+    livro = xlsxwriter.Workbook(destino, {"constant_memory": True})
+    formato_data = livro.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+    planilha = None
+    linha = 0
+    numero_planilha = 0
+    total = 0
+
+    try:
+        for lote in _lotes(cnpj, filtros, tamanho_lote):
+            for registro in lote:
+                if planilha is None or linha >= LIMITE_LINHAS_XLSX:
+                    numero_planilha += 1
+                    nome = "Histórico" if numero_planilha == 1 else f"Histórico ({numero_planilha})"
+                    planilha = livro.add_worksheet(nome)
+                    planilha.write_row(0, 0, COLUNAS_EXPORTACAO)
+                    linha = 1
+
+                planilha.write_row(linha, 0, registro[:7])
+                data = registro[7]
+                if data:
+                    planilha.write_datetime(linha, 7, datetime.datetime.fromisoformat(data), formato_data)
+                linha += 1
+            total += len(lote)
+
+        if planilha is None:
+            livro.add_worksheet("Histórico").write_row(0, 0, COLUNAS_EXPORTACAO)
+    finally:
+        livro.close()
+    return total
+
+
+def exportar_parquet(destino, cnpj=None, filtros=None, tamanho_lote=TAMANHO_LOTE):
+    # Um row group por lote lido do banco
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Exportar em Parquet requer o pacote pyarrow (pip install pyarrow)")
+
+    esquema = pa.schema([
+        ("Empresa", pa.string()),
+        ("CNPJ", pa.string()),
+        ("Produto", pa.string()),
+        ("Quantidade", pa.float64()),
+        ("Valor Unitário", pa.float64()),
+        ("Valor Total", pa.float64()),
+        ("Origem", pa.string()),
+        ("Data", pa.timestamp("s")),
+    ])
+
+    total = 0
+    with pq.ParquetWriter(destino, esquema, compression="snappy") as escritor:
+        for lote in _lotes(cnpj, filtros, tamanho_lote):
+            colunas = list(zip(*lote))
+            arrays = [pa.array(colunas[i], type=esquema.field(i).type) for i in range(7)]
+            arrays.append(pc.strptime(pa.array(colunas[7], type=pa.string()), format="%Y-%m-%d %H:%M:%S", unit="s"))
+            escritor.write_table(pa.Table.from_arrays(arrays, schema=esquema))
+            total += len(lote)
+    return total
+
+
+EXPORTADORES = {
+    "csv": exportar_csv,
+    "xlsx": exportar_xlsx,
+    "parquet": exportar_parquet,
+}
+
+
+def exportar_para_temporario(formato, cnpj, filtros=None, tamanho_lote=TAMANHO_LOTE):
+    # Grava num arquivo temporário em disco (não em memória) e devolve o caminho
+    with tempfile.NamedTemporaryFile(delete=False, prefix="historico_", suffix=f".{formato}") as tmp:
+        caminho = tmp.name
+    try:
+        EXPORTADORES[formato](caminho, cnpj, filtros, tamanho_lote=tamanho_lote)
+    except Exception:
+        os.remove(caminho)
+        raise
+    return caminho
+
+
+# -------- Trabalhos de exportação (rodam na thread) --------
+def exportar_excel_historico(cnpj, filtros):
+    return exportar_para_temporario("xlsx", cnpj, filtros)
+
+
+def exportar_csv_historico(cnpj, filtros):
+    return exportar_para_temporario("csv", cnpj, filtros)
+
+
+def exportar_pdf_historico(cnpj, filtros, usuario=None, mostrar_usuario=False, mostrar_cnpj=False):
+    # Listagem lida do banco em lotes; total e resumos vêm das agregações SQL
+    with tempfile.NamedTemporaryFile(delete=False, prefix="relatorio_", suffix=".pdf") as tmp:
+        caminho = tmp.name
+    try:
+        gerar_pdf_relatorio(
+            preparar_linhas_pdf(iterar_produtos(cnpj, **filtros)),
+            usuario=usuario,
+            cnpj=cnpj,
+            mostrar_usuario=mostrar_usuario,
+            mostrar_cnpj=mostrar_cnpj,
+            total=resumo_periodo(cnpj, **filtros)["total"],
+            resumo_empresas=total_por_empresa(cnpj, **filtros),
+            resumo_mensal=total_por_mes(cnpj, **filtros),
+            destino=caminho
+        )
+    except Exception:
+        os.remove(caminho)
+        raise
+    return caminho
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Exporta o histórico de produtos em streaming")
+    parser.add_argument("--cnpj", help="CNPJ do cliente (padrão: todos)")
+    parser.add_argument("--formato", choices=sorted(EXPORTADORES), required=True)
+    parser.add_argument("--saida", required=True, help="arquivo de destino")
+    parser.add_argument("--de", type=datetime.date.fromisoformat, help="data inicial (AAAA-MM-DD)")
+    parser.add_argument("--ate", type=datetime.date.fromisoformat, help="data final (AAAA-MM-DD)")
+    parser.add_argument("--empresa", action="append", help="filtra por empresa (pode repetir)")
+    parser.add_argument("--produto", action="append", help="filtra por produto (pode repetir)")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="linhas lidas do banco por vez")
+    args = parser.parse_args()
+
+    filtros = {
+        "data_ini": args.de,
+        "data_fim": args.ate,
+        "empresas": args.empresa,
+        "produtos": args.produto,
+    }
+    total = EXPORTADORES[args.formato](args.saida, args.cnpj, filtros, tamanho_lote=args.lote)
+    print(f"✅ {total} linha(s) exportada(s) para {args.saida}")
@@ -0,0 +1,132 @@
+# arquivo: ingestao.py
+# Processamento paralelo dos arquivos enviados: o parsing (XML) e o OCR/extração
+# (PDF e imagens) rodam num pool de processos; quem chama recebe os resultados na ordem
+# em que ficam prontos e faz a gravação no banco (um único escritor).
+import os
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+
+from leitor_xml import parse_nfe_rapido
+from leitor_pdf_imagem import (
+    EXTENSOES_IMAGEM,
+    extrair_paginas_pdf,
+    extrair_paginas_imagem,
+    juntar_paginas,
+    extrair_produtos_paginas,
+    extrair_dados_cabecalho
+)
+
+
+def numero_workers_padrao():
+    # EXTRATOR_WORKERS=0 (ou ausente) usa todos os núcleos
+    try:
+        n = int(os.getenv("EXTRATOR_WORKERS", "0"))
+    except ValueError:
+        n = 0
+    return n if n > 0 else (os.cpu_count() or 1)
+
+
+def tipo_documento(nome_arquivo):
+    nome = nome_arquivo.lower()
+    if nome.endswith(".xml"):
+        return "XML"
+    if nome.endswith(".pdf"):
+        return "PDF"
+    if nome.endswith(EXTENSOES_IMAGEM):
+        return "IMAGEM"
+    return None
+
+
+# -------- Trabalho de um arquivo (roda dentro do processo filho) --------
+def _eh_caminho(origem):
+    # origem: caminho do arquivo já gravado (o worker lê do disco, nada de bytes
+    # atravessando o pool) ou os próprios bytes
+    return isinstance(origem, (str, os.PathLike))
+
+
+def _abrir(origem):
+    return open(origem, "rb") if _eh_caminho(origem) else BytesIO(origem)
+
+
+def processar_documento(nome_arquivo, origem, ident=None):
+    # ident volta intacto no resultado, para quem chamou casar com o que enviou
+    resultado = {
+        "id": ident,
+        "nome": nome_arquivo,
+        "tipo": tipo_documento(nome_arquivo),
+        "produtos": [],
+        "empresa": "",
+        "cnpj": "",
+        "data": "",
+        "paginas": [],   # PDF: por página, o caminho usado (texto/ocr) e o tempo
+        "erro": None,
+    }
+
+    try:
+        if resultado["tipo"] == "XML":
+            with _abrir(origem) as arquivo:
+                resultado["produtos"] = parse_nfe_rapido(arquivo)
+            # dhEmi (num lote, o da primeira nota)
+            resultado["data"] = next((p["Data"] for p in resultado["produtos"] if p.get("Data")), "")
+
+        elif resultado["tipo"] in ("PDF", "IMAGEM"):
+            if resultado["tipo"] == "PDF":
+                # Com o caminho, o MuPDF lê direto do disco
+                paginas = extrair_paginas_pdf(origem if _eh_caminho(origem) else BytesIO(origem))
+            else:
+                with _abrir(origem) as arquivo:
+                    paginas = extrair_paginas_imagem(arquivo)
+            # Falha de OCR fica na página; só vira erro do documento se nenhuma página deu certo
+            erros = [f"página {p['pagina']}: {p['erro']}" for p in paginas if p.get("erro")]
+            if erros and len(erros) == len(paginas):
+                raise RuntimeError("OCR falhou em todas as páginas\n" + "\n".join(erros))
+            texto = juntar_paginas(paginas)
+            resultado["paginas"] = [{k: v for k, v in p.items() if k not in ("texto", "produtos")} for p in paginas]
+            resultado["produtos"] = extrair_produtos_paginas(paginas)
+            empresa, cnpj, data = extrair_dados_cabecalho(texto)
+            resultado.update({"empresa": empresa, "cnpj": cnpj, "data": data})
+    except Exception:
+        resultado["erro"] = traceback.format_exc()
+
+    return resultado
+
+
+# -------- Pool de processos --------
+def _iniciar_worker(workers_ocr):
+    # Cada processo tem o próprio pool de OCR (leitor_pdf_imagem._pool_ocr): divide
+    # os núcleos entre os processos em vez de cada um abrir um thread por núcleo.
+    # Um EXTRATOR_OCR_WORKERS definido pelo usuário continua valendo.
+    if not os.getenv("EXTRATOR_OCR_WORKERS"):
+        os.environ["EXTRATOR_OCR_WORKERS"] = str(workers_ocr)
+
+
+def processar_em_paralelo(documentos, max_workers=None):
+    # documentos: lista de (ident, nome_arquivo, caminho ou bytes). Gera os resultados na ordem de conclusão.
+    if max_workers is None:
+        max_workers = numero_workers_padrao()
+    max_workers = max(1, min(max_workers, len(documentos)))
+
+    # Um arquivo só (ou 1 worker) não compensa subir processos
+    if max_workers == 1:
+        for ident, nome_arquivo, origem in documentos:
+            yield processar_documento(nome_arquivo, origem, ident)
+        return
+
+    # "spawn" porque o Streamlit roda com várias threads e fork nesse cenário não é seguro
+    contexto = multiprocessing.get_context("spawn")
+    workers_ocr = max(1, (os.cpu_count() or 1) // max_workers)
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=contexto,
+                                   initializer=_iniciar_worker, initargs=(workers_ocr,))
+    try:
+        futuros = [
+            executor.submit(processar_documento, nome_arquivo, origem, ident)
+            for ident, nome_arquivo, origem in documentos
+        ]
+        for futuro in as_completed(futuros):
+            yield futuro.result()
+    finally:
+        # Quem consome pode parar no meio (erro, rerun do Streamlit, gerador
+        # descartado): sem esperar os workers, e o que ainda não começou é cancelado
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,274 @@
+# arquivo: leitor_danfe.py
+# Tabela de produtos do DANFE a partir da camada de texto do PDF, pelas
+# coordenadas das palavras (page.get_text("words")): acha o cabeçalho da tabela,
+# recorta as colunas pelos espaços vazios entre os dados, dá a cada coluna o
+# campo do título que está em cima dela e monta as linhas pela altura, numa
+# passada por página. Para páginas que vieram do OCR (sem coordenadas), ou cuja
+# tabela não deu para ler, continua valendo a heurística por linhas de leitor_pdf_imagem.
+import unicodedata
+
+
+def _rotular_coluna(texto):
+    # Título de coluna (já sem acento, maiúsculo) -> campo
+    if "DESCRI" in texto:
+        return "descricao"
+    if "NCM" in texto:
+        return "ncm"
+    if "CFOP" in texto:
+        return "cfop"
+    if "CST" in texto or "CSOSN" in texto:
+        return "cst"
+    if texto.startswith("COD"):
+        return "codigo"
+    if "QUANT" in texto or "QTD" in texto:
+        return "quantidade"
+    if "UNIT" in texto:
+        return "valor_unit"
+    if texto in ("UN", "UND", "UNID", "UNIDADE", "UN.", "UNID."):
+        return "unidade"
+    if "TOTAL" in texto and "ICMS" not in texto and "IPI" not in texto:
+        return "valor_total"
+    return "outro"
+
+
+# Onde a tabela de produtos acaba (quadros seguintes do DANFE)
+PALAVRAS_FIM_TABELA = ("ADICIONAIS", "ISSQN", "COMPLEMENTARES")
+
+
+def _normalizar(texto):
+    if texto.isascii():
+        return texto.upper()
+    sem_acento = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode()
+    return sem_acento.upper()
+
+
+def numero_br(texto):
+    # "1.234,5678" -> 1234.5678; "12.50" -> 12.5; vazio/texto -> None
+    t = texto.replace("R$", "").replace(" ", "").strip()
+    if not t:
+        return None
+    if "," in t:
+        t = t.replace(".", "").replace(",", ".")
+    try:
+        return float(t)
+    except ValueError:
+        return None
+
+
+def _eh_numero(texto):
+    return numero_br(texto) is not None
+
+
+class _Palavra:
+    __slots__ = ("x0", "y0", "x1", "y1", "texto", "norm", "bloco", "linha", "xc", "yc", "altura")
+
+    def __init__(self, w):
+        self.x0, self.y0, self.x1, self.y1, self.texto, self.bloco, self.linha = w[:7]
+        self.norm = _normalizar(w[4])
+        self.xc = (self.x0 + self.x1) / 2
+        self.yc = (self.y0 + self.y1) / 2
+        self.altura = self.y1 - self.y0
+
+
+# -------- Cabeçalho da tabela --------
+def _achar_ancora(palavras):
+    # "DESCRIÇÃO" com outro título de coluna na mesma altura (títulos muito
+    # próximos podem vir grudados numa palavra só: "PRODUTODESCRIÇÃO")
+    for p in palavras:
+        if "DESCRI" not in p.norm:
+            continue
+        vizinhas = [q for q in palavras if q is not p and abs(q.yc - p.yc) < p.altura * 1.5]
+        if any(q.norm.startswith(("NCM", "QUANT", "QTD", "CFOP", "VALOR", "V.", "VL")) for q in vizinhas):
+            return p
+    return None
+
+
+def _celulas_cabecalho(palavras, ancora):
+    # Títulos ficam numa faixa em volta da âncora (títulos de 2-3 linhas,
+    # tipo "VALOR / UNIT", são centralizados na mesma célula)
+    h = ancora.altura
+    faixa = [
+        p for p in palavras
+        if abs(p.yc - ancora.yc) <= h * 1.6 and not _eh_numero(p.texto)
+    ]
+    faixa.sort(key=lambda p: (p.bloco, p.linha, p.x0))
+
+    # Palavras da mesma linha de texto e coladas formam uma célula
+    celulas = []
+    for p in faixa:
+        atual = celulas[-1] if celulas else None
+        if (atual and atual["chave"] == (p.bloco, p.linha)
+                and p.x0 - atual["x1"] < h * 0.6 and abs(p.yc - atual["yc"]) < h * 0.5):
+            atual["palavras"].append(p)
+            atual["x1"] = max(atual["x1"], p.x1)
+        else:
+            celulas.append({"chave": (p.bloco, p.linha), "x0": p.x0, "x1": p.x1, "yc": p.yc, "palavras": [p]})
+    return celulas
+
+
+def _titulos(celulas):
+    # Células empilhadas (sobrepostas no eixo x) são um título só: "VALOR" / "UNIT"
+    titulos = []
+    for celula in sorted(celulas, key=lambda c: c["x0"]):
+        for titulo in titulos:
+            if celula["x0"] < titulo["x1"] and celula["x1"] > titulo["x0"]:
+                titulo["x0"] = min(titulo["x0"], celula["x0"])
+                titulo["x1"] = max(titulo["x1"], celula["x1"])
+                titulo["palavras"].extend(celula["palavras"])
+                break
+        else:
+            titulos.append({"x0": celula["x0"], "x1": celula["x1"], "palavras": list(celula["palavras"])})
+
+    titulos.sort(key=lambda t: t["x0"])
+    usados = set()
+    for titulo in titulos:
+        texto = " ".join(p.norm for p in sorted(titulo["palavras"], key=lambda p: (round(p.yc), p.x0)))
+        campo = _rotular_coluna(texto)
+        # Se dois títulos caem no mesmo campo, vale o primeiro da esquerda
+        titulo["campo"] = campo if campo not in usados else "outro"
+        usados.add(campo)
+    return titulos
+
+
+def _colunas(corpo, titulos):
+    # Os títulos vêm centralizados e os dados alinhados à esquerda (texto) ou à
+    # direita (números), então o limite entre colunas sai dos dados: faixas do
+    # eixo x ocupadas por alguma palavra do corpo, separadas por espaços vazios
+    # maiores que um espaço entre palavras.
+    if not corpo:
+        return []
+    folga = 0.3 * sorted(p.altura for p in corpo)[len(corpo) // 2]
+    faixas = []
+    for p in sorted(corpo, key=lambda p: p.x0):
+        if faixas and p.x0 - faixas[-1][1] < folga:
+            faixas[-1][1] = max(faixas[-1][1], p.x1)
+        else:
+            faixas.append([p.x0, p.x1])
+
+    # Cada faixa herda o campo do título que mais se sobrepõe (ou do mais
+    # próximo); se duas faixas caem no mesmo título, fica a de maior afinidade
+    colunas = []
+    melhor = {}
+    for x0, x1 in faixas:
+        def afinidade(t):
+            sobreposicao = min(x1, t["x1"]) - max(x0, t["x0"])
+            if sobreposicao > 0:
+                return (1, sobreposicao)
+            return (0, -abs((x0 + x1) / 2 - (t["x0"] + t["x1"]) / 2))
+        titulo = max(titulos, key=afinidade)
+        coluna = {"ini": x0, "fim": x1, "campo": titulo["campo"], "afinidade": afinidade(titulo)}
+        anterior = melhor.get(coluna["campo"])
+        if anterior is None or coluna["afinidade"] > anterior["afinidade"]:
+            if anterior is not None:
+                anterior["campo"] = "outro"
+            melhor[coluna["campo"]] = coluna
+        else:
+            coluna["campo"] = "outro"
+        colunas.append(coluna)
+    return colunas
+
+
+# -------- Linhas da tabela --------
+def _agrupar_linhas(palavras):
+    palavras = sorted(palavras, key=lambda p: p.yc)
+    linhas = []
+    for p in palavras:
+        if linhas and abs(p.yc - linhas[-1]["yc"]) < p.altura * 0.5:
+            linhas[-1]["palavras"].append(p)
+        else:
+            linhas.append({"yc": p.yc, "palavras": [p]})
+    return [l["palavras"] for l in linhas]
+
+
+def _celulas_linha(palavras, colunas):
+    celulas = {}
+    for p in sorted(palavras, key=lambda p: p.x0):
+        xc = p.xc
+        for coluna in colunas:
+            if coluna["ini"] <= xc <= coluna["fim"]:
+                campo = coluna["campo"]
+                celulas[campo] = f"{celulas[campo]} {p.texto}" if campo in celulas else p.texto
+                break
+    return celulas
+
+
+def _montar_produto(item):
+    descricao = " ".join(item["descricao"]).strip()
+    qtd = numero_br(item.get("quantidade", ""))
+    unit = numero_br(item.get("valor_unit", ""))
+    total = numero_br(item.get("valor_total", ""))
+
+    if total is None and qtd is not None and unit is not None:
+        total = round(qtd * unit, 2)
+    if unit is None and qtd and total is not None:
+        unit = total / qtd
+    # Sem unitário (quantidade zero e unitário ilegível) a linha não dá para conferir
+    if not descricao or qtd is None or unit is None or total is None:
+        return None
+    return {
+        "Produto": descricao,
+        "Quantidade": qtd,
+        "Valor Unitário": unit,
+        "Valor Total": total,
+    }
+
+
+def _consistente(produto):
+    # quantidade x unitário bate com o total (com folga para arredondamento e desconto)
+    esperado = produto["Quantidade"] * produto["Valor Unitário"]
+    return abs(esperado - produto["Valor Total"]) <= max(0.05, abs(produto["Valor Total"]) * 0.01)
+
+
+def extrair_produtos_danfe_pagina(pagina, textpage=None):
+    # pagina: fitz.Page; textpage: a extração de texto da página, se quem chama
+    # já tem uma. Devolve a lista de produtos, ou None se a página não tem a
+    # tabela de produtos do DANFE (ou não deu para lê-la com segurança).
+    palavras = [_Palavra(w) for w in pagina.get_text("words", textpage=textpage)]
+    ancora = _achar_ancora(palavras)
+    if ancora is None:
+        return None
+
+    celulas = _celulas_cabecalho(palavras, ancora)
+    titulos = _titulos(celulas)
+    campos = {t["campo"] for t in titulos}
+    if "descricao" not in campos or not ({"quantidade", "valor_total"} & campos):
+        return None
+
+    topo = max(p.y1 for c in celulas for p in c["palavras"])
+    fim = min(
+        (p.y0 for p in palavras if p.y0 > topo and p.norm in PALAVRAS_FIM_TABELA),
+        default=float("inf")
+    )
+    corpo = [p for p in palavras if topo < p.yc < fim]
+    colunas = _colunas(corpo, titulos)
+
+    produtos = []
+    item = None
+    for linha in _agrupar_linhas(corpo):
+        celulas_linha = _celulas_linha(linha, colunas)
+        numerica = any(_eh_numero(celulas_linha.get(c, "")) for c in ("quantidade", "valor_total"))
+
+        if numerica:
+            # Começa um produto novo
+            if item:
+                produto = _montar_produto(item)
+                if produto:
+                    produtos.append(produto)
+            item = dict(celulas_linha)
+            item["descricao"] = [celulas_linha.get("descricao", "")]
+        elif item and set(celulas_linha) <= {"descricao", "codigo"} and "descricao" in celulas_linha:
+            # Descrição que quebrou para a linha de baixo
+            item["descricao"].append(celulas_linha["descricao"])
+
+    if item:
+        produto = _montar_produto(item)
+        if produto:
+            produtos.append(produto)
+
+    # Colunas trocadas (títulos grudados, layout fora do padrão) aparecem como
+    # quantidade x unitário != total: nesse caso é melhor o chamador usar a
+    # heurística por linhas do que gravar números errados
+    inconsistentes = sum(1 for p in produtos if not _consistente(p))
+    if not produtos or inconsistentes * 2 > len(produtos):
+        return None
+    return produtos
@@ -1,46 +1,459 @@
 import fitz  # PyMuPDF
-from PIL import Image
-import pytesseract
+import numpy as np
+from PIL import Image, ImageOps, ImageSequence
 # Removed redundant import of re
-from pdf2image import convert_from_path
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from functools import lru_cache
 from datetime import datetime
-import tempfile
+import threading
+import time
 import re
 import os
 
+from cache_ocr import cache_ocr
+from leitor_danfe import extrair_produtos_danfe_pagina
+from ocr import motor_ocr
 
-# Caminho do Tesseract no Windows (ajuste se necessário)
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-POPPLER_PATH = r'C:\Program Files (x86)\Poppler\poppler\Library\bin'
 
-# -------- Leitura de PDF (com fallback para OCR) --------
-def extrair_texto_pdf(caminho_pdf):
-    caminho_pdf.seek(0)  # 🧠 ESSENCIAL
-    doc = fitz.open(stream=caminho_pdf.read(), filetype="pdf")
+# -------- Configuração do OCR --------
+# As páginas são rasterizadas em memória pelo próprio PyMuPDF (sem poppler nem
+# arquivo temporário) e o OCR roda em várias páginas ao mesmo tempo.
+# Motor (tesserocr/pytesseract), executável e tessdata: ver ocr.py.
+OCR_IDIOMA = "por"
+OCR_DPI = int(os.getenv("EXTRATOR_OCR_DPI", "300"))
+OCR_CINZA = os.getenv("EXTRATOR_OCR_CINZA", "1") != "0"
 
-    texto = ""
-    for pagina in doc:
-        texto += pagina.get_text()
-    doc.close()
+# Cada página já tem a sua thread de OCR; o paralelismo interno do tesseract
+# (OpenMP) só disputaria os mesmos núcleos
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
 
-    if len(texto.strip()) < 50:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            tmp_file.write(caminho_pdf.read())
-            tmp_path = tmp_file.name
 
-        imagens = convert_from_path(tmp_path, poppler_path=POPPLER_PATH)
-        texto = ""
-        for img in imagens:
-            texto += pytesseract.image_to_string(img, lang='por')
-    return texto
+def numero_workers_ocr():
+    # EXTRATOR_OCR_WORKERS=0 (ou ausente) usa todos os núcleos; nos workers de
+    # ingestao.processar_em_paralelo o padrão é núcleos ÷ processos
+    try:
+        n = int(os.getenv("EXTRATOR_OCR_WORKERS", "0"))
+    except ValueError:
+        n = 0
+    return n if n > 0 else (os.cpu_count() or 1)
+
+
+def rasterizar_pagina(pagina, dpi=None, cinza=None):
+    dpi = dpi or OCR_DPI
+    cinza = OCR_CINZA if cinza is None else cinza
+    pix = pagina.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY if cinza else fitz.csRGB, alpha=False)
+    return Image.frombytes("L" if cinza else "RGB", (pix.width, pix.height), pix.samples)
+
+
+@lru_cache(maxsize=1)
+def versao_tesseract():
+    # Entra na chave do cache: atualizar o tesseract invalida os resultados antigos
+    return motor_ocr().versao()
+
 
-# -------- Leitura de Imagem com OCR --------
-def extrair_texto_imagem(caminho_imagem):
-    imagem = Image.open(caminho_imagem)
-    texto = pytesseract.image_to_string(imagem, lang='por')
+def ocr_imagem(imagem, lang=OCR_IDIOMA, dpi=None):
+    motor = motor_ocr()
+    if not cache_ocr.ativo:
+        return motor.reconhecer(imagem, lang)
+
+    chave = cache_ocr.chave(imagem, dpi, lang, versao_tesseract())
+    texto = cache_ocr.obter(chave)
+    if texto is None:
+        texto = motor.reconhecer(imagem, lang)
+        cache_ocr.gravar(chave, texto)
     return texto
 
+
+def _ocr_medido(imagem, lang, dpi):
+    inicio = time.perf_counter()
+    texto = ocr_imagem(imagem, lang, dpi)
+    return texto, time.perf_counter() - inicio
+
+
+# Pool de OCR do processo: as threads (e o idioma carregado em cada uma, no
+# tesserocr) ficam vivas de um documento para o outro
+_executor_ocr = None
+_lock_executor = threading.Lock()
+
+
+def _pool_ocr():
+    global _executor_ocr
+    with _lock_executor:
+        if _executor_ocr is None:
+            _executor_ocr = ThreadPoolExecutor(max_workers=numero_workers_ocr(), thread_name_prefix="ocr")
+        return _executor_ocr
+
+
+def _ocr_paginas_medido(doc, indices, dpi=None, cinza=None, max_workers=None, lang=OCR_IDIOMA):
+    # Rasteriza no thread principal (um Document do fitz não deve ser usado por
+    # várias threads) e manda o OCR para o pool; tanto o tesserocr quanto o
+    # processo do pytesseract trabalham fora do GIL.
+    # max_workers limita quantas páginas ficam no OCR ao mesmo tempo.
+    # Devolve [(texto, segundos, erro)] na ordem de indices; uma página que falha
+    # (tesseract ausente, travou) vem com texto vazio e o erro, sem derrubar as outras.
+    if not indices:
+        return []
+    if max_workers is None:
+        max_workers = numero_workers_ocr()
+    max_workers = max(1, min(max_workers, len(indices)))
+
+    executor = _pool_ocr()
+    resultados = []
+    em_andamento = deque()
+
+    def concluir_mais_antiga():
+        futuro, t_raster = em_andamento.popleft()
+        if isinstance(futuro, Exception):
+            resultados.append(("", t_raster, _descrever_erro(futuro)))
+            return
+        try:
+            texto, t_ocr = futuro.result()
+        except Exception as e:
+            resultados.append(("", t_raster, _descrever_erro(e)))
+            return
+        resultados.append((texto, t_raster + t_ocr, None))
+
+    for indice in indices:
+        inicio = time.perf_counter()
+        try:
+            imagem = rasterizar_pagina(doc[indice], dpi=dpi, cinza=cinza)
+        except Exception as e:
+            em_andamento.append((e, time.perf_counter() - inicio))
+            continue
+        t_raster = time.perf_counter() - inicio
+
+        # A próxima página já fica rasterizada enquanto espera uma vaga
+        while len(em_andamento) >= max_workers:
+            concluir_mais_antiga()
+        em_andamento.append((executor.submit(_ocr_medido, imagem, lang, dpi or OCR_DPI), t_raster))
+
+    while em_andamento:
+        concluir_mais_antiga()
+    return resultados
+
+
+def _descrever_erro(erro):
+    return f"{type(erro).__name__}: {erro}"
+
+
+def ocr_paginas(doc, dpi=None, cinza=None, max_workers=None, lang=OCR_IDIOMA):
+    # OCR de todas as páginas, texto na ordem das páginas (falha em qualquer uma levanta)
+    indices = list(range(doc.page_count))
+    resultados = _ocr_paginas_medido(doc, indices, dpi, cinza, max_workers, lang)
+    for _, _, erro in resultados:
+        if erro:
+            raise RuntimeError(erro)
+    return [texto for texto, _, _ in resultados]
+
+
+# -------- Classificação por página: camada de texto ou OCR --------
+# Densidade medida em caracteres (sem espaços) por área de uma página A4, para
+# páginas de tamanhos diferentes serem comparáveis.
+AREA_A4 = 595 * 842
+MINIMO_CARACTERES_PAGINA = 50       # abaixo disso a página não tem texto útil
+MINIMO_CARACTERES_ESCANEADA = 300   # página coberta por imagem precisa de mais que isso
+COBERTURA_ESCANEADA = 0.6           # fração da página coberta por imagens
+
+
+def cobertura_imagem(pagina):
+    area = abs(pagina.rect) or 1
+    coberta = 0.0
+    for info in pagina.get_image_info():
+        caixa = fitz.Rect(info["bbox"]) & pagina.rect
+        coberta += abs(caixa)
+    return min(coberta / area, 1.0)
+
+
+def classificar_pagina(pagina, textpage=None):
+    # -> (texto, caracteres, densidade, cobertura, precisa_ocr)
+    texto = pagina.get_text(textpage=textpage)
+    caracteres = len("".join(texto.split()))
+    densidade = caracteres * AREA_A4 / (abs(pagina.rect) or AREA_A4)
+    cobertura = cobertura_imagem(pagina)
+
+    # Sem texto, ou digitalizada com só um carimbo/cabeçalho de texto por cima
+    precisa_ocr = densidade < MINIMO_CARACTERES_PAGINA or (
+        cobertura >= COBERTURA_ESCANEADA and densidade < MINIMO_CARACTERES_ESCANEADA
+    )
+    # Página em branco (sem imagem nem desenho) não tem o que o OCR ler
+    if precisa_ocr and cobertura == 0 and not pagina.get_drawings():
+        precisa_ocr = False
+    return texto, caracteres, densidade, cobertura, precisa_ocr
+
+
+# -------- Leitura de PDF (OCR só nas páginas sem camada de texto) --------
+def abrir_pdf(arquivo_pdf):
+    # Caminho do arquivo já gravado: o MuPDF lê direto do disco, sem copiar
+    # o PDF para a memória do Python. Objeto de arquivo: lê os bytes.
+    if isinstance(arquivo_pdf, (str, os.PathLike)):
+        return fitz.open(arquivo_pdf, filetype="pdf")
+    arquivo_pdf.seek(0)  # 🧠 ESSENCIAL
+    return fitz.open(stream=arquivo_pdf.read(), filetype="pdf")
+
+
+def extrair_paginas_pdf(arquivo_pdf, dpi=None, cinza=None, max_workers=None):
+    # Uma entrada por página, em ordem:
+    # {"pagina", "metodo" ("texto"/"ocr"), "texto", "caracteres", "cobertura_imagem", "segundos", "produtos", "erro"}
+    # "produtos" vem da tabela lida pelas coordenadas (páginas de texto); None
+    # quando a página não tem a tabela ou foi para o OCR. "erro": por que o OCR
+    # da página falhou (as demais páginas seguem valendo), ou None.
+    doc = abrir_pdf(arquivo_pdf)
+
+    try:
+        paginas = []
+        para_ocr = []
+        for indice, pagina in enumerate(doc):
+            inicio = time.perf_counter()
+            # Uma extração da camada de texto serve ao texto corrido e às coordenadas
+            textpage = pagina.get_textpage()
+            texto, caracteres, _, cobertura, precisa_ocr = classificar_pagina(pagina, textpage)
+            produtos = None if precisa_ocr else extrair_produtos_danfe_pagina(pagina, textpage)
+            paginas.append({
+                "pagina": indice + 1,
+                "metodo": "ocr" if precisa_ocr else "texto",
+                "texto": texto,
+                "caracteres": caracteres,
+                "cobertura_imagem": round(cobertura, 3),
+                "segundos": time.perf_counter() - inicio,
+                "produtos": produtos,
+                "erro": None,
+            })
+            if precisa_ocr:
+                para_ocr.append(indice)
+
+        for indice, (texto, segundos, erro) in zip(para_ocr, _ocr_paginas_medido(doc, para_ocr, dpi, cinza, max_workers)):
+            paginas[indice]["texto"] = texto
+            paginas[indice]["caracteres"] = len("".join(texto.split()))
+            paginas[indice]["segundos"] += segundos
+            paginas[indice]["erro"] = erro
+    finally:
+        doc.close()
+    return paginas
+
+
+def juntar_paginas(paginas):
+    # Cada página termina em quebra de linha, para uma não grudar na outra
+    return "".join(p["texto"] if p["texto"].endswith("\n") else p["texto"] + "\n" for p in paginas)
+
+
+def extrair_texto_pdf(caminho_pdf, dpi=None, cinza=None, max_workers=None):
+    return juntar_paginas(extrair_paginas_pdf(caminho_pdf, dpi=dpi, cinza=cinza, max_workers=max_workers))
+
+# -------- Pré-processamento de imagem para o OCR --------
+# Fotos de celular chegam com 12 MP, inclinadas e com fundo cinza; o tesseract
+# fica lento e erra mais. Antes do OCR: orientação do EXIF, tons de cinza,
+# resolução normalizada, binarização (Otsu), correção da inclinação e corte das margens.
+EXTENSOES_IMAGEM = (".jpg", ".jpeg", ".png", ".tif", ".tiff")
+LARGURA_A4_POLEGADAS = 8.27
+INCLINACAO_MAXIMA = 5.0   # graus testados para cada lado
+PASSO_INCLINACAO = 0.5
+MARGEM_CORTE = 20         # pixels mantidos em volta do conteúdo
+
+
+def _dpi_da_imagem(imagem):
+    dpi = imagem.info.get("dpi")
+    if isinstance(dpi, tuple):
+        dpi = dpi[0]
+    try:
+        dpi = float(dpi)
+    except (TypeError, ValueError):
+        return None
+    # Fotos costumam vir com 72 dpi "de fábrica", que não diz nada do papel;
+    # só confia quando a largura resultante é de um documento de verdade
+    if dpi < 100 or imagem.width / dpi > 17:
+        return None
+    return dpi
+
+
+def normalizar_resolucao(imagem, dpi_alvo=None):
+    dpi_alvo = dpi_alvo or OCR_DPI
+    dpi_origem = _dpi_da_imagem(imagem)
+    if dpi_origem:
+        # Digitalização com DPI conhecido: leva para o DPI do OCR (aumenta ou reduz)
+        escala = dpi_alvo / dpi_origem
+    else:
+        # Foto: supõe o documento ocupando a largura, no máximo uma A4 no DPI alvo
+        escala = min(1.0, LARGURA_A4_POLEGADAS * dpi_alvo / imagem.width)
+
+    if abs(escala - 1.0) < 0.05:
+        return imagem
+    tamanho = (max(1, round(imagem.width * escala)), max(1, round(imagem.height * escala)))
+    return imagem.resize(tamanho, Image.LANCZOS, reducing_gap=3.0 if escala < 1 else None)
+
+
+def limiar_otsu(imagem_cinza):
+    hist = np.array(imagem_cinza.histogram()[:256], dtype=np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 128
+    niveis = np.arange(256)
+    peso_fundo = np.cumsum(hist)
+    soma_fundo = np.cumsum(hist * niveis)
+    peso_frente = total - peso_fundo
+    media_fundo = np.divide(soma_fundo, peso_fundo, out=np.zeros(256), where=peso_fundo > 0)
+    media_frente = np.divide(soma_fundo[-1] - soma_fundo, peso_frente, out=np.zeros(256), where=peso_frente > 0)
+    variancia_entre = peso_fundo * peso_frente * (media_fundo - media_frente) ** 2
+    return int(np.argmax(variancia_entre))
+
+
+def binarizar(imagem_cinza, limiar=None):
+    limiar = limiar_otsu(imagem_cinza) if limiar is None else limiar
+    return imagem_cinza.point(lambda v: 255 if v > limiar else 0, mode="L")
+
+
+def angulo_inclinacao(binaria, maximo=INCLINACAO_MAXIMA, passo=PASSO_INCLINACAO):
+    # Perfil de projeção: com o texto alinhado, as somas por linha alternam entre
+    # linhas de texto e entrelinhas, e a diferença entre linhas vizinhas é máxima.
+    # Roda numa cópia reduzida, que basta para achar o ângulo, e só olha o miolo
+    # da imagem: bordas da foto e fundo da mesa são retos e puxariam para 0°.
+    pequena = binaria.copy()
+    pequena.thumbnail((1000, 1000), Image.BOX)
+    tinta = ImageOps.invert(pequena)
+    largura, altura = tinta.size
+    miolo = (largura // 5, altura // 5, largura - largura // 5, altura - altura // 5)
+
+    melhor_angulo, melhor_pontuacao = 0.0, -1.0
+    for angulo in np.arange(-maximo, maximo + passo / 2, passo):
+        girada = tinta.rotate(float(angulo), resample=Image.BILINEAR, fillcolor=0).crop(miolo)
+        perfil = np.asarray(girada, dtype=np.float32).sum(axis=1)
+        pontuacao = float(np.square(np.diff(perfil)).sum())
+        if pontuacao > melhor_pontuacao:
+            melhor_angulo, melhor_pontuacao = float(angulo), pontuacao
+    return melhor_angulo
+
+
+def _papel(binaria):
+    # Faixa de linhas (ou colunas) em que mais da metade é branco: o papel.
+    # O que sobra nas bordas é mesa/fundo escuro da foto.
+    claro = np.asarray(binaria) > 0
+    linhas = np.flatnonzero(claro.mean(axis=1) > 0.5)
+    if not len(linhas):
+        return None
+    claro = claro[linhas[0]:linhas[-1] + 1]
+    colunas = np.flatnonzero(claro.mean(axis=0) > 0.5)
+    if not len(colunas):
+        return None
+    return colunas[0], linhas[0], colunas[-1] + 1, linhas[-1] + 1
+
+
+def cortar_margens(binaria, margem=MARGEM_CORTE):
+    # Tira primeiro o fundo escuro em volta do papel e depois o branco em volta do conteúdo
+    papel = _papel(binaria)
+    if papel:
+        binaria = binaria.crop(tuple(int(v) for v in papel))
+
+    caixa = ImageOps.invert(binaria).getbbox()
+    if not caixa:
+        return binaria
+    esquerda, topo, direita, base = caixa
+    return binaria.crop((
+        max(0, esquerda - margem),
+        max(0, topo - margem),
+        min(binaria.width, direita + margem),
+        min(binaria.height, base + margem),
+    ))
+
+
+def preprocessar_imagem(imagem, dpi_alvo=None):
+    imagem = ImageOps.exif_transpose(imagem)
+    info = imagem.info
+    cinza = imagem.convert("L")
+    cinza.info = info
+    cinza = normalizar_resolucao(cinza, dpi_alvo)
+
+    limiar = limiar_otsu(cinza)
+    binaria = binarizar(cinza, limiar)
+
+    # Gira a versão em tons de cinza (bicúbica) e só então binariza de novo.
+    # Os cantos novos entram escuros, junto com o fundo que cortar_margens remove.
+    angulo = angulo_inclinacao(binaria)
+    if angulo:
+        cinza = cinza.rotate(angulo, resample=Image.BICUBIC, expand=True, fillcolor=0)
+        binaria = binarizar(cinza, limiar)
+
+    return cortar_margens(binaria)
+
+
+def _ocr_imagem_preprocessada(imagem, lang, dpi_alvo):
+    inicio = time.perf_counter()
+    texto = ocr_imagem(preprocessar_imagem(imagem, dpi_alvo), lang, dpi_alvo)
+    return texto, time.perf_counter() - inicio
+
+
+# -------- Leitura de Imagem com OCR (JPG/PNG/TIFF, inclusive TIFF de várias páginas) --------
+def extrair_paginas_imagem(arquivo_imagem, dpi=None, max_workers=None, lang=OCR_IDIOMA):
+    # Mesmo formato de extrair_paginas_pdf; cada quadro do arquivo é uma página.
+    # Quadros são lidos em sequência aqui; pré-processamento e OCR vão para o pool.
+    if hasattr(arquivo_imagem, "seek"):
+        arquivo_imagem.seek(0)
+    dpi_alvo = dpi or OCR_DPI
+    if max_workers is None:
+        max_workers = numero_workers_ocr()
+    max_workers = max(1, max_workers)
+
+    executor = _pool_ocr()
+    paginas = []
+    em_andamento = deque()
+
+    def concluir_mais_antiga():
+        futuro, pagina = em_andamento.popleft()
+        try:
+            texto, segundos = futuro.result()
+        except Exception as e:
+            pagina["erro"] = _descrever_erro(e)
+            return
+        pagina.update({
+            "texto": texto,
+            "caracteres": len("".join(texto.split())),
+            "segundos": pagina["segundos"] + segundos,
+        })
+
+    with Image.open(arquivo_imagem) as imagem:
+        for indice, quadro in enumerate(ImageSequence.Iterator(imagem)):
+            inicio = time.perf_counter()
+            copia = quadro.copy()
+            copia.info = dict(quadro.info)
+            pagina = {
+                "pagina": indice + 1,
+                "metodo": "ocr",
+                "texto": "",
+                "caracteres": 0,
+                "cobertura_imagem": 1.0,
+                "segundos": time.perf_counter() - inicio,
+                "produtos": None,
+                "erro": None,
+            }
+            paginas.append(pagina)
+
+            while len(em_andamento) >= max_workers:
+                concluir_mais_antiga()
+            em_andamento.append((executor.submit(_ocr_imagem_preprocessada, copia, lang, dpi_alvo), pagina))
+
+    while em_andamento:
+        concluir_mais_antiga()
+    return paginas
+
+
+def extrair_texto_imagem(caminho_imagem, dpi=None, max_workers=None):
+    return juntar_paginas(extrair_paginas_imagem(caminho_imagem, dpi=dpi, max_workers=max_workers))
+
 # -------- Extração de Produtos --------
+def extrair_produtos_paginas(paginas):
+    # Páginas com a tabela lida pelas coordenadas usam esses produtos; o resto
+    # (OCR ou layout não reconhecido) passa junto pela heurística por linhas
+    produtos = []
+    sem_tabela = []
+    for pagina in paginas:
+        if pagina.get("produtos") is not None:
+            produtos.extend(pagina["produtos"])
+        else:
+            sem_tabela.append(pagina)
+    if sem_tabela:
+        produtos.extend(extrair_produtos_pdf_livre(juntar_paginas(sem_tabela)))
+    return produtos
+
+
 def extrair_produtos_pdf_livre(texto):
     import re
 
@@ -94,6 +507,42 @@ def extrair_produtos_pdf_livre(texto):
 
     return produtos
 
+# -------- Chave de acesso (44 dígitos) --------
+# O DANFE imprime a chave em blocos ("3524 0312 3456 ..."), às vezes com pontos;
+# o dígito verificador (módulo 11) descarta outras sequências longas de números.
+PADRAO_CHAVE = re.compile(r"\d(?:[ .]?\d){43,}")
+
+
+def chave_valida(chave):
+    if len(chave) != 44 or not chave.isdigit():
+        return False
+    soma = sum(int(d) * (2 + i % 8) for i, d in enumerate(reversed(chave[:43])))
+    dv = 11 - soma % 11
+    return (0 if dv >= 10 else dv) == int(chave[43])
+
+
+def extrair_chave_acesso(texto):
+    for match in PADRAO_CHAVE.finditer(texto):
+        digitos = re.sub(r"\D", "", match.group(0))
+        # A sequência pode vir grudada em outros números: testa cada janela de 44
+        for inicio in range(len(digitos) - 43):
+            if chave_valida(digitos[inicio:inicio + 44]):
+                return digitos[inicio:inicio + 44]
+    return ""
+
+
+def chave_acesso_pdf(arquivo_pdf):
+    # Só a camada de texto da primeira página: sem OCR, sem ler o resto do PDF
+    try:
+        doc = abrir_pdf(arquivo_pdf)
+    except Exception:
+        return ""
+    try:
+        return extrair_chave_acesso(doc[0].get_text()) if doc.page_count else ""
+    finally:
+        doc.close()
+
+
 # -------- Extração de Empresa, CNPJ e Data --------
 def extrair_dados_cabecalho(texto):
     empresa = ""
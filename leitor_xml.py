@@ -1,18 +1,13 @@
+import re
 import xml.etree.ElementTree as ET
 
-def parse_nfe(xml_file):
-    xml_file.seek(0)
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
-
-    # Namespace direto (sem prefixo nfe:)
-    ns = {"ns": "http://www.portalfiscal.inf.br/nfe"}
+# Namespace direto (sem prefixo nfe:)
+NS_NFE = "http://www.portalfiscal.inf.br/nfe"
+TAG_INFNFE = f"{{{NS_NFE}}}infNFe"
 
-    # Pega o nó infNFe corretamente
-    infNFe = root.find(".//ns:infNFe", ns)
-    if infNFe is None:
-        return []
 
+# -------- Extração de uma única infNFe --------
+def _produtos_da_infnfe(infNFe, ns):
     # Extrai emitente
     emit = infNFe.find("ns:emit", ns)
     emitente = emit.find("ns:xNome", ns).text.strip() if emit is not None else "Desconhecida"
@@ -21,7 +16,6 @@ def parse_nfe(xml_file):
     # Data de emissão
     data_emissao = infNFe.findtext("ns:ide/ns:dhEmi", default="", namespaces=ns)
 
-    produtos = []
     for det in infNFe.findall("ns:det", ns):
         nome = det.findtext("ns:prod/ns:xProd", default="", namespaces=ns)
         qtd_str = det.findtext("ns:prod/ns:qCom", default="0", namespaces=ns)
@@ -36,7 +30,7 @@ def parse_nfe(xml_file):
             print(f"[ERRO] Produto '{nome}' inválido: {e}")
             continue
 
-        produtos.append({
+        yield {
             "Produto": nome,
             "Quantidade": qtd,
             "Valor Unitário": valor_unit,
@@ -45,7 +39,329 @@ def parse_nfe(xml_file):
             "Empresa": emitente,
             "Data": data_emissao,
             "Origem": "XML"
-        })
+        }
+
+
+# -------- Chave de acesso (leitura parcial, para checar duplicidade antes do parsing) --------
+TAGS_NOTA_UNICA = (f"{{{NS_NFE}}}NFe", f"{{{NS_NFE}}}nfeProc")
+
+
+def extrair_chave_nfe(xml_file):
+    # Lê só até a abertura da primeira infNFe. Devolve a chave de 44 dígitos
+    # apenas quando o documento é de nota única (NFe/nfeProc); lotes e
+    # exportações concatenadas não podem ser identificados por uma chave só.
+    xml_file.seek(0)
+    chave = ""
+    try:
+        for _, elem in ET.iterparse(xml_file, events=("start",)):
+            if elem.tag not in TAGS_NOTA_UNICA and elem.tag != TAG_INFNFE:
+                return ""
+            if elem.tag == TAG_INFNFE:
+                chave = elem.get("Id", "")
+                chave = chave[3:] if chave.startswith("NFe") else chave
+                break
+    except ET.ParseError:
+        return ""
+    finally:
+        xml_file.seek(0)
+    if len(chave) != 44 or not chave.isdigit():
+        return ""
+    # XMLs concatenados começam como uma nota única: a chave só vale se não houver outra
+    try:
+        return "" if _varias_notas(xml_file) else chave
+    finally:
+        xml_file.seek(0)
+
+
+RE_ABRE_INFNFE = re.compile(rb"<(?:[\w.-]{1,20}:)?infNFe[\s>]")
+
+
+def _varias_notas(xml_file, tamanho_bloco=1024 * 1024):
+    # Procura uma segunda abertura de <infNFe> nos bytes, sem montar árvore
+    xml_file.seek(0)
+    achadas = 0
+    resto = b""
+    while True:
+        bloco = xml_file.read(tamanho_bloco)
+        dados = resto + bloco
+        # A tag pode ficar partida entre dois blocos: o fim só conta na próxima volta
+        limite = len(dados) - 32 if bloco else len(dados)
+        for m in RE_ABRE_INFNFE.finditer(dados):
+            if m.start() < limite:
+                achadas += 1
+                if achadas > 1:
+                    return True
+        if not bloco:
+            return False
+        resto = dados[max(limite, 0):]
+
+
+# -------- Arquivos com várias raízes (exportações que só concatenam os XMLs) --------
+# O parser recusa a segunda raiz ("junk after document element"). A leitura passa por
+# este envelope: mantém a declaração do início, tira as declarações das notas seguintes
+# e põe tudo sob uma raiz artificial, bloco a bloco, sem carregar o arquivo inteiro.
+RE_DECLARACAO = re.compile(rb"<\?xml\s[^>]*\?>")
+RE_DECLARACAO_INICIAL = re.compile(rb"(?:\xef\xbb\xbf)?<\?xml\s[^>]*\?>")
+RAIZ_ENVELOPE = b"documentos"
+
+
+class _Envelope:
+    def __init__(self, arquivo, tamanho_bloco=64 * 1024):
+        self.arquivo = arquivo
+        self.tamanho_bloco = tamanho_bloco
+        self.pronto = b""
+        self.resto = b""     # possível declaração partida no fim do bloco anterior
+        self.inicio = True
+        self.fim = False
+
+    def _encher(self):
+        bloco = self.arquivo.read(self.tamanho_bloco)
+        dados = self.resto + bloco
+        if self.inicio:
+            # A declaração inicial precisa chegar inteira antes de decidir
+            if bloco and b">" not in dados:
+                self.resto = dados
+                return
+            self.inicio = False
+            declaracao = RE_DECLARACAO_INICIAL.match(dados)
+            cabeca = dados[:declaracao.end()] if declaracao else b""
+            self.pronto += cabeca + b"<" + RAIZ_ENVELOPE + b">"
+            dados = dados[len(cabeca):]
+
+        if not bloco:
+            self.pronto += RE_DECLARACAO.sub(b"", dados) + b"</" + RAIZ_ENVELOPE + b">"
+            self.resto = b""
+            self.fim = True
+            return
+
+        # Uma declaração não tem "<" por dentro: se o último "<" não fechou, segura dali
+        corte = dados.rfind(b"<")
+        if corte == -1 or dados.find(b">", corte) != -1:
+            corte = len(dados)
+        self.pronto += RE_DECLARACAO.sub(b"", dados[:corte])
+        self.resto = dados[corte:]
+
+    def read(self, n=-1):
+        while not self.fim and (n is None or n < 0 or len(self.pronto) < n):
+            self._encher()
+        if n is None or n < 0:
+            n = len(self.pronto)
+        dados, self.pronto = self.pronto[:n], self.pronto[n:]
+        return dados
+
+
+# Até este tamanho a árvore inteira cabe com folga na memória e o ET.parse em C
+# é bem mais rápido que o iterparse; acima disso volta para o streaming.
+LIMITE_ARVORE_COMPLETA = 8 * 1024 * 1024
+
+
+def _tamanho_arquivo(xml_file):
+    try:
+        pos = xml_file.tell()
+        xml_file.seek(0, 2)
+        tamanho = xml_file.tell()
+        xml_file.seek(pos)
+        return tamanho
+    except (AttributeError, OSError):
+        return None
+
+
+# -------- Leitura (árvore inteira até o limite, streaming acima; lotes e XMLs concatenados) --------
+def _infnfes_etree(xml_file):
+    # Cada infNFe do arquivo, na ordem. Quem consome precisa terminar de ler a nota
+    # antes de pedir a próxima: no streaming ela é descartada logo em seguida.
+    tamanho = _tamanho_arquivo(xml_file)
+    if tamanho is not None and tamanho <= LIMITE_ARVORE_COMPLETA:
+        yield from ET.parse(_Envelope(xml_file)).getroot().iter(TAG_INFNFE)
+        return
+
+    pilha = []
+    dentro_infnfe = 0
+
+    for evento, elem in ET.iterparse(_Envelope(xml_file), events=("start", "end")):
+        if evento == "start":
+            pilha.append(elem)
+            if elem.tag == TAG_INFNFE:
+                dentro_infnfe += 1
+            continue
+
+        pilha.pop()
+        if elem.tag == TAG_INFNFE:
+            dentro_infnfe -= 1
+            yield elem
+
+        # Nó finalizado fora de uma infNFe aberta não é mais necessário:
+        # desanexa do pai para a memória ficar do tamanho de UMA nota,
+        # não do arquivo inteiro.
+        if not dentro_infnfe and pilha:
+            elem.clear()
+            pilha[-1].remove(elem)
+
+
+def iterar_produtos_nfe(xml_file):
+    xml_file.seek(0)
+    ns = {"ns": NS_NFE}
+    for infNFe in _infnfes_etree(xml_file):
+        yield from _produtos_da_infnfe(infNFe, ns)
+
+
+def parse_nfe(xml_file):
+    return list(iterar_produtos_nfe(xml_file))
+
+
+# -------- Extração acelerada (lxml com XPath compilado, ou tag-dispatch sem lxml) --------
+try:
+    from lxml import etree as LET
+except ImportError:
+    LET = None
+
+_T_IDE = f"{{{NS_NFE}}}ide"
+_T_EMIT = f"{{{NS_NFE}}}emit"
+_T_DET = f"{{{NS_NFE}}}det"
+_T_PROD = f"{{{NS_NFE}}}prod"
+_T_DHEMI = f"{{{NS_NFE}}}dhEmi"
+_T_XNOME = f"{{{NS_NFE}}}xNome"
+_T_CNPJ = f"{{{NS_NFE}}}CNPJ"
+
+# Campos do <prod> que interessam, com o default que o findtext de parse_nfe usa
+_CAMPOS_PROD = {
+    f"{{{NS_NFE}}}xProd": (0, ""),
+    f"{{{NS_NFE}}}qCom": (1, "0"),
+    f"{{{NS_NFE}}}vUnCom": (2, "0"),
+    f"{{{NS_NFE}}}vProd": (3, "0"),
+}
+
+
+def _primeiro_filho(elem, tag):
+    for filho in elem:
+        if filho.tag == tag:
+            return filho
+    return None
+
+
+def _campos_prod(prod):
+    valores = [None, None, None, None]
+    for filho in prod:
+        pos = _CAMPOS_PROD.get(filho.tag)
+        # findtext pega a primeira ocorrência; "" se o nó existe sem texto
+        if pos is not None and valores[pos[0]] is None:
+            valores[pos[0]] = filho.text or ""
+    for tag, (i, default) in _CAMPOS_PROD.items():
+        if valores[i] is None:
+            valores[i] = default
+    return valores
+
+
+def _montar_produtos(emit, data_emissao, prods):
+    # Mesma semântica de _produtos_da_infnfe, linha a linha
+    emitente = _primeiro_filho(emit, _T_XNOME).text.strip() if emit is not None else "Desconhecida"
+    cnpj = _primeiro_filho(emit, _T_CNPJ).text.strip() if emit is not None else ""
+
+    for prod in prods:
+        if prod is None:
+            nome, qtd_str, valor_unit_str, valor_total_str = "", "0", "0", "0"
+        else:
+            nome, qtd_str, valor_unit_str, valor_total_str = _campos_prod(prod)
+
+        try:
+            qtd = float(qtd_str.replace(",", "."))
+            valor_unit = float(valor_unit_str.replace(",", "."))
+            valor_total = float(valor_total_str.replace(",", "."))
+        except Exception as e:
+            print(f"[ERRO] Produto '{nome}' inválido: {e}")
+            continue
+
+        yield {
+            "Produto": nome,
+            "Quantidade": qtd,
+            "Valor Unitário": valor_unit,
+            "Valor Total": valor_total,
+            "CNPJ": cnpj,
+            "Empresa": emitente,
+            "Data": data_emissao,
+            "Origem": "XML"
+        }
+
+
+def _produtos_infnfe_dispatch(infNFe):
+    # Uma única passada pelos filhos diretos da infNFe, despachando por tag
+    emit = None
+    ide = None
+    prods = []
+    for filho in infNFe:
+        tag = filho.tag
+        if tag == _T_DET:
+            prods.append(_primeiro_filho(filho, _T_PROD))
+        elif tag == _T_EMIT:
+            if emit is None:
+                emit = filho
+        elif tag == _T_IDE:
+            if ide is None:
+                ide = filho
+
+    data_emissao = ""
+    if ide is not None:
+        dh = _primeiro_filho(ide, _T_DHEMI)
+        if dh is not None:
+            data_emissao = dh.text or ""
+
+    return _montar_produtos(emit, data_emissao, prods)
+
+
+def _iterar_rapido_etree(xml_file):
+    for infNFe in _infnfes_etree(xml_file):
+        yield from _produtos_infnfe_dispatch(infNFe)
+
+
+if LET is not None:
+    _NS_XP = {"n": NS_NFE}
+    _XP_EMIT = LET.XPath("n:emit[1]", namespaces=_NS_XP)
+    _XP_DHEMI = LET.XPath("n:ide[1]/n:dhEmi[1]", namespaces=_NS_XP)
+    _XP_DETS = LET.XPath("n:det", namespaces=_NS_XP)
+
+
+    _XP_INFNFE = LET.XPath("descendant-or-self::n:infNFe", namespaces=_NS_XP)
+
+
+def _produtos_infnfe_lxml(infNFe):
+    emit = _XP_EMIT(infNFe)
+    dh = _XP_DHEMI(infNFe)
+    data_emissao = (dh[0].text or "") if dh else ""
+    prods = [_primeiro_filho(det, _T_PROD) for det in _XP_DETS(infNFe)]
+    return _montar_produtos(emit[0] if emit else None, data_emissao, prods)
+
+
+def _iterar_rapido_lxml(xml_file):
+    tamanho = _tamanho_arquivo(xml_file)
+    if tamanho is not None and tamanho <= LIMITE_ARVORE_COMPLETA:
+        raiz = LET.parse(_Envelope(xml_file), LET.XMLParser(huge_tree=True)).getroot()
+        for infNFe in _XP_INFNFE(raiz):
+            yield from _produtos_infnfe_lxml(infNFe)
+        return
+
+    # huge_tree: lotes grandes passam do limite padrão de profundidade/tamanho da libxml2
+    for _, infNFe in LET.iterparse(_Envelope(xml_file), events=("end",), tag=TAG_INFNFE, huge_tree=True):
+        yield from _produtos_infnfe_lxml(infNFe)
+
+        # Solta a nota e os irmãos anteriores de cada ancestral (notas anteriores do
+        # mesmo lote ou do envelope, comentários antes de cada raiz); o envelope não tem pai
+        infNFe.clear(keep_tail=True)
+        for ancestral in infNFe.iterancestors():
+            while ancestral.getparent() is not None and ancestral.getprevious() is not None:
+                del ancestral.getparent()[0]
+
+
+def iterar_produtos_nfe_rapido(xml_file, usar_lxml=None):
+    # usar_lxml=None escolhe lxml automaticamente quando estiver instalado
+    xml_file.seek(0)
+    if usar_lxml is None:
+        usar_lxml = LET is not None
+    if usar_lxml:
+        if LET is None:
+            raise ImportError("lxml não está instalado")
+        return _iterar_rapido_lxml(xml_file)
+    return _iterar_rapido_etree(xml_file)
 
-    return produtos
 
+def parse_nfe_rapido(xml_file, usar_lxml=None):
+    return list(iterar_produtos_nfe_rapido(xml_file, usar_lxml=usar_lxml))
@@ -0,0 +1,105 @@
+# arquivo: ocr.py
+# Motores de OCR. O padrão ("auto") usa o tesserocr, que chama a libtesseract
+# dentro do próprio processo e mantém o modelo do idioma carregado em cada
+# thread de OCR; sem ele instalado, cai para o pytesseract, que sobe um
+# processo tesseract (e recarrega o idioma) a cada imagem.
+#
+# Configuração por variáveis de ambiente:
+#   EXTRATOR_OCR_BACKEND  auto | tesserocr | pytesseract  (padrão: auto)
+#   TESSERACT_CMD         executável do tesseract para o pytesseract
+#                         (ex.: C:\Program Files\Tesseract-OCR\tesseract.exe)
+#   TESSDATA_PREFIX       pasta tessdata com os .traineddata (ex.: por)
+import os
+import threading
+
+BACKENDS = ("tesserocr", "pytesseract")
+
+
+class MotorTesserocr:
+    nome = "tesserocr"
+
+    def __init__(self, tessdata=None):
+        import tesserocr
+
+        self._tesserocr = tesserocr
+        self.tessdata = tessdata
+        self._local = threading.local()
+
+    def _api(self, lang):
+        # Uma API por thread e idioma: inicializar carrega o traineddata, então só acontece uma vez
+        apis = getattr(self._local, "apis", None)
+        if apis is None:
+            apis = self._local.apis = {}
+        api = apis.get(lang)
+        if api is None:
+            if self.tessdata:
+                api = self._tesserocr.PyTessBaseAPI(path=self.tessdata, lang=lang)
+            else:
+                api = self._tesserocr.PyTessBaseAPI(lang=lang)
+            apis[lang] = api
+        return api
+
+    def reconhecer(self, imagem, lang):
+        api = self._api(lang)
+        api.SetImage(imagem)
+        return api.GetUTF8Text()
+
+    def versao(self):
+        # "tesseract 5.3.0\n leptonica-1.82.0 ..." -> "5.3.0"
+        partes = self._tesserocr.tesseract_version().split()
+        return partes[1] if len(partes) > 1 else " ".join(partes)
+
+
+class MotorPytesseract:
+    nome = "pytesseract"
+
+    def __init__(self, comando=None, tessdata=None):
+        import pytesseract
+
+        self._pytesseract = pytesseract
+        if comando:
+            pytesseract.pytesseract.tesseract_cmd = comando
+        self._config = f'--tessdata-dir "{tessdata}"' if tessdata else ""
+
+    def reconhecer(self, imagem, lang):
+        return self._pytesseract.image_to_string(imagem, lang=lang, config=self._config)
+
+    def versao(self):
+        return str(self._pytesseract.get_tesseract_version())
+
+
+def criar_motor(backend=None):
+    backend = (backend or os.getenv("EXTRATOR_OCR_BACKEND", "auto")).lower()
+    tessdata = os.getenv("TESSDATA_PREFIX") or None
+
+    if backend in ("auto", "tesserocr"):
+        try:
+            return MotorTesserocr(tessdata=tessdata)
+        except ImportError:
+            if backend == "tesserocr":
+                raise ImportError("EXTRATOR_OCR_BACKEND=tesserocr, mas o pacote tesserocr não está instalado")
+    elif backend != "pytesseract":
+        raise ValueError(f"EXTRATOR_OCR_BACKEND inválido: {backend} (use auto, {' ou '.join(BACKENDS)})")
+
+    return MotorPytesseract(comando=os.getenv("TESSERACT_CMD") or None, tessdata=tessdata)
+
+
+_motor = None
+_lock = threading.Lock()
+
+
+def motor_ocr():
+    # Motor do processo, criado no primeiro uso
+    global _motor
+    with _lock:
+        if _motor is None:
+            _motor = criar_motor()
+        return _motor
+
+
+def usar_backend(backend):
+    # Troca o motor do processo (benchmarks, linha de comando)
+    global _motor
+    with _lock:
+        _motor = criar_motor(backend)
+        return _motor
@@ -0,0 +1,179 @@
+# arquivo: relatorios.py
+# Geração dos arquivos exportáveis (relatório PDF) e formatação de valores.
+# Fica fora do app.py para poder rodar em threads de exportação em segundo plano.
+from io import BytesIO
+import os
+import datetime
+from itertools import islice
+
+import pandas as pd
+
+# Função segura para formatar valores numéricos
+def formatar_valor(val):
+    try:
+        return f"{float(val):.2f}"
+    except:
+        return val
+
+# -------- Relatório PDF --------
+# O layout de uma Table do ReportLab cresce mais que linearmente com o número de
+# linhas (a tabela restante é refeita a cada quebra de página), então a listagem
+# sai em blocos pequenos, cada um diagramado sozinho.
+LINHAS_POR_TABELA = 40
+COLUNAS_PDF = ["Produto", "Quantidade", "Valor Unitário", "Valor Total", "Origem"]
+LARGURAS_PDF = [200, 60, 70, 70, 60]
+
+
+def preparar_linhas_pdf(registros):
+    # Registros do banco (COLUNAS_PRODUTOS) -> linhas do PDF; nulos viram quantidade 1 e valores 0
+    for _, _, produto, qtd, unit, total, origem, _ in registros:
+        yield (
+            str(produto).strip(),
+            1.0 if qtd is None else qtd,
+            0.0 if unit is None else unit,
+            0.0 if total is None else total,
+            origem,
+        )
+
+
+def _formatar_total(valor):
+    return f"{valor:,.2f}"
+
+
+def _formatar_mes(mes):
+    ano, _, m = mes.partition("-")
+    return f"{m}/{ano}" if m else mes
+
+
+def _tabelas_em_blocos(cabecalho, linhas, larguras, estilo, tamanho):
+    from reportlab.platypus import Table
+
+    linhas = iter(linhas)
+    while True:
+        bloco = list(islice(linhas, tamanho))
+        if not bloco:
+            return
+        tabela = Table([cabecalho] + bloco, colWidths=larguras, repeatRows=1)
+        tabela.setStyle(estilo)
+        yield tabela
+
+
+def gerar_pdf_relatorio(df, usuario=None, cnpj=None, mostrar_usuario=False, mostrar_cnpj=False,
+                        total=None, resumo_empresas=None, resumo_mensal=None,
+                        destino=None, linhas_por_tabela=LINHAS_POR_TABELA):
+    # df: DataFrame do histórico (não é copiado nem alterado) ou qualquer iterável
+    #     de linhas na ordem de COLUNAS_PDF (ex.: preparar_linhas_pdf(iterar_produtos(...)))
+    # total: soma já calculada (ex.: resumo_periodo); sem ela, soma durante a listagem
+    # resumo_empresas: [(Empresa, Total)] de total_por_empresa
+    # resumo_mensal: [(AAAA-MM, Itens, Total)] de total_por_mes
+    # destino: caminho do arquivo; sem ele devolve um BytesIO
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, TableStyle, Image
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib import colors
+    from xml.sax.saxutils import escape
+
+    buffer = destino or BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    elementos = []
+
+    styles = getSampleStyleSheet()
+    estilo_titulo = styles['Heading1']
+    estilo_subtitulo = styles['Heading3']
+    estilo_normal = styles['Normal']
+
+    estilo_tabela = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ])
+
+    # Logo
+    logo_path = os.path.join("logos", cnpj, "logo.png") if cnpj else None
+    if logo_path and os.path.exists(logo_path):
+        elementos.append(Image(logo_path, width=120, height=50))
+        elementos.append(Spacer(1, 12))
+
+    # Título e cabeçalho
+    elementos.append(Paragraph("Relatório de Produtos Extraídos", estilo_titulo))
+    elementos.append(Spacer(1, 12))
+    elementos.append(Paragraph(f"Data do relatório: {datetime.date.today().strftime('%d/%m/%Y')}", estilo_subtitulo))
+
+    if mostrar_usuario and usuario:
+        elementos.append(Paragraph(f"Usuário: {escape(str(usuario))}", estilo_normal))
+    if mostrar_cnpj and cnpj:
+        elementos.append(Paragraph(f"CNPJ: {cnpj}", estilo_normal))
+
+    elementos.append(Spacer(1, 12))
+
+    # O total entra aqui, mas pode ser calculado só depois da listagem
+    posicao_total = len(elementos)
+    elementos.append(Spacer(1, 12))
+
+    # Resumos a partir das agregações (não dependem do tamanho da listagem)
+    if resumo_empresas:
+        elementos.append(Paragraph("Resumo por fornecedor", estilo_subtitulo))
+        linhas = [
+            [Paragraph(escape(str(empresa)), estilo_normal), _formatar_total(soma or 0)]
+            for empresa, soma in sorted(resumo_empresas, key=lambda r: r[1] or 0, reverse=True)
+        ]
+        elementos.extend(_tabelas_em_blocos(["Fornecedor", "Total (R$)"], linhas, [360, 120], estilo_tabela, linhas_por_tabela))
+        elementos.append(Spacer(1, 12))
+
+    if resumo_mensal:
+        elementos.append(Paragraph("Resumo por mês", estilo_subtitulo))
+        linhas = [
+            [_formatar_mes(mes), str(itens), _formatar_total(soma or 0)]
+            for mes, itens, soma in resumo_mensal
+        ]
+        elementos.extend(_tabelas_em_blocos(["Mês", "Itens", "Total (R$)"], linhas, [120, 120, 120], estilo_tabela, linhas_por_tabela))
+        elementos.append(Spacer(1, 12))
+
+    # Listagem: DataFrame é lido coluna a coluna, sem copiar
+    if isinstance(df, pd.DataFrame):
+        if total is None:
+            total = pd.to_numeric(df["Valor Total"], errors="coerce").sum()
+        linhas_origem = zip(*(df[col] for col in COLUNAS_PDF))
+    else:
+        linhas_origem = df
+
+    # Nomes que cabem na coluna vão como texto simples; Paragraph só para os que quebram linha
+    estilo_produto = ParagraphStyle(name="Produto", fontSize=10, leading=12)
+    largura_produto = LARGURAS_PDF[0] - 12
+    soma = 0.0
+
+    def celulas():
+        nonlocal soma
+        for produto, qtd, unit, valor_total, origem in linhas_origem:
+            try:
+                valor = float(valor_total)
+                if valor == valor:  # NaN fica fora, como no sum do pandas
+                    soma += valor
+            except (TypeError, ValueError):
+                pass
+            produto = str(produto)
+            if stringWidth(produto, estilo_produto.fontName, estilo_produto.fontSize) > largura_produto:
+                produto = Paragraph(escape(produto), estilo_produto)
+            yield [produto, str(qtd), formatar_valor(unit), formatar_valor(valor_total), str(origem)]
+
+    elementos.append(Paragraph("Produtos", estilo_subtitulo))
+    elementos.extend(_tabelas_em_blocos(COLUNAS_PDF, celulas(), LARGURAS_PDF, estilo_tabela, linhas_por_tabela))
+
+    # Total filtrado
+    if total is None:
+        total = soma
+    try:
+        elementos.insert(posicao_total, Paragraph(f"💰 Total filtrado: R$ {total:,.2f}", estilo_subtitulo))
+    except (TypeError, ValueError):
+        pass
+
+    doc.build(elementos)
+    if destino:
+        return destino
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,41 @@
+# tests/conftest.py
+# Cada teste roda num diretório temporário próprio (banco e documentos_armazenados
+# são caminhos relativos) com um banco novo.
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+
+@pytest.fixture
+def banco_sem_tabelas(tmp_path, monkeypatch):
+    # Só aponta o db para o arquivo: o teste decide o que existe antes do criar_tabela
+    monkeypatch.chdir(tmp_path)
+    db.configurar_banco(str(tmp_path / "banco.db"))
+    yield tmp_path / "banco.db"
+    db.fechar_conexao()
+
+
+@pytest.fixture
+def banco(banco_sem_tabelas):
+    db.criar_tabela()
+    return banco_sem_tabelas
+
+
+def produto(**campos):
+    linha = {
+        "Empresa": "FORNECEDOR",
+        "CNPJ": "123",
+        "Produto": "ARROZ",
+        "Quantidade": 1,
+        "Valor Unitário": 10.0,
+        "Valor Total": 10.0,
+        "Origem": "XML",
+        "Data": "2024-05-10T10:15:00-03:00",
+    }
+    linha.update(campos)
+    return linha
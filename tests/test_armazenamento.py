@@ -0,0 +1,63 @@
+# tests/test_armazenamento.py
+import os
+from io import BytesIO
+
+import armazenamento
+import db
+
+
+def _guardar(conteudo, nome, data="2024-05-10"):
+    return armazenamento.salvar_arquivo_em_nuvem(BytesIO(conteudo), nome, "123", data)
+
+
+def _indice():
+    return db.conectar().execute("SELECT Nome, Hash FROM arquivos WHERE CNPJ = '123' ORDER BY Nome").fetchall()
+
+
+def test_mesmo_conteudo_fica_num_objeto_so(banco):
+    a = _guardar(b"nota fiscal", "a.pdf")
+    b = _guardar(b"nota fiscal", "b.pdf")
+    assert a != b and os.path.samefile(a, b)
+    assert os.path.dirname(a) == os.path.join(armazenamento.PASTA_DOCUMENTOS, "123", "2024", "05")
+
+    (_, hash_a), (_, hash_b) = _indice()
+    assert hash_a == hash_b
+    objeto = armazenamento.caminho_objeto(hash_a)
+    assert os.stat(objeto).st_nlink == 3  # o objeto + os dois nomes da visão
+
+    # Mesmo nome: com o mesmo conteúdo é o mesmo arquivo; com outro vira "a (2).pdf"
+    assert _guardar(b"nota fiscal", "a.pdf") == a
+    assert os.path.basename(_guardar(b"outra nota", "a.pdf")) == "a (2).pdf"
+    assert [nome for nome, _ in _indice()] == ["a (2).pdf", "a.pdf", "b.pdf"]
+    assert not os.listdir(armazenamento.PASTA_RECEBENDO)
+
+
+def test_objeto_so_sai_com_o_ultimo_nome(banco):
+    a = _guardar(b"nota fiscal", "a.pdf")
+    b = _guardar(b"nota fiscal", "b.pdf")
+    objeto = armazenamento.caminho_objeto(_indice()[0][1])
+
+    assert armazenamento.excluir_arquivo("123", a) == 1
+    assert os.path.exists(objeto) and os.path.exists(b)
+
+    assert armazenamento.excluir_arquivo("123", b) == 1
+    assert not os.path.exists(objeto)
+    assert _indice() == []
+    # Pastas de mês/ano que ficaram vazias também saem
+    assert not os.path.exists(os.path.dirname(b))
+
+
+def test_reconciliar_indice_com_o_disco(banco):
+    a = _guardar(b"nota fiscal", "a.pdf")
+    b = _guardar(b"outra nota", "b.pdf")
+    objeto_b = armazenamento.caminho_objeto(dict(_indice())["b.pdf"])
+
+    # Mexidos por fora do app: um arquivo novo na árvore e um que sumiu
+    os.remove(b)
+    with open(os.path.join(os.path.dirname(a), "manual.xml"), "wb") as f:
+        f.write(b"<nfe/>")
+
+    assert armazenamento.reconciliar_indice("123") == (1, 1)
+    assert [nome for nome, _ in _indice()] == ["a.pdf", "manual.xml"]
+    assert not os.path.exists(objeto_b)  # sem nenhum nome na árvore, o objeto é coletado
+    assert armazenamento.reconciliar_indice("123") == (0, 0)
@@ -0,0 +1,102 @@
+# tests/test_db.py
+import sqlite3
+
+import pytest
+
+import db
+from conftest import produto
+
+
+def _linhas(cnpj="123"):
+    return db.conectar().execute("SELECT Produto, Data FROM produtos WHERE CNPJ = ? ORDER BY rowid", (cnpj,)).fetchall()
+
+
+def test_reenvio_da_mesma_linha_datada_e_ignorado(banco):
+    assert db.inserir_produtos_lote([produto()]) == (1, 0)
+    assert db.inserir_produtos_lote([produto()]) == (0, 1)
+    assert len(_linhas()) == 1
+
+
+def test_linha_sem_data_repetida_e_ignorada(banco):
+    # Data vazia ou ilegível vira NULL; a repetida não pode entrar de novo
+    sem_data = [produto(Data=""), produto(Data="sem data"), produto(Data=None)]
+    assert db.inserir_produtos_lote(sem_data) == (1, 2)
+    assert db.inserir_produtos_lote([produto(Data="")]) == (0, 1)
+    assert _linhas() == [("ARROZ", None)]
+
+    # Outro produto ou outra empresa sem data continuam entrando
+    assert db.inserir_produtos_lote([produto(Data="", Produto="FEIJAO"), produto(Data="", Empresa="OUTRA")]) == (2, 0)
+
+
+def test_documento_sem_produtos_pode_ser_reenviado(banco):
+    # Só o que entrou de fato barra o reenvio do mesmo conteúdo
+    for hash_arquivo, status in (("h1", "erro"), ("h2", "parcial"), ("h3", "sem_produtos"), ("h4", "processado")):
+        db.registrar_documento("123", hash_arquivo, f"{hash_arquivo}.pdf", "PDF", status)
+    assert [h for h in ("h1", "h2", "h3", "h4") if db.buscar_documento_por_hash("123", h)] == ["h4"]
+
+
+def test_migracao_do_banco_original(banco_sem_tabelas):
+    # Esquema da primeira versão: valores em TEXT e Data como veio do documento
+    with sqlite3.connect(banco_sem_tabelas) as antigo:
+        antigo.execute("""
+            CREATE TABLE produtos (
+                Empresa TEXT, CNPJ TEXT, Produto TEXT, Quantidade REAL,
+                Valor_Unitário TEXT, Valor_Total TEXT, Origem TEXT, Data TEXT,
+                PRIMARY KEY (Empresa, Produto, Data, CNPJ)
+            )
+        """)
+        antigo.executemany("INSERT INTO produtos VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+            ("FORN A", "123", "ARROZ", 2, "12.5", "25.0", "XML", "2024-05-10T10:15:00-03:00"),
+            ("FORN A", "123", "FEIJAO", 1, "7,90", "R$ 7,90", "PDF", "15/03/2024"),
+            ("FORN B", "123", "OLEO", 1, "9.0", "9.0", "PDF", ""),
+            ("FORN B", "123", "OLEO", 1, "9.0", "9.0", "PDF", "sem data"),
+        ])
+    antigo.close()
+
+    db.criar_tabela()
+    conn = db.conectar()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == db.VERSAO_ESQUEMA
+    assert conn.execute("""
+        SELECT Produto, typeof(Valor_Total), Valor_Total, Data FROM produtos ORDER BY Produto
+    """).fetchall() == [
+        ("ARROZ", "real", 25.0, "2024-05-10 10:15:00"),
+        ("FEIJAO", "real", 7.9, "2024-03-15 00:00:00"),
+        ("OLEO", "real", 9.0, None),  # as duas sem data viram uma só
+    ]
+
+    # Resumos preenchidos com o histórico migrado
+    resumo = db.resumo_periodo("123")
+    assert resumo["linhas"] == 3 and resumo["total"] == pytest.approx(41.9)
+    assert [mes for mes, *_ in db.serie_mensal("123")] == ["2024-03", "2024-05"]
+
+    # E a chave continua barrando o reenvio das mesmas linhas
+    assert db.inserir_produtos_lote([produto(Empresa="FORN A", Data="2024-05-10T10:15:00-03:00")]) == (0, 1)
+
+
+@pytest.mark.parametrize("decrescente", [False, True])
+@pytest.mark.parametrize("ordenar_por", ["Empresa", "Valor Total", "Data"])
+def test_paginacao_keyset_com_empates(banco, ordenar_por, decrescente):
+    # Muitas linhas com o mesmo valor na coluna ordenada: o rowid desempata e
+    # nenhuma linha pode se repetir ou sumir entre as páginas
+    linhas = [
+        produto(Produto=f"P{i}", Empresa="FORN" if i % 3 else "OUTRA",
+                Data="" if i == 4 else f"2024-05-{10 + i % 2}T10:00:00-03:00",
+                **{"Valor Total": 10.0 if i % 2 else 20.0})
+        for i in range(11)
+    ]
+    assert db.inserir_produtos_lote(linhas) == (11, 0)
+
+    paginas = []
+    apos = None
+    while True:
+        pagina, apos = db.buscar_pagina("123", ordenar_por=ordenar_por, decrescente=decrescente, apos=apos, limite=3)
+        paginas.append(pagina)
+        if apos is None:
+            break
+
+    vistas = [linha for pagina in paginas for linha in pagina]
+    assert len(paginas) == 4
+    assert sorted(vistas) == sorted(db.buscar_todos("123"))
+    chave = {"Empresa": 0, "Valor Total": 5, "Data": 7}[ordenar_por]
+    valores = [linha[chave] or "" for linha in vistas]
+    assert valores == sorted(valores, reverse=decrescente)